@@ -3,20 +3,26 @@ import json
 import re
 import logging
 import os
+import time
+from blef_core.rules import get_player_by_nickname
+from blef_core.censoring import get_decision_request
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
 lambda_client = boto3.client('lambda')
 
-
-def get_player_by_nickname(players, nickname):
-    filtered_players = [p for p in players if p["nickname"] == nickname]
-    if filtered_players:
-        return filtered_players[0]
+# Whether agent functions exist is remembered for the lifetime of the container - found
+# functions for AIAGENT_CACHE_TTL seconds, missing ones for AIAGENT_MISSING_CACHE_TTL seconds
+AIAGENT_CACHE_TTL = float(os.environ.get("aiagent_cache_ttl", "300"))
+AIAGENT_MISSING_CACHE_TTL = float(os.environ.get("aiagent_missing_cache_ttl", "60"))
+function_cache = {}
+cache_stats = {"hits": 0, "misses": 0}
 
 
 def get_aiagent_name(game):
+    if "ai_agent" in game:
+        return game["ai_agent"]
     current_player = game["cp_nickname"]
     player_obj = get_player_by_nickname(game["players"], current_player)
     return player_obj.get("ai_agent")
@@ -27,7 +33,7 @@ def name_valid(name):
     return name and isinstance(name, str) and pattern.match(name)
 
 
-def lambda_function_exists(name):
+def get_function_exists(name):
     try:
         response = lambda_client.get_function(FunctionName=name)
     except lambda_client.exceptions.ResourceNotFoundException:
@@ -35,6 +41,41 @@ def lambda_function_exists(name):
     return response.get("ResponseMetadata").get("HTTPStatusCode") == 200
 
 
+def cache_function_exists(name, exists):
+    ttl = AIAGENT_CACHE_TTL if exists else AIAGENT_MISSING_CACHE_TTL
+    function_cache[name] = (exists, time.monotonic() + ttl)
+
+
+def lambda_function_exists(name):
+    exists, expiry = function_cache.get(name, (None, 0))
+    if expiry > time.monotonic():
+        cache_stats["hits"] += 1
+        return exists
+    cache_stats["misses"] += 1
+    exists = get_function_exists(name)
+    cache_function_exists(name, exists)
+    return exists
+
+
+def log_cache_metrics(hits, misses):
+    """
+        Report the function cache's hits and misses of an invocation as CloudWatch metrics,
+        in the embedded metric format - printed, as the log handler would prefix the JSON
+    """
+    print(json.dumps({
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": "blef/aiagent-orchestrator",
+                "Dimensions": [[]],
+                "Metrics": [{"Name": "AgentCacheHits", "Unit": "Count"}, {"Name": "AgentCacheMisses", "Unit": "Count"}]
+            }]
+        },
+        "AgentCacheHits": hits,
+        "AgentCacheMisses": misses
+    }))
+
+
 def call_aiagent(payload):
     """
         Invoke blef-aiagent-[...] asynchronously
@@ -44,11 +85,16 @@ def call_aiagent(payload):
     logger.info(agent_name)
     function_name = f'blef-aiagent-{agent_name}'
     if name_valid(agent_name) and lambda_function_exists(function_name):
-        return lambda_client.invoke(
-            FunctionName=function_name,
-            InvocationType='Event',
-            Payload=json.dumps(payload)
-            )
+        try:
+            return lambda_client.invoke(
+                FunctionName=function_name,
+                InvocationType='Event',
+                Payload=json.dumps(payload)
+                )
+        except lambda_client.exceptions.ResourceNotFoundException:
+            # The function was deleted since it was cached
+            logger.warning(f"{function_name} no longer exists")
+            cache_function_exists(function_name, False)
 
 
 def get_game(record):
@@ -56,15 +102,20 @@ def get_game(record):
         return
     if not isinstance(record.get("body"), dict):
         try:
-            return json.loads(record.get("body"))
+            game = json.loads(record.get("body"))
         except ValueError as e:
             return
+        # Messages queued before decision requests hold the whole game - only pass on what the agent may see
+        if isinstance(game, dict) and "hands" in game:
+            return get_decision_request(game)
+        return game
 
 
 def lambda_handler(event, context):
     logger.info('## EVENT')
     logger.info(event)
 
+    hits, misses = cache_stats["hits"], cache_stats["misses"]
     for record in event['Records']:
         game = get_game(record)
         logger.info("## GAME")
@@ -72,6 +123,7 @@ def lambda_handler(event, context):
         if not game:
             continue
         call_aiagent(game)
+    log_cache_metrics(cache_stats["hits"] - hits, cache_stats["misses"] - misses)
     message = "Messages processed"
     return {
         'statusCode': 200,
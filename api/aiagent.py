@@ -2,6 +2,8 @@ import boto3
 import json
 import agent
 import logging
+from blef_core.serialization import parse_event
+from blef_core.censoring import get_decision_game
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
@@ -9,37 +11,6 @@ logger.setLevel(logging.INFO)
 lambda_client = boto3.client('lambda')
 
 
-def parse_event(event):
-    # Basic input validation
-    if not isinstance(event, dict):
-        return False
-
-    # Handle both direct triggers and API Gateway
-    body = event.get("body", event)
-    if isinstance(body, str):
-        try:
-            body = json.loads(body)
-        except ValueError:
-            return None
-    path_params = event.get("pathParameters", {})
-    query_params = event.get("queryStringParameters", {})
-    body.update(path_params)
-    body.update(query_params)
-    return body
-
-
-def get_player_by_nickname(players, nickname):
-    filtered_players = [p for p in players if p["nickname"] == nickname]
-    if filtered_players:
-        return filtered_players[0]
-
-
-def get_aiagent_player_uuid(game):
-    current_player = game["cp_nickname"]
-    player_obj = get_player_by_nickname(game["players"], current_player)
-    return player_obj.get("uuid")
-
-
 def is_legal(action, history):
     if action not in range(89):
         return False
@@ -69,12 +40,13 @@ def call_play(action, aiagent_player_uuid, game_uuid):
 def lambda_handler(event, context):
     logger.info('## EVENT')
     logger.info(event)
-    game = parse_event(event)
-    logger.info('## GAME')
-    logger.info(game)
-    assert game
+    request = parse_event(event)
+    logger.info('## DECISION REQUEST')
+    logger.info(request)
+    assert request
+    game = get_decision_game(request)
 
-    aiagent_player_uuid = get_aiagent_player_uuid(game)
+    aiagent_player_uuid = request["player_uuid"]
     assert aiagent_player_uuid
 
     action = agent.determine_action(game)
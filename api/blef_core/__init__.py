@@ -0,0 +1,10 @@
+"""
+    Code shared by the Blef Lambda handlers, deployed as a Lambda layer
+
+        rules         - sets, turn order and dealing
+        censoring     - what each viewer of a game may see
+        serialization - request parsing and response payloads
+        storage       - game storage backends
+
+    Submodules are imported explicitly, so a handler only pays for what it uses.
+"""
@@ -0,0 +1,76 @@
+"""
+    What each viewer of a game is allowed to see
+
+    Player UUIDs are never shown. Hands are shown to everybody once their round
+    is over or the game has finished, and otherwise only to their own player.
+"""
+
+
+def get_active_nicknames(players):
+    return {player["nickname"] for player in players if player["n_cards"] != 0}
+
+
+def get_revealed_hands(game, current_round, current_status, player_authenticated, player_nickname):
+    """ Hands of `game` (a live game or a round snapshot) visible to a viewer while the game is at current_round """
+    active_nicknames = get_active_nicknames(game["players"])
+    if game["round_number"] < current_round or current_status == "Finished":
+        return [hand for hand in game["hands"] if hand["nickname"] in active_nicknames]
+    if player_authenticated and game["round_number"] == current_round and player_nickname in active_nicknames:
+        return [hand for hand in game["hands"] if hand["nickname"] == player_nickname]
+    return []
+
+
+def get_private_players(players):
+    return [{key: player[key] for key in player if key != "uuid"} for player in players]
+
+
+def censor_game(game, current_round, player_authenticated, player_nickname, current_status=None):
+    """ The view of a game sent to one viewer - current_status defaults to the status of `game` itself """
+    if current_status is None:
+        current_status = game["status"]
+    revealed_hands = get_revealed_hands(game, current_round, current_status, player_authenticated, player_nickname)
+
+    return {
+        "admin_nickname": game["admin_nickname"],
+        "public": game["public"],
+        "room": game["room"],
+        "status": game["status"],
+        "round_number": game["round_number"],
+        "max_cards": game["max_cards"],
+        "players": get_private_players(game["players"]),
+        "hands": revealed_hands,
+        "cp_nickname": game["cp_nickname"],
+        "history": game["history"],
+        "last_modified": game["last_modified"]
+    }
+
+
+def get_decision_request(game):
+    """
+        What the AI agent whose turn it is gets to choose its move from: its own hand,
+        how many cards each player holds and the history of the round, packed into
+        lists - [value, colour] cards, [nickname, n_cards] players and [player, action_id] moves
+    """
+    player = next(player for player in game["players"] if player["nickname"] == game["cp_nickname"])
+    hand = next((hand["hand"] for hand in game["hands"] if hand["nickname"] == player["nickname"]), [])
+    return {
+        "game_uuid": game["game_uuid"],
+        "history_length": len(game["history"]),
+        "player_uuid": player["uuid"],
+        "nickname": player["nickname"],
+        "ai_agent": player.get("ai_agent"),
+        "hand": [[int(card["value"]), int(card["colour"])] for card in hand],
+        "n_cards": [[player["nickname"], int(player["n_cards"])] for player in game["players"]],
+        "history": [[move["player"], int(move["action_id"])] for move in game["history"]]
+    }
+
+
+def get_decision_game(request):
+    """ The game as the AI agent's player sees it, rebuilt from a decision request """
+    return {
+        "game_uuid": request["game_uuid"],
+        "cp_nickname": request["nickname"],
+        "players": [{"nickname": nickname, "n_cards": n_cards} for nickname, n_cards in request["n_cards"]],
+        "hands": [{"nickname": request["nickname"], "hand": [{"value": value, "colour": colour} for value, colour in request["hand"]]}],
+        "history": [{"player": player, "action_id": action_id} for player, action_id in request["history"]]
+    }
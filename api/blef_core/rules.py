@@ -0,0 +1,379 @@
+"""
+    Blef rules engine
+
+    The 88 sets are compiled once, at import time, into a table of integer
+    requirements. A pool of cards is encoded once into a packed count word
+    (one 4-bit field per value and per colour) and a 24-bit card mask, after
+    which testing any set is a couple of integer operations.
+
+    Also holds the turn order and dealing rules shared by the handlers.
+"""
+from random import sample
+from itertools import islice, product
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is only needed for batch evaluation - the Lambda functions run without it
+    np = None
+
+N_VALUES = 6
+N_COLOURS = 4
+DECK_SIZE = N_VALUES * N_COLOURS
+CHECK_ACTION_ID = 88
+
+# Counts are clamped to 3 bits so that adding a threshold offset to a field
+# never carries into its neighbour - the 4th bit of every field is the guard
+MAX_FIELD_COUNT = 7
+FIELD_GUARD = 8
+
+INDEXATION_CSV = """action_id,set_type,detail_1,detail_2
+0,High card,0,
+1,High card,1,
+2,High card,2,
+3,High card,3,
+4,High card,4,
+5,High card,5,
+6,Pair,0,
+7,Pair,1,
+8,Pair,2,
+9,Pair,3,
+10,Pair,4,
+11,Pair,5,
+12,Two pairs,1,0
+13,Two pairs,2,0
+14,Two pairs,2,1
+15,Two pairs,3,0
+16,Two pairs,3,1
+17,Two pairs,3,2
+18,Two pairs,4,0
+19,Two pairs,4,1
+20,Two pairs,4,2
+21,Two pairs,4,3
+22,Two pairs,5,0
+23,Two pairs,5,1
+24,Two pairs,5,2
+25,Two pairs,5,3
+26,Two pairs,5,4
+27,Small straight,,
+28,Big straight,,
+29,Great straight,,
+30,Three of a kind,0,
+31,Three of a kind,1,
+32,Three of a kind,2,
+33,Three of a kind,3,
+34,Three of a kind,4,
+35,Three of a kind,5,
+36,Full house,0,1
+37,Full house,0,2
+38,Full house,0,3
+39,Full house,0,4
+40,Full house,0,5
+41,Full house,1,0
+42,Full house,1,2
+43,Full house,1,3
+44,Full house,1,4
+45,Full house,1,5
+46,Full house,2,0
+47,Full house,2,1
+48,Full house,2,3
+49,Full house,2,4
+50,Full house,2,5
+51,Full house,3,0
+52,Full house,3,1
+53,Full house,3,2
+54,Full house,3,4
+55,Full house,3,5
+56,Full house,4,0
+57,Full house,4,1
+58,Full house,4,2
+59,Full house,4,3
+60,Full house,4,5
+61,Full house,5,0
+62,Full house,5,1
+63,Full house,5,2
+64,Full house,5,3
+65,Full house,5,4
+66,Colour,0,
+67,Colour,1,
+68,Colour,2,
+69,Colour,3,
+70,Four of a kind,0,
+71,Four of a kind,1,
+72,Four of a kind,2,
+73,Four of a kind,3,
+74,Four of a kind,4,
+75,Four of a kind,5,
+76,Small flush,0,
+77,Small flush,1,
+78,Small flush,2,
+79,Small flush,3,
+80,Big flush,0,
+81,Big flush,1,
+82,Big flush,2,
+83,Big flush,3,
+84,Great flush,0,
+85,Great flush,1,
+86,Great flush,2,
+87,Great flush,3,"""
+
+
+def load_indexation():
+    header = None
+    indexation = []
+    for line in INDEXATION_CSV.split("\n"):
+        if not header:
+            header = line
+            continue
+        action_id, set_type, detail_1, detail_2 = line.split(",")
+        indexation.append({"action_id": action_id,
+                           "set_type": set_type,
+                           "detail_1": detail_1,
+                           "detail_2": detail_2
+                           })
+    return indexation
+
+
+def value_shift(value):
+    return 4 * value
+
+
+def colour_shift(colour):
+    return 4 * (N_VALUES + colour)
+
+
+def card_index(value, colour):
+    """ Position of a card in the deck - same order as product(range(6), range(4)) """
+    return value * N_COLOURS + colour
+
+
+def compile_requirements(value_counts=None, colour_counts=None, cards=()):
+    """
+        Turn minimum value/colour counts and required cards into
+        (count_offset, count_guard, card_mask)
+    """
+    count_offset = 0
+    count_guard = 0
+    for value, count in (value_counts or {}).items():
+        count_offset += (FIELD_GUARD - count) << value_shift(value)
+        count_guard |= FIELD_GUARD << value_shift(value)
+    for colour, count in (colour_counts or {}).items():
+        count_offset += (FIELD_GUARD - count) << colour_shift(colour)
+        count_guard |= FIELD_GUARD << colour_shift(colour)
+    card_mask = 0
+    for value, colour in cards:
+        card_mask |= 1 << card_index(value, colour)
+    return count_offset, count_guard, card_mask
+
+
+def compile_set(set_row):
+    set_type = set_row["set_type"]
+    detail_1 = int(set_row["detail_1"]) if set_row["detail_1"] else None
+    detail_2 = int(set_row["detail_2"]) if set_row["detail_2"] else None
+
+    if set_type == "High card":
+        return compile_requirements(value_counts={detail_1: 1})
+    elif set_type == "Pair":
+        return compile_requirements(value_counts={detail_1: 2})
+    elif set_type == "Two pairs":
+        return compile_requirements(value_counts={detail_1: 2, detail_2: 2})
+    elif set_type == "Small straight":
+        return compile_requirements(value_counts={value: 1 for value in range(0, 5)})
+    elif set_type == "Big straight":
+        return compile_requirements(value_counts={value: 1 for value in range(1, 6)})
+    elif set_type == "Great straight":
+        return compile_requirements(value_counts={value: 1 for value in range(0, 6)})
+    elif set_type == "Three of a kind":
+        return compile_requirements(value_counts={detail_1: 3})
+    elif set_type == "Full house":
+        return compile_requirements(value_counts={detail_1: 3, detail_2: 2})
+    elif set_type == "Colour":
+        return compile_requirements(colour_counts={detail_1: 5})
+    elif set_type == "Four of a kind":
+        return compile_requirements(value_counts={detail_1: 4})
+    elif set_type == "Small flush":
+        return compile_requirements(cards=[(value, detail_1) for value in range(0, 5)])
+    elif set_type == "Big flush":
+        return compile_requirements(cards=[(value, detail_1) for value in range(1, 6)])
+    elif set_type == "Great flush":
+        return compile_requirements(cards=[(value, detail_1) for value in range(0, 6)])
+    raise ValueError(f"Unknown set type: {set_type}")
+
+
+COMPILED_SETS = tuple(compile_set(set_row) for set_row in load_indexation())
+
+
+# Count word increment contributed by each card of the deck
+CARD_COUNTS = tuple(
+    (1 << value_shift(value)) + (1 << colour_shift(colour))
+    for value in range(N_VALUES) for colour in range(N_COLOURS)
+)
+
+
+def encode_cards(cards):
+    """
+        Encode a pool of cards (dicts with "value" and "colour")
+        into a packed count word and a 24-bit card mask
+    """
+    counts = 0
+    card_mask = 0
+    n_cards = 0
+    for card in cards:
+        index = card_index(int(card["value"]), int(card["colour"]))
+        counts += CARD_COUNTS[index]
+        card_mask |= 1 << index
+        n_cards += 1
+    if bin(card_mask).count("1") != n_cards:
+        # Repeated cards can't come from one deck, but keep them exact anyway
+        return encode_cards_with_repeats(cards)
+    return counts, card_mask
+
+
+def encode_cards_with_repeats(cards):
+    value_counts = [0] * N_VALUES
+    colour_counts = [0] * N_COLOURS
+    card_mask = 0
+    for card in cards:
+        value = int(card["value"])
+        colour = int(card["colour"])
+        value_counts[value] += 1
+        colour_counts[colour] += 1
+        card_mask |= 1 << card_index(value, colour)
+
+    counts = 0
+    for value, count in enumerate(value_counts):
+        counts |= min(count, MAX_FIELD_COUNT) << value_shift(value)
+    for colour, count in enumerate(colour_counts):
+        counts |= min(count, MAX_FIELD_COUNT) << colour_shift(colour)
+    return counts, card_mask
+
+
+def pool_contains(counts, card_mask, compiled_set):
+    count_offset, count_guard, required_cards = compiled_set
+    return (counts + count_offset) & count_guard == count_guard and card_mask & required_cards == required_cards
+
+
+def set_exists(cards, action_id):
+    counts, card_mask = encode_cards(cards)
+    return pool_contains(counts, card_mask, COMPILED_SETS[int(action_id)])
+
+
+def set_in_outcomes(outcomes, action_id):
+    return bool(outcomes >> int(action_id) & 1)
+
+
+def outcomes_to_action_ids(outcomes):
+    return [action_id for action_id in range(CHECK_ACTION_ID) if outcomes >> action_id & 1]
+
+
+def evaluate_all_sets(cards):
+    """
+        Determine which of the 88 sets exist in a pool of cards.
+
+        Given a list of cards, returns an 88-bit integer with bit `action_id` set
+        if that set exists. Given a 2-D NumPy array of N card pools, one row per pool
+        and one 0/1 column per deck card (see cards_to_presence), returns an (N, 88)
+        boolean array.
+    """
+    if np is not None and isinstance(cards, np.ndarray):
+        return evaluate_presence_batch(cards)
+
+    counts, card_mask = encode_cards(cards)
+    outcomes = 0
+    for action_id, compiled_set in enumerate(COMPILED_SETS):
+        if pool_contains(counts, card_mask, compiled_set):
+            outcomes |= 1 << action_id
+    return outcomes
+
+
+def cards_to_presence(pools):
+    """ Turn a list of card pools into an (N, 24) uint8 card presence array """
+    presence = np.zeros((len(pools), DECK_SIZE), dtype=np.uint8)
+    for row, cards in enumerate(pools):
+        for card in cards:
+            presence[row, card_index(int(card["value"]), int(card["colour"]))] = 1
+    return presence
+
+
+BATCH_CHUNK_SIZE = 1 << 16
+
+
+def compiled_set_arrays():
+    """ COMPILED_SETS as three int64 arrays: count offsets, count guards and card masks """
+    return tuple(np.array(column, dtype=np.int64) for column in zip(*COMPILED_SETS))
+
+
+def evaluate_presence_batch(presence):
+    if presence.ndim != 2 or presence.shape[1] != DECK_SIZE:
+        raise ValueError(f"Expected an (N, {DECK_SIZE}) card presence array, got {presence.shape}")
+
+    count_offsets, count_guards, card_masks = compiled_set_arrays()
+    card_counts = np.array(CARD_COUNTS, dtype=np.int64)
+    card_bits = np.left_shift(np.int64(1), np.arange(DECK_SIZE, dtype=np.int64))
+
+    outcomes = np.empty((presence.shape[0], CHECK_ACTION_ID), dtype=bool)
+    # Work in chunks so the (chunk, 88) int64 temporaries stay small
+    for start in range(0, presence.shape[0], BATCH_CHUNK_SIZE):
+        chunk = presence[start:start + BATCH_CHUNK_SIZE].astype(np.int64, copy=False)
+        counts = (chunk @ card_counts)[:, None]
+        pool_masks = (chunk @ card_bits)[:, None]
+        outcomes[start:start + BATCH_CHUNK_SIZE] = (
+            ((counts + count_offsets) & count_guards) == count_guards
+        ) & ((pool_masks & card_masks) == card_masks)
+    return outcomes
+
+
+def masks_to_presence(card_masks):
+    """ Turn an array of 24-bit card masks into an (N, 24) uint8 card presence array """
+    card_masks = np.asarray(card_masks, dtype=np.uint32)
+    return ((card_masks[:, None] >> np.arange(DECK_SIZE, dtype=np.uint32)) & 1).astype(np.uint8)
+
+
+def evaluate_masks_batch(card_masks, action_ids):
+    """
+        Check one set per pool: returns a boolean array with element i telling
+        whether set action_ids[i] exists in the pool given by card_masks[i]
+    """
+    count_offsets, count_guards, required_cards = (column[action_ids] for column in compiled_set_arrays())
+    counts = masks_to_presence(card_masks).astype(np.int64) @ np.array(CARD_COUNTS, dtype=np.int64)
+    card_masks = np.asarray(card_masks, dtype=np.int64)
+    return (((counts + count_offsets) & count_guards) == count_guards) & ((card_masks & required_cards) == required_cards)
+
+
+def get_player_by_nickname(players, nickname):
+    filtered_players = [p for p in players if p["nickname"] == nickname]
+    if filtered_players:
+        return filtered_players[0]
+
+
+def get_nickname_by_uuid(players, player_uuid):
+    filtered_players = [p for p in players if p["uuid"] == player_uuid]
+    if filtered_players:
+        return filtered_players[0]["nickname"]
+
+
+def is_active_player(players, nickname):
+    player = get_player_by_nickname(players, nickname)
+    if player:
+        return player["n_cards"] != 0
+    return False
+
+
+def find_next_active_player(players, cp_nickname):
+    active_players = [player for player in players if player["n_cards"] != 0 or player["nickname"] == cp_nickname]
+    current_player_order = [i for i, player in enumerate(active_players) if player["nickname"] == cp_nickname][0]
+    next_active_player = (active_players * 2)[current_player_order + 1]
+    return next_active_player
+
+
+def draw_cards(players):
+    """ Deal each player n_cards cards from a shuffled deck """
+    possible_cards = product(range(N_VALUES), range(N_COLOURS))
+    all_cards_raw = sample(list(possible_cards), sum(int(p["n_cards"]) for p in players))
+    all_cards = [{"value": tup[0], "colour": tup[1]} for tup in all_cards_raw]
+    card_iterator = iter(all_cards)
+    hands = []
+    for player in players:
+        player_hand = list(islice(card_iterator, 0, int(player["n_cards"])))
+        hands.append({"nickname": player['nickname'], "hand": player_hand})
+    return hands
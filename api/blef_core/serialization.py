@@ -0,0 +1,127 @@
+"""
+    Request parsing and response payloads shared by all handlers
+"""
+import json
+import uuid
+import decimal
+import hashlib
+
+RESPONSE_HEADERS = {
+    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,x-api-key,X-Amz-Security-Token',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'OPTIONS,POST,GET',
+    'Access-Control-Allow-Credentials': True,
+    'Content-Type': 'application/json'
+}
+
+
+# Views which can never change again may be cached by browsers, CDNs and API Gateway for a year
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class DecimalEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, decimal.Decimal):
+            if obj.as_tuple().exponent == 0:
+                return int(obj)
+            return float(obj)
+        return super(DecimalEncoder, self).default(obj)
+
+
+def dumps(obj):
+    return json.dumps(obj, cls=DecimalEncoder)
+
+
+def response_payload(status_code, body):
+    return {
+            'statusCode': status_code,
+            'body': dumps(body),
+            'headers': dict(RESPONSE_HEADERS),
+        }
+
+
+def make_etag(body):
+    """ Strong entity tag of an encoded response body """
+    return '"{}"'.format(hashlib.sha256(body.encode("utf-8")).hexdigest()[:32])
+
+
+def etag_matches(if_none_match, etag):
+    """ Whether an If-None-Match header lists the entity tag - compared weakly, as RFC 7232 says for it """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def not_modified_payload(headers=None):
+    return {'statusCode': 304, 'body': '', 'headers': headers or dict(RESPONSE_HEADERS)}
+
+
+def immutable_response_payload(body, etag, if_none_match=None):
+    """ Response with an already encoded body which never changes - 304 Not Modified if the client holds it """
+    headers = dict(RESPONSE_HEADERS, **{"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL})
+    if etag_matches(if_none_match, etag):
+        return not_modified_payload(headers)
+    return {'statusCode': 200, 'body': body, 'headers': headers}
+
+
+def error_payload(status_code, body):
+    return response_payload(status_code, {"error": body})
+
+
+def internal_error_payload(err, message=None):
+    body = "Internal Lambda function error: {}".format(err)
+    if message:
+        body = "{}\n{}".format(body, message)
+    return error_payload(500, body)
+
+
+def request_error_payload(request, message=None):
+    body = "Bad request payload: '{}'".format(request)
+    if message:
+        body = "{}\n{}".format(body, message)
+    return error_payload(400, body)
+
+
+def parameter_error_payload(param_key, param_value, message=None):
+    body = "Bad input value in '{}': {}".format(param_key, param_value)
+    if message:
+        body = "{}\n{}".format(body, message)
+    return error_payload(400, body)
+
+
+def parse_event(event):
+    # Basic input validation
+    if not isinstance(event, dict):
+        # Stream and queue handlers can be invoked with a raw JSON string
+        if isinstance(event, str):
+            return json.loads(event)
+        return False
+
+    # Handle both direct triggers and API Gateway
+    body = event.get("body", event)
+    if isinstance(body, str):
+        try:
+            body = json.loads(body)
+        except ValueError:
+            return None
+    # API Gateway sends null rather than {} when there are no parameters
+    path_params = event.get("pathParameters") or {}
+    query_params = event.get("queryStringParameters") or {}
+    body.update(path_params)
+    body.update(query_params)
+    return body
+
+
+def get_header(event, name):
+    """ A request header - API Gateway keeps their case in REST APIs and lowercases them in HTTP APIs """
+    headers = (event.get("headers") if isinstance(event, dict) else None) or {}
+    return next((value for key, value in headers.items() if key.lower() == name.lower()), None)
+
+
+def is_valid_uuid(value):
+    try:
+        uuid.UUID(str(value))
+        return True
+    except ValueError:
+        return False
@@ -0,0 +1,659 @@
+"""
+    Game storage backends
+
+    All handlers read and write games through a GameStore. The backend is chosen
+    with the `game_store` environment variable:
+        dynamodb (default) - the "games" DynamoDB table
+        sqlite             - a local SQLite database in WAL mode, at `game_store_sqlite_path`
+        memory             - a process-local dict, for tests, simulations and benchmarks
+
+    Finished rounds go to an append-only round log holding each round's hands and
+    history, along with the players and settings of the game. Full end-of-round views
+    are rebuilt from a log entry alone, so fetching one or a range of past rounds takes
+    a single read. Entries logged before they held the players are rebuilt with the
+    help of the live game.
+
+    Bets are appended to the history one entry at a time, conditional on the history
+    length and current player the bettor saw, so a bet write has a constant size.
+
+    Every update bumps the game's "version" attribute. Writers that read, modify and
+    write back pass the version they read as expected_version, and get a ConflictError
+    if anyone else wrote the game in between. Admin changes to a game yet to start are
+    a single write, conditional on the game's status and admin, with no read at all.
+"""
+import os
+import json
+import time
+import pickle
+import sqlite3
+import decimal
+import threading
+from blef_core.serialization import DecimalEncoder
+
+# Only the DynamoDB backend needs boto3, which takes a few hundred milliseconds to import
+boto3 = Key = ClientError = None
+
+DEFAULT_BACKEND = "dynamodb"
+DEFAULT_SQLITE_PATH = "blef.sqlite3"
+# Keys a BatchGetItem leaves unprocessed (when throttled) are asked for again, backing off from BATCH_GET_RETRY_DELAY seconds
+BATCH_GET_ATTEMPTS = 5
+BATCH_GET_RETRY_DELAY = 0.05
+
+
+class ConflictError(Exception):
+    """ A conditional write lost a race with another write to the same game """
+
+
+def timestamp():
+    return decimal.Decimal(str(time.time()))
+
+
+def game_version(game):
+    """ Games written before versioning count as version 0 """
+    return int(game.get("version", 0))
+
+
+def is_expected_turn(game, history_length, cp_nickname):
+    """ Whether a stored game is still at the turn a bet was made against """
+    return game is not None and len(game["history"]) == history_length and game["cp_nickname"] == cp_nickname
+
+
+def is_admin_change(game, attributes, admin_uuid):
+    """
+        Whether a stored game is yet to start, admin_uuid is its admin's and the attributes
+        would change it. The admin joined first, and players are only appended until the start.
+    """
+    if game is None or game.get("status") != "Not started" or not game.get("players"):
+        return False
+    admin = game["players"][0]
+    return (admin["uuid"] == admin_uuid and admin["nickname"] == game.get("admin_nickname")
+            and any(game.get(name) != value for name, value in attributes.items()))
+
+
+def round_snapshot_uuid(game_uuid, round_number):
+    return f"{game_uuid}_{int(round_number)}"
+
+
+# Attributes of a game which do not change once it has started, copied into round log entries
+ROUND_GAME_ATTRIBUTES = ("admin_nickname", "public", "room", "max_cards")
+
+
+def make_round_entry(game):
+    """ The round log entry of a game at the end of its current round """
+    return dict(
+        {attribute: game[attribute] for attribute in ROUND_GAME_ATTRIBUTES if attribute in game},
+        game_uuid=game["game_uuid"],
+        round_number=game["round_number"],
+        # n_cards is left out - it is the size of the player's hand
+        players=[{key: value for key, value in player.items() if key != "n_cards"} for player in game["players"]],
+        hands=game["hands"],
+        history=game["history"]
+    )
+
+
+def is_self_contained(round_entry):
+    """ Whether a round can be rebuilt from its log entry alone, without the live game """
+    return "players" in round_entry
+
+
+def rebuild_round_snapshot(game, round_entry):
+    """
+        The game as it was at the end of a round (what used to be stored under
+        "<game_uuid>_<round>"), from that round's log entry and, for entries which
+        are not self-contained, the live game - which can be None otherwise.
+        Every player is dealt their n_cards at the start of a round, so n_cards
+        is the size of their hand.
+    """
+    game = dict(game or {}, **{attribute: round_entry[attribute] for attribute in ROUND_GAME_ATTRIBUTES + ("players",)
+                               if attribute in round_entry})
+    n_cards = {hand["nickname"]: len(hand["hand"]) for hand in round_entry["hands"]}
+    return dict(
+        game,
+        game_uuid=round_snapshot_uuid(round_entry["game_uuid"], round_entry["round_number"]),
+        status="Running",
+        round_number=round_entry["round_number"],
+        players=[dict(player, n_cards=n_cards.get(player["nickname"], 0)) for player in game["players"]],
+        hands=round_entry["hands"],
+        cp_nickname=None,
+        history=round_entry["history"],
+        last_modified=round_entry["last_modified"]
+    )
+
+
+def load_boto3():
+    global boto3, Key, ClientError
+    import boto3
+    from boto3.dynamodb.conditions import Key
+    from botocore.exceptions import ClientError
+
+
+class GameStore:
+    """ Interface of a game store - game items are dicts keyed by "game_uuid" """
+
+    def get_game(self, game_uuid, attributes=None):
+        """
+            Return the game item, or None if there is no such game. Given a list of
+            attributes, only those (and game_uuid) are read, if the game has them.
+        """
+        raise NotImplementedError
+
+    def get_last_modified(self, game_uuid):
+        """ Return only the game's last_modified, or None if there is no such game - for cheap change checks """
+        raise NotImplementedError
+
+    def save_game(self, game):
+        """ Write the whole game item, stamping its last_modified """
+        raise NotImplementedError
+
+    def update_game(self, game_uuid, attributes, expected_version=None):
+        """
+            Set the given top-level attributes of a game item, stamping its last_modified
+            and bumping its version. If expected_version is given, raise ConflictError
+            unless the stored game is still at that version.
+        """
+        raise NotImplementedError
+
+    def update_as_admin(self, game_uuid, attributes, admin_uuid):
+        """
+            update_game a game yet to start on behalf of its admin - raises ConflictError
+            and writes nothing unless is_admin_change holds for the stored game
+        """
+        raise NotImplementedError
+
+    def append_bet(self, game_uuid, bet, cp_nickname, expected_history_length, expected_cp_nickname):
+        """
+            Append one bet to the game's history and hand the turn to cp_nickname. Raises
+            ConflictError unless the history still has expected_history_length entries and
+            it is still expected_cp_nickname's turn.
+        """
+        raise NotImplementedError
+
+    def append_round(self, round_entry):
+        """ Add a finished round to the round log, stamping its last_modified - entries are never overwritten """
+        raise NotImplementedError
+
+    def finish_round(self, round_entry, attributes, expected_version=None):
+        """
+            Atomically append_round and update_game the round's game - raises ConflictError
+            and writes nothing if the round is already logged or the version is stale
+        """
+        raise NotImplementedError
+
+    def get_round(self, game_uuid, round_number):
+        """ Return the round log entry, or None if the round is not in the log """
+        raise NotImplementedError
+
+    def get_rounds(self, game_uuid, first_round=1, last_round=None):
+        """ Return the round log entries from first_round to last_round (or the last logged one), in order """
+        raise NotImplementedError
+
+    def get_game_and_round(self, game_uuid, round_number):
+        """ (get_game, get_round) - backends with a network round trip per read make both in one """
+        return self.get_game(game_uuid), self.get_round(game_uuid, round_number)
+
+    def get_round_snapshot(self, game, round_number):
+        """ The game at the end of the given round, or None if the round has not finished """
+        round_entry = self.get_round(game["game_uuid"], round_number)
+        if round_entry:
+            return rebuild_round_snapshot(game, round_entry)
+        # Rounds finished before the round log was introduced
+        return self.get_game(round_snapshot_uuid(game["game_uuid"], round_number))
+
+
+class DynamoDBGameStore(GameStore):
+
+    def __init__(self, table_name="games", rounds_table_name="game_rounds"):
+        load_boto3()
+        dynamodb = boto3.resource('dynamodb')
+        self.table = dynamodb.Table(table_name)
+        self.rounds_table = dynamodb.Table(rounds_table_name)
+
+    def get_game(self, game_uuid, attributes=None):
+        if attributes:
+            # Placeholders for every name, as some (e.g. "status") are reserved words
+            names = {f"#{name}": name for name in ("game_uuid", *attributes)}
+            response = self.table.get_item(
+                Key={'game_uuid': game_uuid},
+                ProjectionExpression=", ".join(names),
+                ExpressionAttributeNames=names
+            )
+            return response.get("Item")
+        response = self.table.query(KeyConditionExpression=Key('game_uuid').eq(game_uuid))
+        items = response.get("Items")
+        if len(items) == 1:
+            return items[0]
+        return None
+
+    def get_last_modified(self, game_uuid):
+        response = self.table.get_item(
+            Key={'game_uuid': game_uuid},
+            ProjectionExpression="#last_modified",
+            ExpressionAttributeNames={"#last_modified": "last_modified"}
+        )
+        return response.get("Item", {}).get("last_modified") if "Item" in response else None
+
+    def save_game(self, game):
+        game["last_modified"] = timestamp()
+        self.table.put_item(Item=game)
+        return True
+
+    def update_request(self, game_uuid, attributes, expected_version=None):
+        """ update_item arguments - shared by update_game and the transaction in finish_round """
+        attributes = dict(attributes, last_modified=timestamp())
+        # Attribute names go through placeholders - "public" and "status" are reserved words
+        names = {f"#attr{i}": name for i, name in enumerate(attributes)}
+        values = {f":attr{i}": value for i, value in enumerate(attributes.values())}
+        assignments = [f"#attr{i} = :attr{i}" for i in range(len(attributes))]
+        names["#version"] = "version"
+        request = {
+            "Key": {
+                'game_uuid': game_uuid
+            },
+            "ExpressionAttributeNames": names,
+            "ExpressionAttributeValues": values
+        }
+        if expected_version is None:
+            values[":one"] = 1
+            values[":zero"] = 0
+            assignments.append("#version = if_not_exists(#version, :zero) + :one")
+        else:
+            values[":expected_version"] = expected_version
+            values[":new_version"] = expected_version + 1
+            assignments.append("#version = :new_version")
+            condition = "#version = :expected_version"
+            if expected_version == 0:
+                condition = f"(attribute_not_exists(#version) OR {condition})"
+            request["ConditionExpression"] = f"attribute_exists(game_uuid) AND {condition}"
+        request["UpdateExpression"] = "set " + ", ".join(assignments)
+        return request
+
+    def update_game(self, game_uuid, attributes, expected_version=None):
+        try:
+            self.table.update_item(ReturnValues="NONE", **self.update_request(game_uuid, attributes, expected_version))
+        except ClientError as err:
+            if err.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                raise ConflictError(f"Game {game_uuid} changed since version {expected_version}") from err
+            raise
+        return True
+
+    def update_as_admin(self, game_uuid, attributes, admin_uuid):
+        request = self.update_request(game_uuid, attributes)
+        request["ExpressionAttributeNames"].update({
+            "#status": "status",
+            "#players": "players",
+            "#uuid": "uuid",
+            "#nickname": "nickname",
+            "#admin_nickname": "admin_nickname"
+        })
+        request["ExpressionAttributeValues"].update({":not_started": "Not started", ":admin_uuid": admin_uuid})
+        # The caller's attributes come first in update_request's placeholders, last_modified last
+        changes = " OR ".join(f"attribute_not_exists(#attr{i}) OR #attr{i} <> :attr{i}" for i in range(len(attributes)))
+        request["ConditionExpression"] = ("#status = :not_started AND #players[0].#uuid = :admin_uuid "
+                                          f"AND #players[0].#nickname = #admin_nickname AND ({changes})")
+        try:
+            self.table.update_item(ReturnValues="NONE", **request)
+        except ClientError as err:
+            if err.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                raise ConflictError(f"Game {game_uuid} cannot be changed by admin {admin_uuid}") from err
+            raise
+        return True
+
+    def append_bet(self, game_uuid, bet, cp_nickname, expected_history_length, expected_cp_nickname):
+        try:
+            self.table.update_item(
+                Key={
+                    'game_uuid': game_uuid
+                },
+                UpdateExpression="set #history = list_append(#history, :bet), #cp_nickname = :cp_nickname, "
+                                 "#last_modified = :last_modified, #version = if_not_exists(#version, :zero) + :one",
+                ConditionExpression="size(#history) = :history_length AND #cp_nickname = :expected_cp_nickname",
+                ExpressionAttributeNames={
+                    "#history": "history",
+                    "#cp_nickname": "cp_nickname",
+                    "#last_modified": "last_modified",
+                    "#version": "version"
+                },
+                ExpressionAttributeValues={
+                    ":bet": [bet],
+                    ":cp_nickname": cp_nickname,
+                    ":last_modified": timestamp(),
+                    ":zero": 0,
+                    ":one": 1,
+                    ":history_length": expected_history_length,
+                    ":expected_cp_nickname": expected_cp_nickname
+                },
+                ReturnValues="NONE"
+            )
+        except ClientError as err:
+            if err.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                raise ConflictError(f"Game {game_uuid} moved past history entry {expected_history_length}") from err
+            raise
+        return True
+
+    def append_round(self, round_entry):
+        round_entry["last_modified"] = timestamp()
+        try:
+            self.rounds_table.put_item(
+                Item=round_entry,
+                ConditionExpression="attribute_not_exists(round_number)"
+            )
+        except ClientError as err:
+            if err.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                raise ConflictError(f"Round {round_entry['round_number']} is already in the round log") from err
+            raise
+        return True
+
+    def finish_round(self, round_entry, attributes, expected_version=None):
+        round_entry["last_modified"] = timestamp()
+        update = self.update_request(round_entry["game_uuid"], attributes, expected_version)
+        update["TableName"] = self.table.name
+        try:
+            # The resource's client serialises plain Python values itself, as Table methods do
+            self.table.meta.client.transact_write_items(TransactItems=[
+                {"Put": {
+                    "TableName": self.rounds_table.name,
+                    "Item": round_entry,
+                    "ConditionExpression": "attribute_not_exists(round_number)"
+                }},
+                {"Update": update}
+            ])
+        except ClientError as err:
+            if err.response["Error"]["Code"] == "TransactionCanceledException":
+                raise ConflictError(f"Round {round_entry['round_number']} could not be finished") from err
+            raise
+        return True
+
+    def get_round(self, game_uuid, round_number):
+        response = self.rounds_table.get_item(Key={'game_uuid': game_uuid, 'round_number': round_number})
+        return response.get("Item")
+
+    def get_rounds(self, game_uuid, first_round=1, last_round=None):
+        # One query, paginated past DynamoDB's 1 MB page size
+        rounds = Key('round_number').gte(first_round) if last_round is None else Key('round_number').between(first_round, last_round)
+        query = {"KeyConditionExpression": Key('game_uuid').eq(game_uuid) & rounds}
+        entries = []
+        while True:
+            response = self.rounds_table.query(**query)
+            entries += response.get("Items", [])
+            if "LastEvaluatedKey" not in response:
+                return entries
+            query["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def get_game_and_round(self, game_uuid, round_number):
+        # One BatchGetItem across both tables, asking again for any keys DynamoDB left unprocessed
+        request = {
+            self.table.name: {"Keys": [{'game_uuid': game_uuid}]},
+            self.rounds_table.name: {"Keys": [{'game_uuid': game_uuid, 'round_number': round_number}]}
+        }
+        items = {}
+        for attempt in range(BATCH_GET_ATTEMPTS):
+            if attempt:
+                time.sleep(BATCH_GET_RETRY_DELAY * 2 ** (attempt - 1))
+            response = self.table.meta.client.batch_get_item(RequestItems=request)
+            for table_name, table_items in response.get("Responses", {}).items():
+                items.setdefault(table_name, []).extend(table_items)
+            request = response.get("UnprocessedKeys")
+            if not request:
+                games, round_entries = (items.get(table.name) or [None] for table in (self.table, self.rounds_table))
+                return games[0], round_entries[0]
+        raise RuntimeError(f"Game {game_uuid} and its round {round_number} could not be read")
+
+
+class InMemoryGameStore(GameStore):
+
+    def __init__(self):
+        self.items = {}
+        self.rounds = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def clone(item):
+        """ Copy an item the way a round trip through DynamoDB would - much faster than deepcopy """
+        return pickle.loads(pickle.dumps(item, pickle.HIGHEST_PROTOCOL))
+
+    def get_game(self, game_uuid, attributes=None):
+        with self.lock:
+            item = self.items.get(game_uuid)
+            if item is not None and attributes:
+                item = {name: item[name] for name in ("game_uuid", *attributes) if name in item}
+            return self.clone(item) if item is not None else None
+
+    def get_last_modified(self, game_uuid):
+        with self.lock:
+            item = self.items.get(game_uuid)
+            return item.get("last_modified") if item is not None else None
+
+    def save_game(self, game):
+        game["last_modified"] = timestamp()
+        with self.lock:
+            self.items[game["game_uuid"]] = self.clone(game)
+        return True
+
+    def _update(self, game_uuid, attributes, expected_version):
+        item = self.items.get(game_uuid)
+        if expected_version is not None and (item is None or game_version(item) != expected_version):
+            raise ConflictError(f"Game {game_uuid} changed since version {expected_version}")
+        item = self.items.setdefault(game_uuid, {"game_uuid": game_uuid})
+        item.update(self.clone(dict(attributes, last_modified=timestamp())))
+        item["version"] = game_version(item) + 1
+
+    def _append_round(self, round_entry):
+        key = (round_entry["game_uuid"], int(round_entry["round_number"]))
+        if key in self.rounds:
+            raise ConflictError(f"Round {key[1]} of game {key[0]} is already in the round log")
+        round_entry["last_modified"] = timestamp()
+        self.rounds[key] = self.clone(round_entry)
+
+    def update_game(self, game_uuid, attributes, expected_version=None):
+        with self.lock:
+            self._update(game_uuid, attributes, expected_version)
+        return True
+
+    def update_as_admin(self, game_uuid, attributes, admin_uuid):
+        with self.lock:
+            if not is_admin_change(self.items.get(game_uuid), attributes, admin_uuid):
+                raise ConflictError(f"Game {game_uuid} cannot be changed by admin {admin_uuid}")
+            self._update(game_uuid, attributes, None)
+        return True
+
+    def append_bet(self, game_uuid, bet, cp_nickname, expected_history_length, expected_cp_nickname):
+        with self.lock:
+            item = self.items.get(game_uuid)
+            if not is_expected_turn(item, expected_history_length, expected_cp_nickname):
+                raise ConflictError(f"Game {game_uuid} moved past history entry {expected_history_length}")
+            item["history"].append(self.clone(bet))
+            item["cp_nickname"] = cp_nickname
+            item["last_modified"] = timestamp()
+            item["version"] = game_version(item) + 1
+        return True
+
+    def append_round(self, round_entry):
+        with self.lock:
+            self._append_round(round_entry)
+        return True
+
+    def finish_round(self, round_entry, attributes, expected_version=None):
+        with self.lock:
+            item = self.items.get(round_entry["game_uuid"])
+            if expected_version is not None and (item is None or game_version(item) != expected_version):
+                raise ConflictError(f"Game {round_entry['game_uuid']} changed since version {expected_version}")
+            self._append_round(round_entry)
+            self._update(round_entry["game_uuid"], attributes, expected_version)
+        return True
+
+    def get_round(self, game_uuid, round_number):
+        with self.lock:
+            round_entry = self.rounds.get((game_uuid, int(round_number)))
+            return self.clone(round_entry) if round_entry is not None else None
+
+    def get_rounds(self, game_uuid, first_round=1, last_round=None):
+        with self.lock:
+            entries = [round_entry for (uuid, round_number), round_entry in self.rounds.items()
+                       if uuid == game_uuid and first_round <= round_number and (last_round is None or round_number <= last_round)]
+            return self.clone(sorted(entries, key=lambda round_entry: round_entry["round_number"]))
+
+    def get_game_and_round(self, game_uuid, round_number):
+        with self.lock:
+            return self.clone((self.items.get(game_uuid), self.rounds.get((game_uuid, int(round_number)))))
+
+
+class SQLiteGameStore(GameStore):
+    """ Items are stored as JSON, and read back with numbers as Decimals like DynamoDB returns them """
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS games (game_uuid TEXT PRIMARY KEY, item TEXT NOT NULL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS game_rounds ("
+                                "game_uuid TEXT NOT NULL, round_number INTEGER NOT NULL, entry TEXT NOT NULL, "
+                                "PRIMARY KEY (game_uuid, round_number))")
+
+    @staticmethod
+    def dumps(item):
+        return json.dumps(item, cls=DecimalEncoder, separators=(",", ":"))
+
+    @staticmethod
+    def loads(text):
+        return json.loads(text, parse_int=decimal.Decimal, parse_float=decimal.Decimal)
+
+    def get_game(self, game_uuid, attributes=None):
+        if attributes:
+            names = ("game_uuid", *attributes)
+            paths = [f'$."{name}"' for name in names]
+            # With several paths json_extract returns a JSON array of their values - null for missing
+            # and stored null alike, so json_type (SQL NULL only when missing) tells them apart
+            types = ", ".join("json_type(item, ?)" for _ in names)
+            with self.lock:
+                row = self.connection.execute(
+                    f"SELECT json_extract(item, {', '.join('?' for _ in names)}), json_array({types}) "
+                    "FROM games WHERE game_uuid = ?", paths + paths + [game_uuid]).fetchone()
+            if not row:
+                return None
+            values, value_types = self.loads(row[0]), json.loads(row[1])
+            return {name: value for name, value, value_type in zip(names, values, value_types) if value_type is not None}
+        with self.lock:
+            row = self.connection.execute("SELECT item FROM games WHERE game_uuid = ?", (game_uuid,)).fetchone()
+        return self.loads(row[0]) if row else None
+
+    def get_last_modified(self, game_uuid):
+        with self.lock:
+            row = self.connection.execute("SELECT json_extract(item, '$.last_modified') FROM games WHERE game_uuid = ?",
+                                          (game_uuid,)).fetchone()
+        if not row or row[0] is None:
+            return None
+        # The item was encoded with the float's shortest repr, which is what get_game reads back as a Decimal
+        return decimal.Decimal(repr(row[0]))
+
+    def save_game(self, game):
+        game["last_modified"] = timestamp()
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO games (game_uuid, item) VALUES (?, ?)",
+                                    (game["game_uuid"], self.dumps(game)))
+        return True
+
+    def transaction(function):
+        """ Run the decorated method in one immediate (write-locking) transaction """
+        def run_in_transaction(self, *args, **kwargs):
+            with self.lock:
+                self.connection.execute("BEGIN IMMEDIATE")
+                try:
+                    result = function(self, *args, **kwargs)
+                    self.connection.execute("COMMIT")
+                    return result
+                except Exception:
+                    self.connection.execute("ROLLBACK")
+                    raise
+        return run_in_transaction
+
+    def _update(self, game_uuid, attributes, expected_version):
+        row = self.connection.execute("SELECT item FROM games WHERE game_uuid = ?", (game_uuid,)).fetchone()
+        item = self.loads(row[0]) if row else None
+        if expected_version is not None and (item is None or game_version(item) != expected_version):
+            raise ConflictError(f"Game {game_uuid} changed since version {expected_version}")
+        item = item or {"game_uuid": game_uuid}
+        item.update(attributes, last_modified=timestamp())
+        item["version"] = game_version(item) + 1
+        self.connection.execute("INSERT OR REPLACE INTO games (game_uuid, item) VALUES (?, ?)",
+                                (game_uuid, self.dumps(item)))
+
+    def _append_round(self, round_entry):
+        round_entry["last_modified"] = timestamp()
+        try:
+            # A plain INSERT fails on an existing (game_uuid, round_number) - the log is append-only
+            self.connection.execute("INSERT INTO game_rounds (game_uuid, round_number, entry) VALUES (?, ?, ?)",
+                                    (round_entry["game_uuid"], int(round_entry["round_number"]), self.dumps(round_entry)))
+        except sqlite3.IntegrityError as err:
+            raise ConflictError(f"Round {round_entry['round_number']} is already in the round log") from err
+
+    @transaction
+    def update_game(self, game_uuid, attributes, expected_version=None):
+        self._update(game_uuid, attributes, expected_version)
+        return True
+
+    @transaction
+    def update_as_admin(self, game_uuid, attributes, admin_uuid):
+        row = self.connection.execute("SELECT item FROM games WHERE game_uuid = ?", (game_uuid,)).fetchone()
+        if not is_admin_change(self.loads(row[0]) if row else None, attributes, admin_uuid):
+            raise ConflictError(f"Game {game_uuid} cannot be changed by admin {admin_uuid}")
+        self._update(game_uuid, attributes, None)
+        return True
+
+    @transaction
+    def append_bet(self, game_uuid, bet, cp_nickname, expected_history_length, expected_cp_nickname):
+        # SQLite rewrites the row either way - the condition is what matters here
+        row = self.connection.execute("SELECT item FROM games WHERE game_uuid = ?", (game_uuid,)).fetchone()
+        item = self.loads(row[0]) if row else None
+        if not is_expected_turn(item, expected_history_length, expected_cp_nickname):
+            raise ConflictError(f"Game {game_uuid} moved past history entry {expected_history_length}")
+        item["history"].append(bet)
+        item.update(cp_nickname=cp_nickname, last_modified=timestamp(), version=game_version(item) + 1)
+        self.connection.execute("UPDATE games SET item = ? WHERE game_uuid = ?", (self.dumps(item), game_uuid))
+        return True
+
+    @transaction
+    def append_round(self, round_entry):
+        self._append_round(round_entry)
+        return True
+
+    @transaction
+    def finish_round(self, round_entry, attributes, expected_version=None):
+        self._append_round(round_entry)
+        self._update(round_entry["game_uuid"], attributes, expected_version)
+        return True
+
+    def get_round(self, game_uuid, round_number):
+        with self.lock:
+            row = self.connection.execute("SELECT entry FROM game_rounds WHERE game_uuid = ? AND round_number = ?",
+                                          (game_uuid, int(round_number))).fetchone()
+        return self.loads(row[0]) if row else None
+
+    def get_rounds(self, game_uuid, first_round=1, last_round=None):
+        query = "SELECT entry FROM game_rounds WHERE game_uuid = ? AND round_number >= ?"
+        parameters = [game_uuid, int(first_round)]
+        if last_round is not None:
+            query += " AND round_number <= ?"
+            parameters.append(int(last_round))
+        with self.lock:
+            rows = self.connection.execute(query + " ORDER BY round_number", parameters).fetchall()
+        return [self.loads(row[0]) for row in rows]
+
+
+BACKENDS = {
+    "dynamodb": DynamoDBGameStore,
+    "sqlite": lambda: SQLiteGameStore(os.environ.get("game_store_sqlite_path", DEFAULT_SQLITE_PATH)),
+    "memory": InMemoryGameStore
+}
+
+_stores = {}
+
+
+def get_game_store(backend=None):
+    """ The process-wide store of the configured backend, so all handlers in a process share it """
+    backend = backend or os.environ.get("game_store", DEFAULT_BACKEND)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown game store backend: {backend}")
+    if backend not in _stores:
+        _stores[backend] = BACKENDS[backend]()
+    return _stores[backend]
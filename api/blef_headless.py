@@ -0,0 +1,206 @@
+"""
+    Headless game simulator
+
+    Plays complete games of Blef in-process through the real Lambda handlers
+    (create_game, join_game, start_game and play), backed by an in-memory
+    (or SQLite) game store instead of DynamoDB. Simulated players pick random legal
+    moves, and the game is checked against the rules after every move, so the
+    simulator doubles as a throughput benchmark and a regression harness.
+
+    Through the handlers every move is a parsed request, a JSON response and a store
+    write, which caps the simulator at a few dozen games per second. With --fast the
+    games are played on the rule code alone - start_game's dealing, play's handle_check
+    and the rules functions the handlers call, without requests, responses or a store -
+    at several hundred games per second.
+
+    Example:
+        python blef_headless.py --games 1000 --players 4 --seed 0 [--fast]
+"""
+import os
+import json
+import time
+import random
+import argparse
+import importlib
+from blef_core import storage
+from blef_core.rules import draw_cards, find_next_active_player
+
+HANDLER_MODULES = ("create_game", "join_game", "start_game", "play")
+
+
+def load_handlers(store):
+    """ Import the handler modules and point them at the given store """
+    # Keep the handlers from building a DynamoDB store of their own at import time
+    os.environ.setdefault("game_store", "memory")
+    handlers = {}
+    for name in HANDLER_MODULES:
+        module = importlib.import_module(name)
+        module.store = store
+        handlers[name] = module
+    return handlers
+
+
+def call(handler, **body):
+    response = handler.lambda_handler(body, None)
+    if response["statusCode"] not in (200, 202):
+        raise AssertionError(f"{handler.__name__} failed: {response['body']}")
+    return json.loads(response["body"])
+
+
+def choose_action(history, rng, check_probability):
+    """ A random legal move - any more senior bet, or a check """
+    if history and (history[-1]["action_id"] == 87 or rng.random() < check_probability):
+        return 88
+    lowest = int(history[-1]["action_id"]) + 1 if history else 0
+    return min(87, lowest + int(rng.expovariate(0.5)))
+
+
+def check_round_snapshot(store, game, finished_round):
+    snapshot = store.get_round_snapshot(game, finished_round)
+    assert snapshot, f"Missing snapshot of round {finished_round}"
+    assert snapshot["round_number"] == finished_round
+    assert snapshot["history"][-2]["action_id"] == 88 and snapshot["history"][-1]["action_id"] == 89
+
+
+def check_game(game):
+    active_players = [p for p in game["players"] if p["n_cards"] > 0]
+    assert all(p["n_cards"] <= game["max_cards"] for p in game["players"])
+    if game["status"] == "Finished":
+        assert len(active_players) == 1
+        return
+    assert len(active_players) > 1
+    assert game["cp_nickname"] in [p["nickname"] for p in active_players]
+    for hand in game["hands"]:
+        player = next(p for p in game["players"] if p["nickname"] == hand["nickname"])
+        assert len(hand["hand"]) == player["n_cards"]
+
+
+def read_game(store, game_uuid):
+    """ The stored game - the in-memory store's own item, which is only read here, saves a copy per move """
+    if isinstance(store, storage.InMemoryGameStore):
+        return store.items[game_uuid]
+    return store.get_game(game_uuid)
+
+
+class RoundLog(storage.GameStore):
+    """ The store of the fast mode: play.handle_check logs finished rounds here, and nothing else is stored """
+
+    def __init__(self):
+        self.rounds = {}
+
+    def finish_round(self, round_entry, attributes, expected_version=None):
+        round_entry["last_modified"] = storage.timestamp()
+        self.rounds[round_entry["game_uuid"], int(round_entry["round_number"])] = round_entry
+        return True
+
+    def get_round(self, game_uuid, round_number):
+        return self.rounds.get((game_uuid, int(round_number)))
+
+
+def play_game(handlers, store, n_players, rng, check_probability=0.3):
+    """ Play one game to the end, returns (rounds, moves) """
+    game_uuid = call(handlers["create_game"])["game_uuid"]
+    player_uuids = {}
+    for i in range(n_players):
+        nickname = f"player{i}"
+        player_uuids[nickname] = call(handlers["join_game"], game_uuid=game_uuid, nickname=nickname)["player_uuid"]
+    call(handlers["start_game"], game_uuid=game_uuid, admin_uuid=player_uuids["player0"])
+
+    moves = 0
+    game = read_game(store, game_uuid)
+    while game["status"] == "Running":
+        check_game(game)
+        round_number = game["round_number"]
+        action_id = choose_action(game["history"], rng, check_probability)
+        call(handlers["play"], game_uuid=game_uuid, player_uuid=player_uuids[game["cp_nickname"]], action_id=action_id)
+        moves += 1
+        game = read_game(store, game_uuid)
+        if action_id == 88:
+            check_round_snapshot(store, game, round_number)
+            assert game["round_number"] == round_number + 1
+    check_game(game)
+    return int(game["round_number"]) - 1, moves
+
+
+def play_game_fast(handlers, round_log, n_players, rng, check_probability=0.3):
+    """ Play one game to the end on the handlers' rule code, moving the way play_action does - returns (rounds, moves) """
+    # Random numbers are drawn as the handlers draw them (the room, then the seating and the
+    # cards), so a seed plays the same games in both modes
+    room = random.randrange(10, 100)
+    players = [{"uuid": str(i), "nickname": f"player{i}", "n_cards": 1} for i in range(n_players)]
+    players = handlers["start_game"].arrange_players(players)
+    game = {
+        "game_uuid": "f2fdd601-bc82-438b-a4ee-a871dc35561a",
+        "room": room,
+        "players": players,
+        "status": "Running",
+        "round_number": 1,
+        "max_cards": handlers["start_game"].get_max_cards(n_players),
+        "hands": draw_cards(players),
+        "cp_nickname": players[0]["nickname"],
+        "history": []
+    }
+    round_log.rounds.clear()
+
+    moves = 0
+    check_game(game)
+    while game["status"] == "Running":
+        round_number = game["round_number"]
+        action_id = choose_action(game["history"], rng, check_probability)
+        player_nickname = game["cp_nickname"]
+        game["history"].append({"player": player_nickname, "action_id": action_id})
+        moves += 1
+        if action_id != 88:
+            # A bet only hands the turn on - the rest of the game is checked when the round ends
+            next_player = find_next_active_player(game["players"], player_nickname)
+            assert next_player["n_cards"] > 0
+            game["cp_nickname"] = next_player["nickname"]
+            continue
+        handlers["play"].handle_check(game)
+        check_game(game)
+        check_round_snapshot(round_log, game, round_number)
+        assert game["round_number"] == round_number + 1
+    return game["round_number"] - 1, moves
+
+
+def simulate(n_games, n_players, seed=None, check_probability=0.3, store=None, fast=False):
+    """ Play n_games games and return throughput statistics - with fast, on the rule code alone """
+    # The handlers shuffle and deal with the global random module
+    random.seed(seed)
+    rng = random.Random(seed)
+    if fast:
+        store = RoundLog()
+    store = store or storage.InMemoryGameStore()
+    handlers = load_handlers(store)
+    play = play_game_fast if fast else play_game
+    rounds = moves = 0
+    start = time.perf_counter()
+    for _ in range(n_games):
+        game_rounds, game_moves = play(handlers, store, n_players, rng, check_probability)
+        rounds += game_rounds
+        moves += game_moves
+    elapsed = time.perf_counter() - start
+    return {"games": n_games, "rounds": rounds, "moves": moves, "seconds": elapsed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play complete Blef games in-process through the Lambda handlers")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--players", type=int, default=4, choices=range(2, 9))
+    parser.add_argument("--check-probability", type=float, default=0.3, help="Chance a simulated player checks")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible games")
+    parser.add_argument("--store", choices=["memory", "sqlite"], default="memory", help="Game store backend")
+    parser.add_argument("--sqlite-path", default=":memory:", help="SQLite database file for --store sqlite")
+    parser.add_argument("--fast", action="store_true", help="Play on the rule code alone, without handlers or a store")
+    args = parser.parse_args(argv)
+
+    store = storage.SQLiteGameStore(args.sqlite_path) if args.store == "sqlite" else storage.InMemoryGameStore()
+    stats = simulate(args.games, args.players, args.seed, args.check_probability, store, fast=args.fast)
+    seconds = stats["seconds"]
+    print(f"games:   {stats['games']:>10} {stats['games'] / seconds:12,.0f} games/s")
+    print(f"rounds:  {stats['rounds']:>10} {stats['rounds'] / seconds:12,.0f} rounds/s")
+    print(f"moves:   {stats['moves']:>10} {stats['moves'] / seconds:12,.0f} moves/s")
+
+
+if __name__ == "__main__":
+    main()
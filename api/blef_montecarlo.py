@@ -0,0 +1,119 @@
+"""
+    Monte Carlo deal simulator
+
+    Deals whole batches of rounds at once with NumPy: every round is a random
+    permutation of the 24-card deck (argsort of random keys), of which the first
+    sum(n_cards) cards are handed out to the players in order. Hands are kept as
+    int8 card indices and uint32 card masks, and checks are resolved with the
+    vectorised evaluators in rules.
+
+    Example:
+        python blef_montecarlo.py --n-cards 2 1 1 --rounds 1000000 --seed 0
+"""
+import time
+import argparse
+from blef_core import rules
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DEFAULT_BATCH_SIZE = 1 << 18
+
+
+def get_rng(seed=None):
+    if np is None:
+        raise RuntimeError("The Monte Carlo simulator requires NumPy")
+    return np.random.default_rng(seed)
+
+
+def deal(n_rounds, n_cards, rng):
+    """
+        Deal n_rounds rounds to players holding n_cards[i] cards each.
+        Returns an (n_rounds, sum(n_cards)) int8 array of card indices;
+        player i holds the columns sum(n_cards[:i]) to sum(n_cards[:i + 1]).
+    """
+    total_cards = sum(n_cards)
+    if total_cards > rules.DECK_SIZE:
+        raise ValueError(f"Cannot deal {total_cards} cards from a {rules.DECK_SIZE}-card deck")
+    keys = rng.random((n_rounds, rules.DECK_SIZE), dtype=np.float32)
+    return np.argsort(keys, axis=1)[:, :total_cards].astype(np.int8)
+
+
+def card_bits(dealt):
+    return np.left_shift(np.uint32(1), dealt.astype(np.uint32))
+
+
+def hand_masks(dealt, n_cards):
+    """ (n_rounds, n_players) uint32 array of each player's card mask """
+    bits = card_bits(dealt)
+    bounds = np.cumsum([0] + list(n_cards))
+    return np.stack([
+        np.bitwise_or.reduce(bits[:, start:end], axis=1)
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ], axis=1)
+
+
+def pool_masks(dealt):
+    """ (n_rounds,) uint32 array of the card mask of all cards in play """
+    return np.bitwise_or.reduce(card_bits(dealt), axis=1)
+
+
+def resolve_checks(dealt, action_ids):
+    """ Whether the set bet on (one action ID per round, or one for all rounds) exists in each round """
+    action_ids = np.broadcast_to(np.asarray(action_ids, dtype=np.intp), (dealt.shape[0],))
+    return rules.evaluate_masks_batch(pool_masks(dealt), action_ids)
+
+
+def simulate_set_frequencies(n_cards, n_rounds, seed=None, batch_size=DEFAULT_BATCH_SIZE):
+    """ Fraction of rounds in which each of the 88 sets exists """
+    rng = get_rng(seed)
+    counts = np.zeros(rules.CHECK_ACTION_ID, dtype=np.int64)
+    for start in range(0, n_rounds, batch_size):
+        dealt = deal(min(batch_size, n_rounds - start), n_cards, rng)
+        counts += rules.evaluate_all_sets(rules.masks_to_presence(pool_masks(dealt))).sum(axis=0)
+    return counts / n_rounds
+
+
+def simulate_checks(n_cards, n_rounds, action_id, seed=None, batch_size=DEFAULT_BATCH_SIZE):
+    """ Fraction of rounds in which a check of a bet on action_id would find the set """
+    rng = get_rng(seed)
+    found = 0
+    for start in range(0, n_rounds, batch_size):
+        dealt = deal(min(batch_size, n_rounds - start), n_cards, rng)
+        found += int(resolve_checks(dealt, action_id).sum())
+    return found / n_rounds
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Deal and resolve Blef rounds in bulk")
+    parser.add_argument("--n-cards", type=int, nargs="+", default=[1, 1], help="Cards held by each player")
+    parser.add_argument("--rounds", type=int, default=1000000, help="Number of rounds to deal")
+    parser.add_argument("--action-id", type=int, default=11, help="Bet resolved in the check benchmark")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible results")
+    args = parser.parse_args(argv)
+
+    rng = get_rng(args.seed)
+    _, deal_seconds = timed(deal, args.rounds, args.n_cards, rng)
+    found, check_seconds = timed(simulate_checks, args.n_cards, args.rounds, args.action_id, args.seed, args.batch_size)
+    frequencies, all_sets_seconds = timed(simulate_set_frequencies, args.n_cards, args.rounds, args.seed, args.batch_size)
+
+    print(f"rounds:               {args.rounds} (cards per player: {args.n_cards}, seed: {args.seed})")
+    print(f"deal only:            {args.rounds / deal_seconds:14,.0f} rounds/s")
+    print(f"deal + one check:     {args.rounds / check_seconds:14,.0f} rounds/s"
+          f" - set {args.action_id} found in {found:.4f} of rounds")
+    print(f"deal + all 88 sets:   {args.rounds / all_sets_seconds:14,.0f} rounds/s")
+    most_senior = max((action_id for action_id in range(len(frequencies)) if frequencies[action_id] >= 0.5), default=None)
+    print(f"most senior set found in at least half of the rounds: {most_senior}")
+
+
+if __name__ == "__main__":
+    main()
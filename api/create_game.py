@@ -1,42 +1,9 @@
 import uuid
-import boto3
-import time
-import json
 import random
-import decimal
+from blef_core import storage
+from blef_core.serialization import response_payload, internal_error_payload
 
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table("games")
-
-def response_payload(status_code, body):
-    return {
-            'statusCode': status_code,
-            'body': json.dumps(body),
-            'headers': {
-                'Access-Control-Allow-Headers':'Content-Type,X-Amz-Date,Authorization,X-Api-Key,x-api-key,X-Amz-Security-Token',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'OPTIONS,POST,GET',
-                'Access-Control-Allow-Credentials': True,
-                'Content-Type': 'application/json'
-            },
-        }
-
-
-def error_payload(status_code, body):
-    return response_payload(status_code, {"error": body})
-
-
-def internal_error_payload(err, message=None):
-    body = "Internal Lambda function error: {}".format(err)
-    if message:
-        body = "{}\n{}".format(body, message)
-    return error_payload(500, body)
-
-
-def save_in_dynamodb(obj):
-    obj["last_modified"] = decimal.Decimal(str(time.time()))
-    table.put_item(Item=obj)
-    return True
+store = storage.get_game_store()
 
 
 def lambda_handler(event, context):
@@ -56,7 +23,7 @@ def lambda_handler(event, context):
             "history": []
         }
 
-        if save_in_dynamodb(empty_game):
+        if store.save_game(empty_game):
             return response_payload(200, {"game_uuid": game_uuid})
         raise(Exception("Something went wrong - ended up with no response"))
 
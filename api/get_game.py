@@ -1,140 +1,105 @@
-import uuid
-import boto3
-from boto3.dynamodb.conditions import Key
+import os
 import time
-import json
 import decimal
-
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table("games")
-
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, decimal.Decimal):
-            if obj.as_tuple().exponent == 0:
-                return int(obj)
-            return float(obj)
-        return super(DecimalEncoder, self).default(obj)
-
-
-def response_payload(status_code, body):
-    return {
-            'statusCode': status_code,
-            'body': json.dumps(body, cls=DecimalEncoder),
-            'headers': {
-                'Access-Control-Allow-Headers':'Content-Type,X-Amz-Date,Authorization,X-Api-Key,x-api-key,X-Amz-Security-Token',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'OPTIONS,POST,GET',
-                'Access-Control-Allow-Credentials': True,
-                'Content-Type': 'application/json'
-            },
-        }
-
-
-def error_payload(status_code, body):
-    return response_payload(status_code, {"error": body})
-
-
-def internal_error_payload(err, message=None):
-    body = "Internal Lambda function error: {}".format(err)
-    if message:
-        body = "{}\n{}".format(body, message)
-    return error_payload(500, body)
-
-
-def request_error_payload(request, message=None):
-    body = "Bad request payload: '{}'".format(request)
-    if message:
-        body = "{}\n{}".format(body, message)
-    return error_payload(400, body)
-
-
-def parameter_error_payload(param_key, param_value, message=None):
-    body = "Bad input value in '{}': {}".format(param_key, param_value)
-    if message:
-        body = "{}\n{}".format(body, message)
-    return error_payload(400, body)
+from collections import OrderedDict
+from blef_core import storage
+from blef_core.serialization import (
+    dumps,
+    make_etag,
+    get_header,
+    response_payload,
+    not_modified_payload,
+    immutable_response_payload,
+    internal_error_payload,
+    request_error_payload,
+    parameter_error_payload,
+    parse_event,
+    is_valid_uuid
+)
+from blef_core.rules import get_nickname_by_uuid
+from blef_core.censoring import censor_game
+
+store = storage.get_game_store()
+
+# Finished rounds and finished games never change, and everybody sees them the same way
+# (all hands revealed) - their encoded views are kept per container, least recently used
+# ones making way once there are IMMUTABLE_CACHE_SIZE of them
+IMMUTABLE_CACHE_SIZE = int(os.environ.get("immutable_cache_size", "256"))
+immutable_views = OrderedDict()
+
+
+def get_immutable_view(game_uuid, round):
+    """ (players, encoded view, ETag) of a cached immutable view, or None """
+    key = (game_uuid, round or None)
+    if key in immutable_views:
+        immutable_views.move_to_end(key)
+        return immutable_views[key]
+
+
+def cache_immutable_view(game_uuid, round, players, body, etag):
+    # Player UUIDs are kept only to authenticate requests served from the cache
+    players = [{"uuid": player["uuid"], "nickname": player["nickname"]} for player in players]
+    immutable_views[game_uuid, round or None] = (players, body, etag)
+    while len(immutable_views) > IMMUTABLE_CACHE_SIZE:
+        immutable_views.popitem(last=False)
+
+
+# The latest round_number read of each game, for as many games as there are cached views.
+# Rounds before it are certainly finished, so they are read from the round log alone -
+# any other round (most often the current one) is read from the live game first, along
+# with its log entry if the game is not known yet
+current_rounds = OrderedDict()
+
+
+def is_finished_round(game_uuid, round):
+    return bool(round) and round < current_rounds.get(game_uuid, 0)
+
+
+def remember_current_round(game_uuid, round_number):
+    current_rounds[game_uuid] = round_number
+    current_rounds.move_to_end(game_uuid)
+    while len(current_rounds) > IMMUTABLE_CACHE_SIZE:
+        current_rounds.popitem(last=False)
+
+
+# Long polls (since_last_modified and wait) re-check the game's last_modified every
+# LONG_POLL_INTERVAL seconds, for at most LONG_POLL_MAX_WAIT seconds
+LONG_POLL_MAX_WAIT = float(os.environ.get("long_poll_max_wait", "20"))
+LONG_POLL_INTERVAL = float(os.environ.get("long_poll_interval", "1"))
+
+
+def wait_for_change(game_uuid, since_last_modified, wait):
+    """
+        Whether the game changed after since_last_modified, checking again until it has
+        or `wait` seconds have passed - None if there is no such game. Checks only read
+        the game's last_modified.
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        last_modified = store.get_last_modified(game_uuid)
+        if last_modified is None:
+            return None
+        if last_modified > since_last_modified:
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(LONG_POLL_INTERVAL, remaining))
 
 
-def parse_event(event):
-    # Basic input validation
-    if not isinstance(event, dict):
-        return False
+def get_wait(body, context):
+    """ Seconds a long poll may wait: as asked for, up to LONG_POLL_MAX_WAIT and a second short of the Lambda timeout """
+    wait = float(body.get("wait") or 0)
+    if not wait >= 0:
+        raise ValueError(wait)
+    wait = min(wait, LONG_POLL_MAX_WAIT)
+    if hasattr(context, "get_remaining_time_in_millis"):
+        wait = min(wait, context.get_remaining_time_in_millis() / 1000 - 1)
+    return max(wait, 0)
 
-    # Handle both direct triggers and API Gateway
-    body = event.get("body", event)
-    if isinstance(body, str):
-        try:
-            body = json.loads(body)
-        except ValueError:
-            return None
-    path_params = event.get("pathParameters", {})
-    query_params = event.get("queryStringParameters", {})
-    body.update(path_params)
-    body.update(query_params)
-    return body
 
-
-def is_valid_uuid(value):
-    try:
-        uuid.UUID(str(value))
-        return True
-    except ValueError:
-        return False
-
-
-def get_player_by_nickname(players, nickname):
-    filtered_players = [p for p in players if p["nickname"] == nickname]
-    if filtered_players:
-        return filtered_players[0]
-
-
-def get_nickname_by_uuid(players, player_uuid):
-    filtered_players = [p for p in players if p["uuid"] == player_uuid]
-    if filtered_players:
-        return filtered_players[0]["nickname"]
-
-
-def is_active_player(players, nickname):
-    player = get_player_by_nickname(players, nickname)
-    if player:
-        return player["n_cards"] != 0
-    return False
-
-
-def get_revealed_hands(game, round, current_round, current_status, player_authenticated, player_nickname):
-    revealed_hands = []
-    if round < current_round or current_status == "Finished":
-        revealed_hands = [hand for hand in game["hands"] if is_active_player(game["players"], hand["nickname"])]
-    elif player_authenticated and round == current_round:
-        revealed_hands = [hand for hand in game["hands"] if is_active_player(game["players"], hand["nickname"]) and hand["nickname"] == player_nickname]
-    return revealed_hands
-
-
-def get_from_dynamodb(game_uuid):
-    response = table.query(KeyConditionExpression=Key('game_uuid').eq(game_uuid))
-    items = response.get("Items")
-    if len(items) == 1:
-        return items[0]
-    return None
-
-
-def update_in_dynamodb(game_uuid, public):
-    table.update_item(
-        Key={
-            'game_uuid': game_uuid
-        },
-        UpdateExpression="set last_modified = :last_modified, #game_public = :public",
-        ExpressionAttributeValues={
-            ':last_modified': decimal.Decimal(str(time.time())),
-            ':public': public
-        },
-        ExpressionAttributeNames={
-            '#game_public': "public"
-        },
-        ReturnValues="NONE"
-    )
-    return True
+def player_uuid_error(player_uuid):
+    return parameter_error_payload("player_uuid", player_uuid, message="The UUID does not match any active player")
 
 
 def lambda_handler(event, context):
@@ -147,12 +112,6 @@ def lambda_handler(event, context):
         if not is_valid_uuid(game_uuid):
             return parameter_error_payload("game_uuid", game_uuid, message="Invalid game UUID")
 
-        game = get_from_dynamodb(game_uuid)
-        if not game:
-            return parameter_error_payload("game_uuid", game_uuid, message="Game does not exist")
-
-        current_status = game.get("status")
-
         player_uuid = body.get("player_uuid")
 
         if player_uuid and not is_valid_uuid(player_uuid):
@@ -170,45 +129,89 @@ def lambda_handler(event, context):
 
         if round and round <= 0:
             return parameter_error_payload("round", round, message="The round parameter is invalid - must be an integer between 1 and the current round, or -1, or blank")
-        current_round = game["round_number"]
-        if round and current_round < round:
-            return parameter_error_payload("round", round, message="The game has not reached this round")
 
-        if round and (round != current_round or current_status != "Running"):
-            game = get_from_dynamodb(f"{game_uuid}_{round}")
+        since_last_modified = body.get("since_last_modified")
+        if since_last_modified is not None:
+            try:
+                since_last_modified = decimal.Decimal(str(since_last_modified))
+                wait = get_wait(body, context)
+            except (decimal.InvalidOperation, ValueError):
+                return parameter_error_payload("since_last_modified", since_last_modified,
+                                               message="since_last_modified and wait must be numbers")
+            if not since_last_modified.is_finite():
+                return parameter_error_payload("since_last_modified", since_last_modified)
+
+            changed = wait_for_change(game_uuid, since_last_modified, wait)
+            if changed is None:
+                return parameter_error_payload("game_uuid", game_uuid, message="Game does not exist")
+            if not changed:
+                return not_modified_payload()
+
+        if_none_match = get_header(event, "If-None-Match")
+        cached_view = get_immutable_view(game_uuid, round)
+        if cached_view:
+            players, encoded_view, etag = cached_view
+            if player_uuid and not get_nickname_by_uuid(players, player_uuid):
+                return player_uuid_error(player_uuid)
+            return immutable_response_payload(encoded_view, etag, if_none_match)
+
+        # A round known to be finished is served from its round log entry alone, in a single read
+        round_read = is_finished_round(game_uuid, round)
+        round_entry = store.get_round(game_uuid, round) if round_read else None
+        if round_entry and storage.is_self_contained(round_entry):
+            game = storage.rebuild_round_snapshot(None, round_entry)
+            # The round is over, so its hands are shown whatever the state of the live game
+            current_round = round + 1
+            current_status = game["status"]
+            immutable = True
         else:
-            round = current_round
+            if round and game_uuid not in current_rounds:
+                # Nothing is known of the game's progress yet, so the live game and the round's log entry come in one read
+                game, round_entry = store.get_game_and_round(game_uuid, round)
+                round_read = True
+            else:
+                game = store.get_game(game_uuid)
+            if not game:
+                return parameter_error_payload("game_uuid", game_uuid, message="Game does not exist")
+
+            current_status = game.get("status")
+            current_round = game["round_number"]
+            remember_current_round(game_uuid, current_round)
+            immutable = current_status == "Finished"
+            if round and current_round < round:
+                return parameter_error_payload("round", round, message="The game has not reached this round")
+
+            if round and (round != current_round or current_status != "Running"):
+                if not round_read:
+                    round_entry = store.get_round(game_uuid, round)
+                if round_entry:
+                    game = storage.rebuild_round_snapshot(game, round_entry)
+                else:
+                    # Rounds finished before the round log was introduced
+                    game = store.get_game(storage.round_snapshot_uuid(game_uuid, round))
+                if not game:
+                    return parameter_error_payload("round", round, message="The round has not finished")
+                immutable = True
 
         if player_uuid:
             player_nickname = get_nickname_by_uuid(game["players"], player_uuid)
             player_authenticated = bool(player_nickname)
             if not player_authenticated:
-                return parameter_error_payload("player_uuid", player_uuid, message="The UUID does not match any active player")
+                return player_uuid_error(player_uuid)
         else:
             player_authenticated = False
             player_nickname = ''
 
-        revealed_hands = get_revealed_hands(game, round, current_round, current_status, player_authenticated, player_nickname)
-
-        private_players = []
-        for player in game["players"]:
-            private_players.append({key: player[key] for key in player if key != "uuid"})
-
-        visible_game = {
-            "admin_nickname": game["admin_nickname"],
-            "public": game["public"],
-            "room": game["room"],
-            "status": game["status"],
-            "round_number": game["round_number"],
-            "max_cards": game["max_cards"],
-            "players": private_players,
-            "hands": revealed_hands,
-            "cp_nickname": game["cp_nickname"],
-            "history": game["history"],
-            "last_modified": game["last_modified"]
-        }
-
-        return response_payload(200, visible_game)
+        # Hands of past rounds are revealed according to the status of the live game
+        visible_game = censor_game(game, current_round, player_authenticated, player_nickname, current_status=current_status)
+
+        if not immutable:
+            return response_payload(200, visible_game)
+
+        encoded_view = dumps(visible_game)
+        etag = make_etag(encoded_view)
+        cache_immutable_view(game_uuid, round, game["players"], encoded_view, etag)
+        return immutable_response_payload(encoded_view, etag, if_none_match)
 
     except Exception as err:
         return internal_error_payload(err)
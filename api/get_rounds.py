@@ -0,0 +1,78 @@
+from blef_core import storage
+from blef_core.serialization import (
+    response_payload,
+    internal_error_payload,
+    request_error_payload,
+    parameter_error_payload,
+    parse_event,
+    is_valid_uuid
+)
+from blef_core.rules import get_nickname_by_uuid
+from blef_core.censoring import censor_game
+
+store = storage.get_game_store()
+
+
+def parse_round(body, key):
+    round = body.get(key)
+    if isinstance(round, str) and round.isdigit():
+        round = int(round)
+    if round is not None and (not isinstance(round, int) or round <= 0):
+        raise ValueError(key, round)
+    return round
+
+
+def lambda_handler(event, context):
+    try:
+        body = parse_event(event)
+        if not body:
+            return request_error_payload(event)
+
+        game_uuid = str(body.get("game_uuid"))
+        if not is_valid_uuid(game_uuid):
+            return parameter_error_payload("game_uuid", game_uuid, message="Invalid game UUID")
+
+        player_uuid = body.get("player_uuid")
+
+        if player_uuid and not is_valid_uuid(player_uuid):
+            return parameter_error_payload("player_uuid", player_uuid, message="Invalid player UUID")
+
+        try:
+            first_round = parse_round(body, "first_round") or 1
+            last_round = parse_round(body, "last_round")
+        except ValueError as err:
+            return parameter_error_payload(*err.args, message="Rounds must be positive integers")
+
+        if last_round is not None and last_round < first_round:
+            return parameter_error_payload("last_round", last_round, message="The last round cannot come before the first round")
+
+        # All the finished rounds asked for, in one query of the round log
+        round_entries = store.get_rounds(game_uuid, first_round, last_round)
+
+        # The live game is only needed to tell why there are no rounds,
+        # and to rebuild rounds logged before their entries held the players
+        game = None
+        if not round_entries or not all(map(storage.is_self_contained, round_entries)):
+            game = store.get_game(game_uuid)
+            if not game:
+                return parameter_error_payload("game_uuid", game_uuid, message="Game does not exist")
+
+        rounds = [storage.rebuild_round_snapshot(game, round_entry) for round_entry in round_entries]
+
+        if player_uuid:
+            players = rounds[0]["players"] if rounds else game["players"]
+            player_nickname = get_nickname_by_uuid(players, player_uuid)
+            player_authenticated = bool(player_nickname)
+            if not player_authenticated:
+                return parameter_error_payload("player_uuid", player_uuid, message="The UUID does not match any active player")
+        else:
+            player_authenticated = False
+            player_nickname = ''
+
+        # Every logged round is over, so all its hands are shown
+        visible_rounds = [censor_game(round, round["round_number"] + 1, player_authenticated, player_nickname) for round in rounds]
+
+        return response_payload(200, {"rounds": visible_rounds})
+
+    except Exception as err:
+        return internal_error_payload(err)
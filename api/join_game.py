@@ -1,104 +1,62 @@
 import uuid
-import boto3
-from boto3.dynamodb.conditions import Key
-import time
 import re
-import json
-import decimal
-
-
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table("games")
-
-
-def response_payload(status_code, body):
-    return {
-            'statusCode': status_code,
-            'body': json.dumps(body),
-            'headers': {
-                'Access-Control-Allow-Headers':'Content-Type,X-Amz-Date,Authorization,X-Api-Key,x-api-key,X-Amz-Security-Token',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'OPTIONS,POST,GET',
-                'Access-Control-Allow-Credentials': True,
-                'Content-Type': 'application/json'
-            },
-        }
-
+import time
+from random import uniform
+from blef_core import storage
+from blef_core.serialization import (
+    response_payload,
+    error_payload,
+    internal_error_payload,
+    request_error_payload,
+    parameter_error_payload,
+    parse_event,
+    is_valid_uuid
+)
 
-def error_payload(status_code, body):
-    return response_payload(status_code, {"error": body})
+store = storage.get_game_store()
 
+# Concurrent joins to the same game are retried from a fresh read this many times in total
+MAX_WRITE_ATTEMPTS = 8
+RETRY_DELAY = 0.02
 
-def internal_error_payload(err, message=None):
-    body = "Internal Lambda function error: {}".format(err)
-    if message:
-        body = "{}\n{}".format(body, message)
-    return error_payload(500, body)
 
+def join(game_uuid, body):
+    """ Read the game, add the player and write it back - raises ConflictError if the game changed in between """
+    game = store.get_game(game_uuid)
+    if not game:
+        return parameter_error_payload("game_uuid", game_uuid, message="Game does not exist")
 
-def request_error_payload(request, message=None):
-    body = "Bad request payload: '{}'".format(request)
-    if message:
-        body = "{}\n{}".format(body, message)
-    return error_payload(400, body)
+    if game.get("status") != "Not started":
+        return error_payload(403, "Game already started")
 
+    if len(game.get("players")) == 8:
+        return error_payload(403, "Game room full")
 
-def parameter_error_payload(param_key, param_value, message=None):
-    body = "Bad input value in '{}': {}".format(param_key, param_value)
-    if message:
-        body = "{}\n{}".format(body, message)
-    return error_payload(400, body)
+    nickname = body.get("nickname")
+    if not nickname:
+        return parameter_error_payload("nickname", nickname, message="Nickname missing - please supply it")
+    if not isinstance(nickname, str):
+        return parameter_error_payload("nickname", nickname, message="Nickname invalid")
+    if not re.match("^[a-zA-Z]\w*$", nickname):
+        return parameter_error_payload("nickname", nickname, message="Nickname must start with a letter and only contain alphanumeric characters")
 
+    players = game.get("players")
+    if nickname in [p["nickname"] for p in players]:
+        return parameter_error_payload("nickname", nickname, message="Nickname already taken")
 
-def parse_event(event):
-    # Basic input validation
-    if not isinstance(event, dict):
-        return False
+    player_uuid = str(uuid.uuid4())
+    player = {"uuid": player_uuid, "nickname": nickname, "n_cards": 0}
+    players.append(player)
 
-    # Handle both direct triggers and API Gateway
-    body = event.get("body", event)
-    if isinstance(body, str):
-        try:
-            body = json.loads(body)
-        except ValueError:
-            return None
-    path_params = event.get("pathParameters", {})
-    query_params = event.get("queryStringParameters", {})
-    body.update(path_params)
-    body.update(query_params)
-    return body
+    admin_nickname = game.get("admin_nickname")
+    if len(players) == 1:
+        admin_nickname = nickname
 
+    store.update_game(game_uuid, {"players": players, "admin_nickname": admin_nickname},
+                      expected_version=storage.game_version(game))
 
-def is_valid_uuid(value):
-    try:
-        uuid.UUID(str(value))
-        return True
-    except ValueError:
-        return False
-
-
-def get_from_dynamodb(game_uuid):
-    response = table.query(KeyConditionExpression=Key('game_uuid').eq(game_uuid))
-    items = response.get("Items")
-    if len(items) == 1:
-        return items[0]
-    return None
-
-
-def update_in_dynamodb(game_uuid, players, admin_nickname):
-    table.update_item(
-        Key={
-            'game_uuid': game_uuid
-        },
-        UpdateExpression="set players = :players, last_modified = :last_modified, admin_nickname = :admin_nickname",
-        ExpressionAttributeValues={
-            ':players': players,
-            ':last_modified': decimal.Decimal(str(time.time())),
-            ':admin_nickname': admin_nickname
-        },
-        ReturnValues="NONE"
-    )
-    return True
+    response = {"player_uuid": player_uuid}
+    return response_payload(200, response)
 
 
 def lambda_handler(event, context):
@@ -111,40 +69,14 @@ def lambda_handler(event, context):
         if not is_valid_uuid(game_uuid):
             return parameter_error_payload("game_uuid", game_uuid, message="Invalid game UUID")
 
-        game = get_from_dynamodb(game_uuid)
-        if not game:
-            return parameter_error_payload("game_uuid", game_uuid, message="Game does not exist")
-
-        if game.get("status") != "Not started":
-            return error_payload(403, "Game already started")
-
-        if len(game.get("players")) == 8:
-            return error_payload(403, "Game room full")
-
-        nickname = body.get("nickname")
-        if not nickname:
-            return parameter_error_payload("nickname", nickname, message="Nickname missing - please supply it")
-        if not isinstance(nickname, str):
-            return parameter_error_payload("nickname", nickname, message="Nickname invalid")
-        if not re.match("^[a-zA-Z]\w*$", nickname):
-            return parameter_error_payload("nickname", nickname, message="Nickname must start with a letter and only contain alphanumeric characters")
-
-        players = game.get("players")
-        if nickname in [p["nickname"] for p in players]:
-            return parameter_error_payload("nickname", nickname, message="Nickname already taken")
-
-        player_uuid = str(uuid.uuid4())
-        player = {"uuid": player_uuid, "nickname": nickname, "n_cards": 0}
-        players.append(player)
-
-        admin_nickname = game.get("admin_nickname")
-        if len(players) == 1:
-            admin_nickname = nickname
-
-        update_in_dynamodb(game_uuid, players, admin_nickname)
+        for attempt in range(MAX_WRITE_ATTEMPTS):
+            try:
+                return join(game_uuid, body)
+            except storage.ConflictError:
+                # Another player joined first - back off briefly and join the new player list
+                time.sleep(uniform(0, RETRY_DELAY * (attempt + 1)))
 
-        response = {"player_uuid": player_uuid}
-        return response_payload(200, response)
+        return error_payload(409, "The game was changed by another request - please try again")
 
     except Exception as err:
         return internal_error_payload(err)
@@ -1,105 +1,39 @@
-import uuid
-import boto3
-from boto3.dynamodb.conditions import Key
-import time
-import json
-from itertools import islice, product
-import decimal
+from blef_core import storage
+from blef_core.serialization import (
+    response_payload,
+    error_payload,
+    internal_error_payload,
+    request_error_payload,
+    parameter_error_payload,
+    parse_event,
+    is_valid_uuid
+)
 
+store = storage.get_game_store()
 
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table("games")
+# Everything the refusal messages need - the game is only read when the change is refused
+GAME_ATTRIBUTES = ("status", "admin_nickname", "players", "public")
 
-def response_payload(status_code, body):
-    return {
-            'statusCode': status_code,
-            'body': json.dumps(body),
-            'headers': {
-                'Access-Control-Allow-Headers':'Content-Type,X-Amz-Date,Authorization,X-Api-Key,x-api-key,X-Amz-Security-Token',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'OPTIONS,POST,GET',
-                'Access-Control-Allow-Credentials': True,
-                'Content-Type': 'application/json'
-            },
-        }
 
+def refusal_payload(game_uuid, admin_uuid):
+    """ Why the conditional write was refused, from a read of the game made afterwards """
+    game = store.get_game(game_uuid, GAME_ATTRIBUTES)
+    if not game:
+        return parameter_error_payload("game_uuid", game_uuid, message="Game does not exist")
 
-def error_payload(status_code, body):
-    return response_payload(status_code, {"error": body})
+    if game.get("status") != "Not started":
+        return error_payload(403, "Cannot make the change - game already started")
 
+    players = game.get("players")
+    game_admin_uuid = [player["uuid"] for player in players if player["nickname"] == game.get("admin_nickname")][0]
+    if game_admin_uuid != admin_uuid:
+        return parameter_error_payload("admin_uuid", admin_uuid, message="Admin UUID does not match")
 
-def internal_error_payload(err, message=None):
-    body = "Internal Lambda function error: {}".format(err)
-    if message:
-        body = "{}\n{}".format(body, message)
-    return error_payload(500, body)
+    if game.get("public") == "false":
+        return response_payload(200, {"message": "Request redundant - game already private"})
 
-
-def request_error_payload(request, message=None):
-    body = "Bad request payload: '{}'".format(request)
-    if message:
-        body = "{}\n{}".format(body, message)
-    return error_payload(400, body)
-
-
-def parameter_error_payload(param_key, param_value, message=None):
-    body = "Bad input value in '{}': {}".format(param_key, param_value)
-    if message:
-        body = "{}\n{}".format(body, message)
-    return error_payload(400, body)
-
-
-def parse_event(event):
-    # Basic input validation
-    if not isinstance(event, dict):
-        return False
-
-    # Handle both direct triggers and API Gateway
-    body = event.get("body", event)
-    if isinstance(body, str):
-        try:
-            body = json.loads(body)
-        except ValueError:
-            return None
-    path_params = event.get("pathParameters", {})
-    query_params = event.get("queryStringParameters", {})
-    body.update(path_params)
-    body.update(query_params)
-    return body
-
-
-def is_valid_uuid(value):
-    try:
-        uuid.UUID(str(value))
-        return True
-    except ValueError:
-        return False
-
-
-def get_from_dynamodb(game_uuid):
-    response = table.query(KeyConditionExpression=Key('game_uuid').eq(game_uuid))
-    items = response.get("Items")
-    if len(items) == 1:
-        return items[0]
-    return None
-
-
-def update_in_dynamodb(game_uuid, public):
-    table.update_item(
-        Key={
-            'game_uuid': game_uuid
-        },
-        UpdateExpression="set last_modified = :last_modified, #game_public = :public",
-        ExpressionAttributeValues={
-            ':last_modified': decimal.Decimal(str(time.time())),
-            ':public': public
-        },
-        ExpressionAttributeNames={
-            '#game_public': "public"
-        },
-        ReturnValues="NONE"
-    )
-    return True
+    # Made public again between the write and the read
+    return error_payload(409, "The game was changed by another request - please try again")
 
 
 def lambda_handler(event, context):
@@ -112,13 +46,6 @@ def lambda_handler(event, context):
         if not is_valid_uuid(game_uuid):
             return parameter_error_payload("game_uuid", game_uuid, message="Invalid game UUID")
 
-        game = get_from_dynamodb(game_uuid)
-        if not game:
-            return parameter_error_payload("game_uuid", game_uuid, message="Game does not exist")
-
-        if game.get("status") != "Not started":
-            return error_payload(403, "Cannot make the change - game already started")
-
         admin_uuid = str(body.get("admin_uuid"))
 
         if not admin_uuid:
@@ -127,17 +54,13 @@ def lambda_handler(event, context):
         if not is_valid_uuid(admin_uuid):
             return parameter_error_payload("admin_uuid", admin_uuid, message="Invalid admin UUID")
 
-        players = game.get("players")
-        game_admin_uuid = [player["uuid"] for player in players if player["nickname"] == game.get("admin_nickname")][0]
-        if game_admin_uuid != admin_uuid:
-            return parameter_error_payload("admin_uuid", admin_uuid, message="Admin UUID does not match")
-
-        if game.get("public") == "false":
-            return response_payload(200, {"message": "Request redundant - game already private"})
-
         public = "false"
 
-        update_in_dynamodb(game_uuid, public)
+        # The store checks the game is yet to start, admin_uuid is its admin's and it is not private already
+        try:
+            store.update_as_admin(game_uuid, {"public": public}, admin_uuid)
+        except storage.ConflictError:
+            return refusal_payload(game_uuid, admin_uuid)
 
         return response_payload(200, {"message": "Game made private"})
 
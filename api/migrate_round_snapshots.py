@@ -0,0 +1,57 @@
+"""
+    Move "<game_uuid>_<round>" snapshot items from the games table into the round log
+
+    get_game falls back to the old snapshot items, so this can run at any time after
+    the round log is deployed. Entries already in the log are left alone.
+
+    Usage: python migrate_round_snapshots.py [--delete]
+"""
+import argparse
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+from blef_core import storage
+
+
+def find_snapshots(table):
+    kwargs = {"FilterExpression": Attr('game_uuid').size().gt(36)}
+    while True:
+        response = table.scan(**kwargs)
+        yield from response.get("Items", [])
+        if "LastEvaluatedKey" not in response:
+            return
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def migrate_snapshot(store, snapshot):
+    """ Returns False if the round was already in the log """
+    game_uuid, _, _ = snapshot["game_uuid"].partition("_")
+    round_entry = storage.make_round_entry(dict(snapshot, game_uuid=game_uuid))
+    round_entry["last_modified"] = snapshot["last_modified"]
+    try:
+        store.rounds_table.put_item(Item=round_entry, ConditionExpression="attribute_not_exists(round_number)")
+    except ClientError as err:
+        if err.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return False
+        raise
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move round snapshots into the round log")
+    parser.add_argument("--delete", action="store_true", help="Delete each snapshot item once it is in the round log")
+    args = parser.parse_args(argv)
+
+    store = storage.DynamoDBGameStore()
+    migrated = skipped = 0
+    for snapshot in find_snapshots(store.table):
+        if migrate_snapshot(store, snapshot):
+            migrated += 1
+        else:
+            skipped += 1
+        if args.delete:
+            store.table.delete_item(Key={'game_uuid': snapshot["game_uuid"]})
+    print(f"Migrated {migrated} rounds, {skipped} already in the round log")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+    Cold-start import cost of blef_core and of the handlers built on it.
+
+    Every module is imported in a fresh interpreter, as in a new Lambda
+    container, and the import alone is timed. Handlers run against the
+    in-memory store so that no AWS client is created.
+
+    Usage: python api/test/benchmarks/bench_cold_start.py [runs]
+"""
+import os
+import sys
+import json
+import statistics
+import subprocess
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODULES = (
+    "blef_core.serialization",
+    "blef_core.censoring",
+    "blef_core.rules",
+    "blef_core.storage",
+    "create_game",
+    "join_game",
+    "start_game",
+    "play",
+    "get_game",
+)
+
+IMPORT_SCRIPT = """
+import sys, time, json, importlib
+if sys.argv[2] == "0":
+    # Lambda runtimes ship without NumPy - hide it to measure what they pay
+    sys.modules["numpy"] = None
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+print(json.dumps(time.perf_counter() - start))
+"""
+
+
+def import_seconds(module, numpy=True):
+    env = dict(os.environ, game_store="memory")
+    command = [sys.executable, "-c", IMPORT_SCRIPT, module, str(int(numpy))]
+    output = subprocess.run(command, cwd=API_DIR, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+
+def main(runs=5):
+    print(f"{'module':<26}{'no numpy':>12}{'with numpy':>12}   (median of {runs} fresh imports, ms)")
+    for module in MODULES:
+        without_numpy = statistics.median(import_seconds(module, numpy=False) for _ in range(runs))
+        with_numpy = statistics.median(import_seconds(module) for _ in range(runs))
+        print(f"{module:<26}{without_numpy * 1e3:12.1f}{with_numpy * 1e3:12.1f}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,104 @@
+"""
+    Read cost of the admin and watcher endpoints: the whole game item (before)
+    vs the attributes each endpoint projects (after), for a game in the lobby
+    and for the largest running game seen over simulated games - the item the
+    endpoints read when they reject a late request, or admit a watcher.
+    make_public and make_private are a single conditional write and only read
+    the game when the write is refused, to say why.
+
+    For each endpoint this reports the bytes returned, the time boto3 takes to
+    deserialize them, and the DynamoDB read units. DynamoDB charges reads by the
+    size of the whole item, projected or not, so the read units stay the same:
+    the saving is in transfer and deserialization.
+
+    Usage: python api/test/benchmarks/bench_projected_reads.py [n_games] [n_players]
+"""
+import os
+import sys
+import json
+import math
+import time
+import importlib
+
+TEST_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.dirname(TEST_DIR), TEST_DIR]
+
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+
+import blef_headless
+from blef_core import storage
+
+os.environ.setdefault("game_store", "memory")
+os.environ.setdefault("agent_mapping", "{}")
+ENDPOINTS = {name: importlib.import_module(name).GAME_ATTRIBUTES
+             for name in ("make_public", "make_private", "start_game", "invite-aiagent")}
+ENDPOINTS["watch-game-connect"] = ("players",)
+
+serializer = TypeSerializer()
+deserializer = TypeDeserializer()
+
+
+def wire_item(item):
+    """ The item the way DynamoDB returns it """
+    return {key: serializer.serialize(value) for key, value in item.items()}
+
+
+def wire_size(item):
+    return len(json.dumps(wire_item(item), separators=(",", ":")))
+
+
+def read_units(item):
+    """ Eventually consistent reads, as get_item and query make by default """
+    return math.ceil(len(json.dumps(item, default=str).encode()) / 4096) / 2
+
+
+def deserialize_time(item, repeat=2000):
+    wire = wire_item(item)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        {key: deserializer.deserialize(value) for key, value in wire.items()}
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+class LargestGameStore(storage.InMemoryGameStore):
+    """ Keeps the largest running game seen after a bet """
+
+    def __init__(self):
+        super().__init__()
+        self.largest = None
+
+    def append_bet(self, game_uuid, *args, **kwargs):
+        result = super().append_bet(game_uuid, *args, **kwargs)
+        game = self.get_game(game_uuid)
+        if self.largest is None or wire_size(game) > wire_size(self.largest):
+            self.largest = game
+        return result
+
+
+def lobby_game(n_players):
+    store = storage.InMemoryGameStore()
+    handlers = blef_headless.load_handlers(store)
+    game_uuid = blef_headless.call(handlers["create_game"])["game_uuid"]
+    for i in range(n_players):
+        blef_headless.call(handlers["join_game"], game_uuid=game_uuid, nickname=f"player{i}")
+    return store.get_game(game_uuid)
+
+
+def report(label, game):
+    print(f"{label}: {wire_size(game)} bytes, {read_units(game)} RCU per read")
+    print(f"  {'endpoint':20} {'bytes before':>12} {'after':>7} {'deserialize before':>19} {'after':>8} {'RCU':>5}")
+    for name, attributes in ENDPOINTS.items():
+        projected = {key: game[key] for key in ("game_uuid", *attributes) if key in game}
+        print(f"  {name:20} {wire_size(game):12} {wire_size(projected):7} "
+              f"{deserialize_time(game):16.1f} us {deserialize_time(projected):5.1f} us {read_units(game):5}")
+
+
+def main(n_games=50, n_players=8):
+    store = LargestGameStore()
+    blef_headless.simulate(n_games, n_players, seed=0, store=store)
+    report(f"lobby game ({n_players} players)", lobby_game(n_players))
+    report(f"largest running game ({n_games} games of {n_players} players)", store.largest)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,74 @@
+"""
+    Bytes written per finished round: full snapshot + full overwrite (before)
+    vs round log entry + attribute update (after), and bytes written per bet:
+    the whole history (before) vs the appended entry (after), over simulated games.
+
+    Item sizes are measured as compact JSON, a close proxy for DynamoDB item size.
+
+    Usage: python api/test/benchmarks/bench_round_writes.py [n_games] [n_players]
+"""
+import os
+import sys
+import json
+
+TEST_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.dirname(TEST_DIR), TEST_DIR]
+
+import blef_headless
+from blef_core import serialization, storage
+
+
+def item_size(item):
+    return len(json.dumps(item, cls=serialization.DecimalEncoder, separators=(",", ":")))
+
+
+class RecordingStore(storage.InMemoryGameStore):
+    """ Counts bytes of round transitions as written now and as the old snapshot + put_item wrote them """
+
+    def __init__(self):
+        super().__init__()
+        self.rounds_finished = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+        self.bets = 0
+        self.bet_bytes_before = 0
+        self.bet_bytes_after = 0
+
+    def finish_round(self, round_entry, attributes, expected_version=None):
+        super().finish_round(round_entry, attributes, expected_version)
+        live_game = self.get_game(round_entry["game_uuid"])
+        self.bytes_before += item_size(storage.rebuild_round_snapshot(live_game, round_entry))
+        self.bytes_after += item_size(round_entry)
+        self.bytes_before += item_size(live_game)
+        self.bytes_after += item_size(dict(attributes, game_uuid=live_game["game_uuid"], last_modified=storage.timestamp()))
+        self.rounds_finished += 1
+        return True
+
+    def append_bet(self, game_uuid, bet, cp_nickname, expected_history_length, expected_cp_nickname):
+        super().append_bet(game_uuid, bet, cp_nickname, expected_history_length, expected_cp_nickname)
+        history = self.get_game(game_uuid)["history"]
+        self.bet_bytes_before += item_size({"cp_nickname": cp_nickname, "history": history})
+        self.bet_bytes_after += item_size({"cp_nickname": cp_nickname, "history": [bet]})
+        self.bets += 1
+        return True
+
+
+def main(n_games=200, n_players=8):
+    store = RecordingStore()
+    blef_headless.simulate(n_games, n_players, seed=0, store=store)
+    before = store.bytes_before / store.rounds_finished
+    after = store.bytes_after / store.rounds_finished
+    print(f"rounds finished:     {store.rounds_finished} ({n_games} games of {n_players} players)")
+    print(f"before (2 full puts): {before:8.0f} bytes/round")
+    print(f"after (log + update): {after:8.0f} bytes/round")
+    print(f"reduction:            {1 - after / before:8.1%}")
+    bet_before = store.bet_bytes_before / store.bets
+    bet_after = store.bet_bytes_after / store.bets
+    print(f"bets:                 {store.bets}")
+    print(f"before (full history): {bet_before:7.0f} bytes/bet")
+    print(f"after (list_append):   {bet_after:7.0f} bytes/bet")
+    print(f"reduction:            {1 - bet_after / bet_before:8.1%}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,60 @@
+"""
+    Micro-benchmark: legacy set existence check vs the compiled blef_core.rules table,
+    plus all-88-sets evaluation per pool and in NumPy batches
+
+    Usage: python api/test/benchmarks/bench_set_existence.py [n_pools]
+"""
+import os
+import sys
+import random
+import timeit
+from itertools import product
+
+TEST_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.dirname(TEST_DIR), TEST_DIR]
+
+from blef_core import rules
+import legacy_rules
+
+DECK = [{"value": value, "colour": colour} for value, colour in product(range(6), range(4))]
+
+
+def make_pools(n_pools, seed=0):
+    rng = random.Random(seed)
+    return [(rng.sample(DECK, rng.randint(2, 24)), rng.randrange(88)) for _ in range(n_pools)]
+
+
+def run_legacy(pools):
+    for cards, action_id in pools:
+        legacy_rules.determine_set_existence(cards, action_id)
+
+
+def run_compiled(pools):
+    for cards, action_id in pools:
+        rules.set_exists(cards, action_id)
+
+
+def run_all_sets(pools):
+    for cards, _ in pools:
+        rules.evaluate_all_sets(cards)
+
+
+def main(n_pools=20000):
+    pools = make_pools(n_pools)
+    legacy = min(timeit.repeat(lambda: run_legacy(pools), number=1, repeat=3))
+    compiled = min(timeit.repeat(lambda: run_compiled(pools), number=1, repeat=3))
+    print(f"pools checked:  {n_pools}")
+    print(f"legacy:         {legacy / n_pools * 1e6:8.2f} us/check")
+    print(f"blef_core:      {compiled / n_pools * 1e6:8.2f} us/check")
+    print(f"speedup:        {legacy / compiled:8.1f}x")
+
+    all_sets = min(timeit.repeat(lambda: run_all_sets(pools), number=1, repeat=3))
+    print(f"all 88 sets:    {all_sets / n_pools * 1e6:8.2f} us/pool")
+    if rules.np is not None:
+        presence = rules.cards_to_presence([cards for cards, _ in pools] * 50)
+        batch = min(timeit.repeat(lambda: rules.evaluate_all_sets(presence), number=1, repeat=3))
+        print(f"all 88, batch:  {batch / len(presence) * 1e6:8.2f} us/pool ({len(presence)} pools per call)")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
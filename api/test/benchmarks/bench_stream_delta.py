@@ -0,0 +1,49 @@
+"""
+    Bytes sent to one spectator and one player for a bet, with full game states
+    and with the delta protocol, as the round's history grows.
+
+    Usage: python api/test/benchmarks/bench_stream_delta.py
+"""
+import os
+import sys
+
+TEST_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.dirname(TEST_DIR), TEST_DIR, os.path.join(TEST_DIR, "unit_tests")]
+
+import pytest
+from fake_aws import FakeAWS
+from test_watch_game_stream import GAME_UUID, make_game, stream_record
+
+HISTORY_LENGTHS = (1, 10, 40, 80)
+PLAYERS = [{"uuid": f"u{i}", "nickname": f"player{i}", "n_cards": 4} for i in range(4)]
+HANDS = [{"nickname": f"player{i}", "hand": [{"value": value, "colour": i} for value in range(4)]} for i in range(4)]
+
+
+def game_after(n_bets):
+    history = [{"player": f"player{i % 4}", "action_id": i} for i in range(n_bets)]
+    return make_game(players=PLAYERS, hands=HANDS, history=history, cp_nickname=f"player{n_bets % 4}",
+                     version=n_bets + 1, last_modified=1639000000 + n_bets, max_cards=11, round_number=4)
+
+
+def main():
+    monkeypatch = pytest.MonkeyPatch()
+    aws = FakeAWS(monkeypatch)
+    stream = aws.import_handler("watch-game-stream")
+    aws.table("watch_game_websocket_manager").items = [
+        {"connection_id": "spectator", "game_uuid": GAME_UUID, "player_uuid": ""},
+        {"connection_id": "player", "game_uuid": GAME_UUID, "player_uuid": "u1"},
+        {"connection_id": "delta-spectator", "game_uuid": GAME_UUID, "player_uuid": "", "protocol": "delta", "synced": True},
+        {"connection_id": "delta-player", "game_uuid": GAME_UUID, "player_uuid": "u1", "protocol": "delta", "synced": True},
+    ]
+
+    print(f"{'history':>8}{'spectator':>12}{'delta':>8}{'player':>10}{'delta':>8}   (bytes per bet)")
+    for n_bets in HISTORY_LENGTHS:
+        aws.apigatewaymanagementapi.posts.clear()
+        stream.lambda_handler({"Records": [stream_record(game_after(n_bets), old=game_after(n_bets - 1))]}, None)
+        sizes = {connection_id: len(data) for connection_id, data in aws.apigatewaymanagementapi.posts}
+        print(f"{n_bets:>8}{sizes['spectator']:>12}{sizes['delta-spectator']:>8}{sizes['player']:>10}{sizes['delta-player']:>8}")
+    monkeypatch.undo()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+    CPU time per stream record against the number of watchers of a game:
+    censoring and encoding per connection (before) vs once per distinct view (after).
+
+    The stream handler runs against in-process fakes of the AWS clients, so only
+    the handler's own work is measured. Half the watchers' views are duplicates
+    of a spectator view, and there are 8 players.
+
+    Usage: python api/test/benchmarks/bench_stream_fanout.py [records]
+"""
+import os
+import sys
+import time
+
+TEST_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.dirname(TEST_DIR), TEST_DIR]
+
+import pytest
+from fake_aws import FakeAWS
+
+WATCHER_COUNTS = (1, 10, 100, 1000)
+
+
+def make_game(n_players=8, n_bets=12):
+    players = [{"uuid": f"u{i}", "nickname": f"player{i}", "n_cards": 2} for i in range(n_players)]
+    return {
+        "game_uuid": "8e3f2b0c-4a1d-4f7e-9a55-2c1f6a9b0d11", "admin_nickname": "player0", "public": "false",
+        "room": 3, "status": "Running", "round_number": 4, "max_cards": 3, "cp_nickname": "player0",
+        "last_modified": 1639000000.123,
+        "history": [{"player": f"player{i % n_players}", "action_id": i} for i in range(n_bets)],
+        "players": players,
+        "hands": [{"nickname": p["nickname"], "hand": [{"value": 1, "colour": 2}, {"value": 4, "colour": 0}]} for p in players]
+    }
+
+
+def add_watchers(aws, game, n_watchers):
+    table = aws.table("watch_game_websocket_manager")
+    table.items = [
+        {"connection_id": f"c{i}", "game_uuid": game["game_uuid"],
+         "player_uuid": game["players"][i % len(game["players"])]["uuid"] if i % 2 else ""}
+        for i in range(n_watchers)
+    ]
+
+
+def update_per_connection(stream, game):
+    """ The handler's previous loop: censor and encode for every connection """
+    connected_players = stream.find_connected_players(game)
+    posts = []
+    for connection in connected_players:
+        connection_id = connection["connection_id"]
+        player_nickname = stream.get_nickname_by_uuid(game["players"], connection.get("player_uuid"))
+        current_round = game["round_number"] + 1 if any(str(val["action_id"]) == "89" for val in game.get("history")) else game["round_number"]
+        visible_game = stream.censor_game(game, current_round, bool(player_nickname), player_nickname)
+        posts.append((connection_id, stream.encode_message(visible_game)))
+    return stream.post_to_connections(posts)
+
+
+def cpu_per_record(update, stream, game, n_records):
+    start = time.process_time()
+    for _ in range(n_records):
+        update(game)
+    return (time.process_time() - start) / n_records
+
+
+def main(n_records=20):
+    monkeypatch = pytest.MonkeyPatch()
+    aws = FakeAWS(monkeypatch)
+    stream = aws.import_handler("watch-game-stream")
+    from blef_core.rules import get_nickname_by_uuid
+    stream.get_nickname_by_uuid = get_nickname_by_uuid
+    game = make_game()
+
+    print(f"{'watchers':>8}{'before':>14}{'after':>14}   (CPU ms per record, {n_records} records)")
+    for n_watchers in WATCHER_COUNTS:
+        add_watchers(aws, game, n_watchers)
+        before = cpu_per_record(lambda game: update_per_connection(stream, game), stream, game, n_records)
+        after = cpu_per_record(stream.update_game_watchers, stream, game, n_records)
+        print(f"{n_watchers:>8}{before * 1e3:14.2f}{after * 1e3:14.2f}")
+    monkeypatch.undo()
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,53 @@
+"""
+    Cold start and per-record latency of the stream handler, with every AWS call
+    taking a fixed round trip, and the number of control-plane lookups it makes
+    (apigatewayv2.get_api, sqs.get_queue_url).
+
+    Each record is an AI player's turn in a game with one watcher, so it is
+    posted to one connection and queued for the AI agent.
+
+    Usage: python api/test/benchmarks/bench_stream_resources.py [records] [round_trip_ms]
+"""
+import os
+import sys
+import time
+import statistics
+
+TEST_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.dirname(TEST_DIR), TEST_DIR, os.path.join(TEST_DIR, "unit_tests")]
+
+import pytest
+from fake_aws import FakeAWS
+from test_watch_game_stream import make_game, stream_record, add_watchers
+
+
+def main(n_records=50, round_trip_ms=20):
+    monkeypatch = pytest.MonkeyPatch()
+    aws = FakeAWS(monkeypatch)
+    round_trip = round_trip_ms / 1e3
+    aws.apigatewayv2.delay = aws.sqs.delay = aws.apigatewaymanagementapi.delay = round_trip
+
+    start = time.perf_counter()
+    stream = aws.import_handler("watch-game-stream")
+    import_seconds = time.perf_counter() - start
+
+    add_watchers(aws, 0, players=("u2",))
+    players = [{"uuid": "u1", "nickname": "a", "n_cards": 1, "ai_agent": "random"}, {"uuid": "u2", "nickname": "b", "n_cards": 1}]
+    event = {"Records": [stream_record(make_game(players=players))]}
+    latencies = []
+    for _ in range(n_records):
+        start = time.perf_counter()
+        stream.lambda_handler(event, None)
+        latencies.append(time.perf_counter() - start)
+    monkeypatch.undo()
+
+    print(f"AWS round trip:           {round_trip_ms} ms")
+    print(f"import (cold start):      {import_seconds * 1e3:8.1f} ms")
+    print(f"first record:             {latencies[0] * 1e3:8.1f} ms")
+    print(f"later records (median):   {statistics.median(latencies[1:]) * 1e3:8.1f} ms")
+    print(f"get_api calls:            {aws.apigatewayv2.calls}")
+    print(f"get_queue_url calls:      {aws.sqs.url_lookups} for {n_records} records")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,241 @@
+"""
+    In-process stand-ins for the AWS clients used by the websocket and stream
+    handlers, so that the handler modules can be imported and driven in unit tests.
+"""
+import sys
+import time
+import threading
+import importlib
+
+import boto3
+from botocore.exceptions import ClientError
+
+from blef_core import storage
+
+
+def condition_terms(condition):
+    """ (attribute, value) pairs of a boto3 condition built from eq() and & """
+    expression = condition.get_expression()
+    if expression["operator"] == "AND":
+        return [term for part in expression["values"] for term in condition_terms(part)]
+    attribute, value = expression["values"]
+    return [(attribute.name, value)]
+
+
+class FakeTable:
+
+    def __init__(self, name, key="game_uuid"):
+        self.name = name
+        self.key = key
+        self.items = []
+        self.calls = []
+        self.lock = threading.Lock()
+        # Queries return at most page_size items per page, like DynamoDB's 1 MB limit
+        self.page_size = None
+
+    def query(self, KeyConditionExpression, ExclusiveStartKey=None, **kwargs):
+        self.calls.append(("query", kwargs))
+        terms = condition_terms(KeyConditionExpression)
+        items = [item for item in self.items if all(item.get(name) == value for name, value in terms)]
+        start = ExclusiveStartKey["offset"] if ExclusiveStartKey else 0
+        end = start + self.page_size if self.page_size else len(items)
+        response = {"Items": [dict(item) for item in items[start:end]]}
+        if end < len(items):
+            response["LastEvaluatedKey"] = {"offset": end}
+        return response
+
+    def get_item(self, Key, ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        self.calls.append(("get_item", dict(kwargs, ProjectionExpression=ProjectionExpression)))
+        item = next((item for item in self.items if item[self.key] == Key[self.key]), None)
+        if item is None:
+            return {}
+        if ProjectionExpression:
+            names = [(ExpressionAttributeNames or {}).get(name.strip(), name.strip()) for name in ProjectionExpression.split(",")]
+            item = {name: item[name] for name in names if name in item}
+        return {"Item": dict(item)}
+
+    def scan(self, **kwargs):
+        self.calls.append(("scan", kwargs))
+        return {"Items": [dict(item) for item in self.items]}
+
+    def put_item(self, Item, **kwargs):
+        self.calls.append(("put_item", kwargs))
+        with self.lock:
+            self.items = [item for item in self.items if item[self.key] != Item[self.key]]
+            self.items.append(dict(Item))
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues, **kwargs):
+        """ Only plain "SET a = :a, ..." updates of existing items """
+        self.calls.append(("update_item", kwargs))
+        with self.lock:
+            item = next((item for item in self.items if item[self.key] == Key[self.key]), None)
+            if item is None:
+                raise ClientError({"Error": {"Code": "ConditionalCheckFailedException", "Message": "Missing"}}, "UpdateItem")
+            for assignment in UpdateExpression[len("SET "):].split(","):
+                name, value = (part.strip() for part in assignment.split("="))
+                item[name] = ExpressionAttributeValues[value]
+
+    def delete_item(self, Key, **kwargs):
+        self.calls.append(("delete_item", kwargs))
+        with self.lock:
+            self.items = [item for item in self.items if item[self.key] != Key[self.key]]
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return FakeBatchWriter(self)
+
+
+class FakeBatchWriter:
+    """ Buffers deletes and applies them when the context exits, as one batch """
+
+    def __init__(self, table):
+        self.table = table
+        self.keys = []
+
+    def __enter__(self):
+        return self
+
+    def delete_item(self, Key):
+        self.keys.append(Key)
+
+    def __exit__(self, *exc_info):
+        if not self.keys:
+            return
+        deleted = {key[self.table.key] for key in self.keys}
+        self.table.calls.append(("batch_write_item", {"deletes": len(self.keys)}))
+        with self.table.lock:
+            self.table.items = [item for item in self.table.items if item[self.table.key] not in deleted]
+
+
+class FakeDynamoDB:
+
+    def __init__(self):
+        self.tables = {}
+
+    def Table(self, name):
+        return self.tables.setdefault(name, FakeTable(name, key="connection_id" if "websocket" in name else "game_uuid"))
+
+
+class FakeApiGatewayManagement:
+    """ Records posts; connections in `gone` raise GoneException, posts take `delay` seconds """
+
+    def __init__(self):
+        self.posts = []
+        self.gone = set()
+        self.delay = 0
+        self.lock = threading.Lock()
+
+    def post_to_connection(self, Data, ConnectionId):
+        time.sleep(self.delay)
+        if ConnectionId in self.gone:
+            raise ClientError({"Error": {"Code": "GoneException", "Message": "Gone"}}, "PostToConnection")
+        with self.lock:
+            self.posts.append((ConnectionId, Data))
+        return {}
+
+
+class FakeApiGatewayV2:
+
+    def __init__(self):
+        self.calls = 0
+        self.delay = 0
+
+    def get_api(self, ApiId):
+        time.sleep(self.delay)
+        self.calls += 1
+        return {"ApiEndpoint": f"wss://{ApiId}.execute-api.eu-west-1.amazonaws.com"}
+
+
+class FakeSQS:
+    """ Records sent messages; batched messages of the games in `batch_failures` are reported as failed """
+
+    def __init__(self):
+        self.messages = []
+        self.calls = []
+        self.url_lookups = 0
+        self.delay = 0
+        self.batch_failures = set()
+
+    def get_queue_url(self, QueueName):
+        time.sleep(self.delay)
+        self.url_lookups += 1
+        return {"QueueUrl": f"https://sqs.eu-west-1.amazonaws.com/123456789012/{QueueName}"}
+
+    def send_message(self, **kwargs):
+        time.sleep(self.delay)
+        self.calls.append("send_message")
+        self.messages.append(kwargs)
+        return {"MessageId": str(len(self.messages))}
+
+    def send_message_batch(self, QueueUrl, Entries):
+        time.sleep(self.delay)
+        self.calls.append("send_message_batch")
+        assert len(Entries) <= 10
+        response = {"Successful": [], "Failed": []}
+        for entry in Entries:
+            if entry["MessageGroupId"] in self.batch_failures:
+                response["Failed"].append({"Id": entry["Id"], "SenderFault": False, "Code": "InternalError"})
+                continue
+            message = {key: value for key, value in entry.items() if key != "Id"}
+            self.messages.append(dict(message, QueueUrl=QueueUrl))
+            response["Successful"].append({"Id": entry["Id"], "MessageId": str(len(self.messages))})
+        return response
+
+
+class FakeLambda:
+    """ Lambda functions in `functions` exist; records get_function and invoke calls """
+
+    class exceptions:
+        class ResourceNotFoundException(ClientError):
+            pass
+
+    def __init__(self):
+        self.functions = set()
+        self.calls = []
+
+    def not_found(self, FunctionName, operation):
+        error = {"Error": {"Code": "ResourceNotFoundException", "Message": f"Function not found: {FunctionName}"}}
+        return self.exceptions.ResourceNotFoundException(error, operation)
+
+    def get_function(self, FunctionName):
+        self.calls.append(("get_function", FunctionName))
+        if FunctionName not in self.functions:
+            raise self.not_found(FunctionName, "GetFunction")
+        return {"ResponseMetadata": {"HTTPStatusCode": 200}, "Configuration": {"FunctionName": FunctionName}}
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        self.calls.append(("invoke", FunctionName))
+        if FunctionName not in self.functions:
+            raise self.not_found(FunctionName, "Invoke")
+        return {"StatusCode": 202}
+
+
+class FakeAWS:
+    """ Patches boto3.client and boto3.resource for the lifetime of a test """
+
+    def __init__(self, monkeypatch):
+        self.dynamodb = FakeDynamoDB()
+        self.clients = {
+            "apigatewaymanagementapi": FakeApiGatewayManagement(),
+            "apigatewayv2": FakeApiGatewayV2(),
+            "sqs": FakeSQS(),
+            "lambda": FakeLambda(),
+        }
+        monkeypatch.setattr(boto3, "client", lambda service, **kwargs: self.clients[service])
+        monkeypatch.setattr(boto3, "resource", lambda service, **kwargs: self.dynamodb)
+        # Handlers share the process-wide store - a fresh DynamoDB one, bound to these fakes
+        monkeypatch.setenv("game_store", "dynamodb")
+        monkeypatch.setattr(storage, "_stores", {})
+        monkeypatch.setenv("aiagent_queue_name", "aiagent.fifo")
+        monkeypatch.setenv("watch_game_websocket_api_id", "api")
+        monkeypatch.setenv("watch_game_websocket_api_stage", "dev")
+
+    def __getattr__(self, service):
+        return self.clients[service]
+
+    def table(self, name):
+        return self.dynamodb.Table(name)
+
+    def import_handler(self, name):
+        """ A freshly imported handler module bound to the fakes """
+        sys.modules.pop(name, None)
+        return importlib.import_module(name)
@@ -0,0 +1,9 @@
+import os
+import sys
+
+TEST_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_DIR = os.path.dirname(TEST_DIR)
+
+for path in (API_DIR, TEST_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
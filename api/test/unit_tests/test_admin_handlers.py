@@ -0,0 +1,86 @@
+import json
+import importlib
+
+import pytest
+
+import blef_headless
+from blef_core import storage
+
+
+class ProjectionStore(storage.InMemoryGameStore):
+    """ In-memory store recording the attributes each read asked for """
+
+    def __init__(self):
+        super().__init__()
+        self.reads = []
+
+    def get_game(self, game_uuid, attributes=None):
+        self.reads.append(tuple(attributes) if attributes else None)
+        return super().get_game(game_uuid, attributes)
+
+
+@pytest.fixture
+def lobby(monkeypatch):
+    """ A game with two players yet to start, the admin handlers and the store """
+    monkeypatch.setenv("agent_mapping", '{"random": "random"}')
+    store = ProjectionStore()
+    handlers = blef_headless.load_handlers(store)
+    for name in ("make_public", "make_private", "invite-aiagent"):
+        handlers[name] = importlib.import_module(name)
+        handlers[name].store = store
+    game_uuid = blef_headless.call(handlers["create_game"])["game_uuid"]
+    admin_uuid = blef_headless.call(handlers["join_game"], game_uuid=game_uuid, nickname="a")["player_uuid"]
+    blef_headless.call(handlers["join_game"], game_uuid=game_uuid, nickname="b")
+    store.reads.clear()
+    return handlers, store, game_uuid, admin_uuid
+
+
+def call(handler, **body):
+    return handler.lambda_handler(body, None)["statusCode"]
+
+
+def test_admin_handlers_read_only_what_they_need(lobby):
+    """ Test visibility changes are a single write, and the other admin handlers read the attributes they use """
+    handlers, store, game_uuid, admin_uuid = lobby
+    assert call(handlers["make_public"], game_uuid=game_uuid, admin_uuid=admin_uuid) == 200
+    assert call(handlers["make_private"], game_uuid=game_uuid, admin_uuid=admin_uuid) == 200
+    assert store.reads == []
+    assert store.get_game(game_uuid)["public"] == "false"
+    store.reads.clear()
+
+    assert call(handlers["invite-aiagent"], game_uuid=game_uuid, admin_uuid=admin_uuid, agent_name="random") == 200
+    assert call(handlers["start_game"], game_uuid=game_uuid, admin_uuid=admin_uuid) == 202
+    assert store.reads == [handlers["invite-aiagent"].GAME_ATTRIBUTES, handlers["start_game"].GAME_ATTRIBUTES]
+    assert all("history" not in attributes and "hands" not in attributes for attributes in store.reads)
+
+
+def test_refused_changes_are_explained(lobby):
+    """ Test a refused visibility change reads the game once, to report why it was refused """
+    handlers, store, game_uuid, admin_uuid = lobby
+    player_uuid = store.get_game(game_uuid)["players"][1]["uuid"]
+    store.reads.clear()
+
+    response = handlers["make_private"].lambda_handler({"game_uuid": game_uuid, "admin_uuid": admin_uuid}, None)
+    assert json.loads(response["body"]) == {"message": "Request redundant - game already private"}
+    assert call(handlers["make_public"], game_uuid=game_uuid, admin_uuid=player_uuid) == 400
+    assert call(handlers["make_public"], game_uuid="f2fdd601-bc82-438b-a4ee-a871dc35561a", admin_uuid=admin_uuid) == 400
+    assert len(store.reads) == 3
+
+    assert call(handlers["start_game"], game_uuid=game_uuid, admin_uuid=player_uuid) == 400
+    assert call(handlers["start_game"], game_uuid=game_uuid, admin_uuid=admin_uuid) == 202
+    assert call(handlers["make_public"], game_uuid=game_uuid, admin_uuid=admin_uuid) == 403
+    assert call(handlers["start_game"], game_uuid=game_uuid, admin_uuid=admin_uuid) == 403
+    assert store.get_game(game_uuid)["public"] == "false"
+
+
+def test_projected_reads_keep_the_game_whole(lobby):
+    """ Test writes following a projected read leave the attributes that were not read untouched """
+    handlers, store, game_uuid, admin_uuid = lobby
+    assert call(handlers["invite-aiagent"], game_uuid=game_uuid, admin_uuid=admin_uuid, agent_name="random") == 200
+    assert call(handlers["start_game"], game_uuid=game_uuid, admin_uuid=admin_uuid) == 202
+
+    game = store.get_game(game_uuid)
+    assert game["status"] == "Running"
+    assert game["history"] == []
+    assert len(game["players"]) == 3 and len(game["hands"]) == 3
+    assert call(handlers["make_public"], game_uuid=game_uuid, admin_uuid=admin_uuid) == 403
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from fake_aws import FakeAWS
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    return FakeAWS(monkeypatch)
+
+
+@pytest.fixture
+def orchestrator(aws):
+    return aws.import_handler("aiagent-orchestrator")
+
+
+def decision_request(ai_agent):
+    return {"game_uuid": "g", "history_length": 0, "player_uuid": "u1", "nickname": "a", "ai_agent": ai_agent,
+            "hand": [[0, 0]], "n_cards": [["a", 1], ["b", 1]], "history": []}
+
+
+def queue_event(*ai_agents):
+    return {"Records": [{"body": json.dumps(decision_request(ai_agent))} for ai_agent in ai_agents]}
+
+
+def test_agent_functions_are_looked_up_once(aws, orchestrator, capsys):
+    """ Test found and missing agent functions are both remembered across invocations, and reported as metrics """
+    lambda_client = aws.clients["lambda"]
+    lambda_client.functions.add("blef-aiagent-random")
+    orchestrator.lambda_handler(queue_event("random", "random", "missing"), None)
+    orchestrator.lambda_handler(queue_event("random", "missing"), None)
+
+    assert [call for call in lambda_client.calls if call[0] == "get_function"] == [
+        ("get_function", "blef-aiagent-random"), ("get_function", "blef-aiagent-missing")
+    ]
+    assert lambda_client.calls.count(("invoke", "blef-aiagent-random")) == 3
+    assert ("invoke", "blef-aiagent-missing") not in lambda_client.calls
+    metrics = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(metric["AgentCacheHits"], metric["AgentCacheMisses"]) for metric in metrics] == [(1, 2), (2, 0)]
+
+
+def test_entries_expire_and_deleted_functions_are_forgotten(aws, orchestrator, monkeypatch):
+    """ Test entries are checked again after their TTL, and an invoke of a deleted function marks it missing """
+    lambda_client = aws.clients["lambda"]
+    lambda_client.functions.add("blef-aiagent-random")
+    orchestrator.lambda_handler(queue_event("random"), None)
+    lambda_client.functions.clear()
+    orchestrator.lambda_handler(queue_event("random"), None)
+    assert orchestrator.function_cache["blef-aiagent-random"][0] is False
+
+    lambda_client.functions.add("blef-aiagent-random")
+    monkeypatch.setattr(orchestrator, "AIAGENT_MISSING_CACHE_TTL", 0)
+    orchestrator.cache_function_exists("blef-aiagent-random", False)
+    orchestrator.lambda_handler(queue_event("random"), None)
+    assert lambda_client.calls[-2:] == [("get_function", "blef-aiagent-random"), ("invoke", "blef-aiagent-random")]
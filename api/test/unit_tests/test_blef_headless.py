@@ -0,0 +1,33 @@
+import pytest
+
+import blef_headless
+
+
+@pytest.mark.parametrize("n_players", range(2, 9))
+def test_games_run_to_completion(n_players):
+    """ Test full games through the handlers for every table size """
+    stats = blef_headless.simulate(20, n_players, seed=n_players)
+    assert stats["games"] == 20
+    assert stats["rounds"] >= 20 * (n_players - 1)
+
+
+def test_seeded_games_are_reproducible():
+    """ Test the same seed replays the same games """
+    first = blef_headless.simulate(10, 3, seed=42)
+    second = blef_headless.simulate(10, 3, seed=42)
+    assert (first["rounds"], first["moves"]) == (second["rounds"], second["moves"])
+
+
+def test_games_on_sqlite_store(tmp_path):
+    """ Test the handlers run unchanged on the SQLite backend """
+    store = blef_headless.storage.SQLiteGameStore(str(tmp_path / "games.sqlite3"))
+    stats = blef_headless.simulate(3, 3, seed=1, store=store)
+    assert stats["games"] == 3
+
+
+@pytest.mark.parametrize("n_players", (2, 5, 8))
+def test_fast_mode_plays_the_same_games(n_players):
+    """ Test the rule-code-only mode plays exactly the games the handlers play for the same seed """
+    handlers = blef_headless.simulate(10, n_players, seed=n_players)
+    fast = blef_headless.simulate(10, n_players, seed=n_players, fast=True)
+    assert (fast["rounds"], fast["moves"]) == (handlers["rounds"], handlers["moves"])
@@ -0,0 +1,46 @@
+import pytest
+
+from blef_core import rules
+
+np = pytest.importorskip("numpy")
+import blef_montecarlo  # noqa: E402
+
+
+def decode(indices):
+    return [{"value": int(index) // 4, "colour": int(index) % 4} for index in indices]
+
+
+def test_deal_gives_distinct_cards():
+    """ Test every dealt round uses distinct cards from the deck """
+    dealt = blef_montecarlo.deal(1000, [3, 2, 1], blef_montecarlo.get_rng(0))
+    assert dealt.shape == (1000, 6) and dealt.dtype == np.int8
+    assert all(len(set(row)) == 6 for row in dealt.tolist())
+    assert dealt.min() >= 0 and dealt.max() < 24
+
+
+def test_hand_masks_split_players():
+    """ Test hand masks follow the per-player column ranges, including eliminated players """
+    dealt = blef_montecarlo.deal(200, [2, 0, 1], blef_montecarlo.get_rng(1))
+    masks = blef_montecarlo.hand_masks(dealt, [2, 0, 1])
+    for row, (first, eliminated, last) in zip(dealt.tolist(), masks.tolist()):
+        assert first == (1 << row[0]) | (1 << row[1])
+        assert eliminated == 0
+        assert last == 1 << row[2]
+
+
+def test_resolve_checks_matches_set_exists():
+    """ Test vectorised check resolution against the scalar rules """
+    rng = blef_montecarlo.get_rng(2)
+    dealt = blef_montecarlo.deal(3000, [4, 3, 3], rng)
+    action_ids = rng.integers(0, 88, size=len(dealt))
+    found = blef_montecarlo.resolve_checks(dealt, action_ids)
+    for row, action_id, exists in zip(dealt.tolist(), action_ids.tolist(), found.tolist()):
+        assert exists is rules.set_exists(decode(row), action_id)
+
+
+def test_seeded_runs_are_reproducible():
+    """ Test the same seed gives the same results """
+    first = blef_montecarlo.simulate_set_frequencies([2, 2], 5000, seed=3)
+    second = blef_montecarlo.simulate_set_frequencies([2, 2], 5000, seed=3)
+    assert (first == second).all()
+    assert blef_montecarlo.simulate_checks([2, 2], 5000, 11, seed=3) == pytest.approx(first[11])
@@ -0,0 +1,60 @@
+from blef_core import censoring
+
+
+def make_game(round_number=2, status="Running"):
+    return {
+        "admin_nickname": "a", "public": "false", "room": 3, "status": status, "round_number": round_number,
+        "max_cards": 5, "cp_nickname": "a", "history": [], "last_modified": 1,
+        "players": [
+            {"uuid": "u1", "nickname": "a", "n_cards": 1},
+            {"uuid": "u2", "nickname": "b", "n_cards": 2},
+            {"uuid": "u3", "nickname": "c", "n_cards": 0}
+        ],
+        "hands": [
+            {"nickname": "a", "hand": [{"value": 0, "colour": 0}]},
+            {"nickname": "b", "hand": [{"value": 1, "colour": 0}, {"value": 2, "colour": 1}]},
+            {"nickname": "c", "hand": []}
+        ]
+    }
+
+
+def hand_owners(view):
+    return [hand["nickname"] for hand in view["hands"]]
+
+
+def test_running_round_shows_only_own_hand():
+    """ Test players see their own hand, spectators and eliminated players see none """
+    game = make_game()
+    assert hand_owners(censoring.censor_game(game, 2, True, "b")) == ["b"]
+    assert hand_owners(censoring.censor_game(game, 2, False, "")) == []
+    assert hand_owners(censoring.censor_game(game, 2, True, "c")) == []
+
+
+def test_past_rounds_and_finished_games_show_all_active_hands():
+    """ Test every active hand is revealed once the round or the game is over """
+    assert hand_owners(censoring.censor_game(make_game(), 3, False, "")) == ["a", "b"]
+    assert hand_owners(censoring.censor_game(make_game(status="Finished"), 2, False, "")) == ["a", "b"]
+    # A snapshot of a finished game's last round is revealed through the live game's status
+    assert hand_owners(censoring.censor_game(make_game(), 2, False, "", current_status="Finished")) == ["a", "b"]
+
+
+def test_player_uuids_are_hidden():
+    view = censoring.censor_game(make_game(), 2, True, "a")
+    assert all("uuid" not in player for player in view["players"])
+    assert view["status"] == "Running"
+
+
+def test_decision_request_holds_only_what_the_agent_may_see():
+    """ Test an AI agent is sent its own hand and nobody else's, and no other player's UUID """
+    game = dict(make_game(), game_uuid="g", cp_nickname="b", history=[{"player": "a", "action_id": 3}])
+    game["players"][1]["ai_agent"] = "random"
+    request = censoring.get_decision_request(game)
+    assert request == {
+        "game_uuid": "g", "history_length": 1, "player_uuid": "u2", "nickname": "b", "ai_agent": "random",
+        "hand": [[1, 0], [2, 1]], "n_cards": [["a", 1], ["b", 2], ["c", 0]], "history": [["a", 3]]
+    }
+
+    view = censoring.get_decision_game(request)
+    assert view["hands"] == [game["hands"][1]]
+    assert view["players"] == [{"nickname": player["nickname"], "n_cards": player["n_cards"]} for player in game["players"]]
+    assert view["history"] == game["history"] and view["cp_nickname"] == "b"
@@ -0,0 +1,155 @@
+import time
+import threading
+import importlib
+
+import pytest
+
+import blef_headless
+from blef_core import storage
+
+
+class SlowStore(storage.InMemoryGameStore):
+    """ In-memory store with a pause between reading a game and handing it over, to widen read-modify-write races """
+
+    def get_game(self, game_uuid, attributes=None):
+        game = super().get_game(game_uuid, attributes)
+        time.sleep(0.002)
+        return game
+
+
+@pytest.fixture
+def handlers():
+    store = SlowStore()
+    return blef_headless.load_handlers(store), store
+
+
+def run_concurrently(functions):
+    """ Start all functions at once and return their results in order """
+    barrier = threading.Barrier(len(functions))
+    results = [None] * len(functions)
+
+    def run(i, function):
+        barrier.wait()
+        results[i] = function()
+
+    threads = [threading.Thread(target=run, args=(i, function)) for i, function in enumerate(functions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def call(handler, **body):
+    return handler.lambda_handler(body, None)
+
+
+def test_concurrent_joins_lose_no_players(handlers):
+    """ Test simultaneous joins all land, up to the room limit of 8 """
+    handlers, store = handlers
+    game_uuid = blef_headless.call(handlers["create_game"])["game_uuid"]
+    responses = run_concurrently([
+        lambda i=i: call(handlers["join_game"], game_uuid=game_uuid, nickname=f"player{i}")
+        for i in range(12)
+    ])
+
+    joined = [response for response in responses if response["statusCode"] == 200]
+    assert len(joined) == 8
+    assert all(response["statusCode"] == 403 for response in responses if response["statusCode"] != 200)
+
+    game = store.get_game(game_uuid)
+    assert len(game["players"]) == 8
+    assert len({player["nickname"] for player in game["players"]}) == 8
+    assert game["admin_nickname"] in {player["nickname"] for player in game["players"]}
+    assert storage.game_version(game) == 8
+
+
+def start_game(handlers, n_players):
+    game_uuid = blef_headless.call(handlers["create_game"])["game_uuid"]
+    player_uuids = {}
+    for i in range(n_players):
+        nickname = f"player{i}"
+        player_uuids[nickname] = blef_headless.call(handlers["join_game"], game_uuid=game_uuid, nickname=nickname)["player_uuid"]
+    blef_headless.call(handlers["start_game"], game_uuid=game_uuid, admin_uuid=player_uuids["player0"])
+    return game_uuid, player_uuids
+
+
+def test_concurrent_bets_are_applied_once(handlers):
+    """ Test only one of several simultaneous moves by the current player is applied """
+    handlers, store = handlers
+    game_uuid, player_uuids = start_game(handlers, 3)
+
+    for _ in range(5):
+        game = store.get_game(game_uuid)
+        lowest = game["history"][-1]["action_id"] + 1 if game["history"] else 0
+        action_ids = range(lowest, lowest + 6)
+        responses = run_concurrently([
+            lambda action_id=action_id: call(handlers["play"], game_uuid=game_uuid,
+                                             player_uuid=player_uuids[game["cp_nickname"]], action_id=action_id)
+            for action_id in action_ids
+        ])
+
+        played = [action_id for action_id, response in zip(action_ids, responses) if response["statusCode"] == 200]
+        assert len(played) == 1
+        new_game = store.get_game(game_uuid)
+        assert len(new_game["history"]) == len(game["history"]) + 1
+        assert new_game["history"][-1]["action_id"] == played[0]
+
+
+def test_concurrent_checks_finish_the_round_once(handlers):
+    """ Test simultaneous checks log the round once and deal the next round once """
+    handlers, store = handlers
+    game_uuid, player_uuids = start_game(handlers, 2)
+    game = store.get_game(game_uuid)
+    blef_headless.call(handlers["play"], game_uuid=game_uuid, player_uuid=player_uuids[game["cp_nickname"]], action_id=0)
+
+    game = store.get_game(game_uuid)
+    responses = run_concurrently([
+        lambda: call(handlers["play"], game_uuid=game_uuid, player_uuid=player_uuids[game["cp_nickname"]], action_id=88)
+        for _ in range(4)
+    ])
+
+    assert sum(response["statusCode"] == 200 for response in responses) == 1
+    game = store.get_game(game_uuid)
+    assert game["round_number"] == 2
+    assert sum(player["n_cards"] for player in game["players"]) == 3
+    assert store.get_round(game_uuid, 1)["history"][-1]["action_id"] == 89
+
+
+def test_start_racing_joins_deals_everyone_once(handlers):
+    """ Test simultaneous starts deal once, and joins racing them are either dealt in or refused """
+    handlers, store = handlers
+    game_uuid = blef_headless.call(handlers["create_game"])["game_uuid"]
+    admin_uuid = blef_headless.call(handlers["join_game"], game_uuid=game_uuid, nickname="admin")["player_uuid"]
+    blef_headless.call(handlers["join_game"], game_uuid=game_uuid, nickname="player0")
+    responses = run_concurrently(
+        [lambda: call(handlers["start_game"], game_uuid=game_uuid, admin_uuid=admin_uuid) for _ in range(3)] +
+        [lambda i=i: call(handlers["join_game"], game_uuid=game_uuid, nickname=f"player{i}") for i in range(1, 4)]
+    )
+
+    starts, joins = responses[:3], responses[3:]
+    assert sorted(response["statusCode"] for response in starts) == [202, 403, 403]
+    game = store.get_game(game_uuid)
+    assert len(game["players"]) == 2 + sum(response["statusCode"] == 200 for response in joins)
+    assert all(response["statusCode"] == 403 for response in joins if response["statusCode"] != 200)
+    assert len(game["hands"]) == len(game["players"])
+    assert all(player["n_cards"] == 1 for player in game["players"])
+
+
+def test_invites_racing_joins_lose_no_players(handlers, monkeypatch):
+    """ Test simultaneous invites and joins all land, and none overwrites another """
+    handlers, store = handlers
+    monkeypatch.setenv("agent_mapping", '{"random": "random"}')
+    invite = importlib.import_module("invite-aiagent")
+    monkeypatch.setattr(invite, "store", store)
+    monkeypatch.setattr(invite, "AGENT_MAPPING", {"random": "random"})
+    game_uuid = blef_headless.call(handlers["create_game"])["game_uuid"]
+    admin_uuid = blef_headless.call(handlers["join_game"], game_uuid=game_uuid, nickname="admin")["player_uuid"]
+    responses = run_concurrently(
+        [lambda: call(invite, game_uuid=game_uuid, admin_uuid=admin_uuid, agent_name="random") for _ in range(3)] +
+        [lambda i=i: call(handlers["join_game"], game_uuid=game_uuid, nickname=f"player{i}") for i in range(3)]
+    )
+
+    assert [response["statusCode"] for response in responses] == [200] * 6
+    nicknames = {player["nickname"] for player in store.get_game(game_uuid)["players"]}
+    assert nicknames == {"admin", "player0", "player1", "player2", "random_(AI)", "random_2_(AI)", "random_3_(AI)"}
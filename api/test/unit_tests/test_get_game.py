@@ -0,0 +1,218 @@
+import json
+import time
+
+import pytest
+
+import blef_headless
+from blef_core import storage
+
+
+class CountingStore(storage.InMemoryGameStore):
+    """ In-memory store counting the reads of each kind """
+
+    def __init__(self):
+        super().__init__()
+        self.reads = []
+
+    def get_game(self, game_uuid, attributes=None):
+        self.reads.append("get_game")
+        return super().get_game(game_uuid, attributes)
+
+    def get_round(self, game_uuid, round_number):
+        self.reads.append("get_round")
+        return super().get_round(game_uuid, round_number)
+
+    def get_rounds(self, game_uuid, first_round=1, last_round=None):
+        self.reads.append("get_rounds")
+        return super().get_rounds(game_uuid, first_round, last_round)
+
+    def get_game_and_round(self, game_uuid, round_number):
+        self.reads.append("get_game_and_round")
+        return super().get_game_and_round(game_uuid, round_number)
+
+
+@pytest.fixture
+def played():
+    """ A finished two-player game, the handlers and the store it was played on """
+    store = CountingStore()
+    handlers = blef_headless.load_handlers(store)
+    for name in ("get_game", "get_rounds"):
+        handlers[name] = blef_headless.importlib.import_module(name)
+        handlers[name].store = store
+    handlers["get_game"].immutable_views.clear()
+    handlers["get_game"].current_rounds.clear()
+    blef_headless.random.seed(0)
+    rounds, _ = blef_headless.play_game(handlers, store, 2, blef_headless.random.Random(0))
+    game_uuid = next(iter(store.items))
+    store.reads.clear()
+    return handlers, store, game_uuid, rounds
+
+
+def call(handler, **body):
+    response = handler.lambda_handler(body, None)
+    return response["statusCode"], json.loads(response["body"])
+
+
+def get(handler, headers=None, **params):
+    """ get_game called the way API Gateway calls it """
+    return handler.lambda_handler({"queryStringParameters": params, "headers": headers}, None)
+
+
+def follow(handlers, store, game_uuid):
+    """ Read the live game the way a client following it does, leaving no cached view or read behind """
+    call(handlers["get_game"], game_uuid=game_uuid)
+    handlers["get_game"].immutable_views.clear()
+    store.reads.clear()
+
+
+def test_past_round_takes_one_read(played):
+    """ Test a round known to be finished is served from the round log alone, with every hand revealed """
+    handlers, store, game_uuid, rounds = played
+    follow(handlers, store, game_uuid)
+    status, view = call(handlers["get_game"], game_uuid=game_uuid, round="2")
+    assert status == 200
+    assert view["round_number"] == 2 and len(view["hands"]) == 2
+    assert view["history"][-1]["action_id"] == 89
+    assert store.reads == ["get_round"]
+
+
+def test_any_round_takes_one_read(played):
+    """ Test the current round is read from the live game alone, and a round of a game not known yet along with its log entry """
+    handlers, store, _, _ = played
+    game_uuid = blef_headless.call(handlers["create_game"])["game_uuid"]
+    player_uuids = {nickname: blef_headless.call(handlers["join_game"], game_uuid=game_uuid, nickname=nickname)["player_uuid"]
+                    for nickname in ("a", "b")}
+    blef_headless.call(handlers["start_game"], game_uuid=game_uuid, admin_uuid=player_uuids["a"])
+    for action_id in (0, 88):
+        cp_nickname = store.get_game(game_uuid)["cp_nickname"]
+        blef_headless.call(handlers["play"], game_uuid=game_uuid, player_uuid=player_uuids[cp_nickname], action_id=action_id)
+    store.reads.clear()
+
+    for _ in range(2):
+        status, view = call(handlers["get_game"], game_uuid=game_uuid, round="2")
+        assert status == 200 and view["round_number"] == 2
+    assert store.reads == ["get_game_and_round", "get_game"]
+
+    store.reads.clear()
+    handlers["get_game"].current_rounds.clear()
+    status, view = call(handlers["get_game"], game_uuid=game_uuid, round="1")
+    assert status == 200 and view["history"][-1]["action_id"] == 89
+    assert store.reads == ["get_game_and_round"]
+
+
+def test_round_errors_still_come_from_the_live_game(played):
+    """ Test rounds which are not logged are explained from the live game """
+    handlers, store, game_uuid, rounds = played
+    status, body = call(handlers["get_game"], game_uuid=game_uuid, round=rounds + 2)
+    assert status == 400 and "not reached" in body["error"]
+    status, body = call(handlers["get_game"], game_uuid="f2fdd601-bc82-438b-a4ee-a871dc35561a", round=1)
+    assert status == 400 and "does not exist" in body["error"]
+
+
+def test_replay_takes_one_query(played):
+    """ Test all rounds of a game, or a range of them, come back from a single query """
+    handlers, store, game_uuid, rounds = played
+    status, body = call(handlers["get_rounds"], game_uuid=game_uuid)
+    assert status == 200
+    assert [view["round_number"] for view in body["rounds"]] == list(range(1, rounds + 1))
+    assert store.reads == ["get_rounds"]
+
+    single = {round_number: call(handlers["get_game"], game_uuid=game_uuid, round=round_number)[1] for round_number in (2, 3)}
+    status, body = call(handlers["get_rounds"], game_uuid=game_uuid, first_round="2", last_round="3")
+    assert body["rounds"] == [single[2], single[3]]
+
+
+def test_replay_parameters_are_checked(played):
+    """ Test bad ranges and unknown players are refused """
+    handlers, store, game_uuid, rounds = played
+    assert call(handlers["get_rounds"], game_uuid=game_uuid, first_round="0")[0] == 400
+    assert call(handlers["get_rounds"], game_uuid=game_uuid, first_round=3, last_round=2)[0] == 400
+    assert call(handlers["get_rounds"], game_uuid=game_uuid, player_uuid="f2fdd601-bc82-438b-a4ee-a871dc35561a")[0] == 400
+    status, body = call(handlers["get_rounds"], game_uuid=game_uuid, first_round=rounds + 1)
+    assert status == 200 and body["rounds"] == []
+
+
+def test_past_rounds_are_cached_with_etags(played):
+    """ Test immutable views carry a strong ETag, are served from the container afterwards and answer If-None-Match with 304 """
+    handlers, store, game_uuid, rounds = played
+    follow(handlers, store, game_uuid)
+    first = get(handlers["get_game"], game_uuid=game_uuid, round="1")
+    assert first["headers"]["Cache-Control"] == "public, max-age=31536000, immutable"
+    etag = first["headers"]["ETag"]
+    assert etag.startswith('"') and not etag.startswith('W/')
+    assert store.reads == ["get_round"]
+
+    again = get(handlers["get_game"], game_uuid=game_uuid, round="1")
+    assert again["body"] == first["body"] and again["headers"]["ETag"] == etag
+    not_modified = get(handlers["get_game"], {"if-none-match": f'"other", W/{etag}'}, game_uuid=game_uuid, round="1")
+    assert not_modified["statusCode"] == 304 and not_modified["body"] == ""
+    assert store.reads == ["get_round"]
+
+    player_uuid = next(iter(store.items.values()))["players"][0]["uuid"]
+    assert get(handlers["get_game"], game_uuid=game_uuid, round="1", player_uuid=player_uuid)["statusCode"] == 200
+    assert get(handlers["get_game"], game_uuid=game_uuid, round="1", player_uuid=game_uuid)["statusCode"] == 400
+
+
+def test_finished_games_are_cached_and_running_ones_are_not(played):
+    """ Test the live view of a finished game is immutable, unlike that of a running game """
+    handlers, store, game_uuid, rounds = played
+    for _ in range(2):
+        assert "ETag" in get(handlers["get_game"], game_uuid=game_uuid)["headers"]
+    assert store.reads == ["get_game"]
+
+    running_uuid = blef_headless.call(handlers["create_game"])["game_uuid"]
+    for _ in range(2):
+        response = get(handlers["get_game"], {"If-None-Match": "*"}, game_uuid=running_uuid)
+        assert response["statusCode"] == 200 and "ETag" not in response["headers"]
+    assert store.reads.count("get_game") == 3
+
+
+def test_least_recently_used_views_are_evicted(played, monkeypatch):
+    """ Test the cache keeps at most immutable_cache_size views """
+    handlers, store, game_uuid, rounds = played
+    monkeypatch.setattr(handlers["get_game"], "IMMUTABLE_CACHE_SIZE", 2)
+    for round_number in (1, 2, 1, 3):
+        get(handlers["get_game"], game_uuid=game_uuid, round=str(round_number))
+    assert list(handlers["get_game"].immutable_views) == [(game_uuid, 1), (game_uuid, 3)]
+
+
+def test_long_poll_returns_as_soon_as_the_game_changes(played, monkeypatch):
+    """ Test a long poll re-checks only last_modified, and answers with the game once it changed """
+    handlers, store, game_uuid, rounds = played
+    monkeypatch.setattr(handlers["get_game"], "LONG_POLL_INTERVAL", 0.01)
+    game_uuid = blef_headless.call(handlers["create_game"])["game_uuid"]
+    since = str(store.get_game(game_uuid)["last_modified"])
+    store.reads.clear()
+
+    checks = []
+    get_last_modified = store.get_last_modified
+
+    def change_on_third_check(uuid):
+        checks.append(uuid)
+        if len(checks) == 3:
+            blef_headless.call(handlers["join_game"], game_uuid=game_uuid, nickname="late")
+        return get_last_modified(uuid)
+
+    monkeypatch.setattr(store, "get_last_modified", change_on_third_check)
+    response = get(handlers["get_game"], game_uuid=game_uuid, since_last_modified=since, wait="5")
+    assert response["statusCode"] == 200
+    assert [player["nickname"] for player in json.loads(response["body"])["players"]] == ["late"]
+    assert len(checks) == 3 and store.reads.count("get_game") == 2
+
+
+def test_long_poll_times_out_with_304(played, monkeypatch):
+    """ Test an unchanged game answers 304 after the wait, which is bounded """
+    handlers, store, game_uuid, rounds = played
+    monkeypatch.setattr(handlers["get_game"], "LONG_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(handlers["get_game"], "LONG_POLL_MAX_WAIT", 0.05)
+    since = str(store.get_game(game_uuid)["last_modified"])
+    store.reads.clear()
+    start = time.monotonic()
+    response = get(handlers["get_game"], game_uuid=game_uuid, since_last_modified=since, wait="3600")
+    assert response["statusCode"] == 304 and response["body"] == ""
+    assert 0.05 <= time.monotonic() - start < 1
+    assert store.reads == []
+
+    assert get(handlers["get_game"], game_uuid=game_uuid, since_last_modified="0")["statusCode"] == 200
+    assert get(handlers["get_game"], game_uuid=game_uuid, since_last_modified=since, wait="nan")["statusCode"] == 400
+    assert get(handlers["get_game"], game_uuid=game_uuid, since_last_modified="soon")["statusCode"] == 400
@@ -0,0 +1,121 @@
+import decimal
+import random
+from math import comb
+from itertools import combinations, product
+
+import pytest
+
+from blef_core import rules
+import legacy_rules
+
+DECK = [{"value": value, "colour": colour} for value, colour in product(range(6), range(4))]
+
+INDEXATION = legacy_rules.load_indexation()
+COLOUR_SET_TYPES = ("Colour", "Small flush", "Big flush", "Great flush")
+VALUE_SET_IDS = [int(row["action_id"]) for row in INDEXATION if row["set_type"] not in COLOUR_SET_TYPES]
+COLOUR_SET_IDS = {colour: [int(row["action_id"]) for row in INDEXATION
+                           if row["set_type"] in COLOUR_SET_TYPES and int(row["detail_1"]) == colour]
+                  for colour in range(4)}
+# Every pool of these sizes is checked: 380,102 pools in all
+ENUMERATED_SIZES = (*range(0, 7), *range(18, 25))
+
+
+def legacy_outcomes(pools, np):
+    """
+        The legacy answers for all 88 sets in each row of an (N, size) array of DECK positions.
+        Its value sets only read the card values and its colour sets only the values of cards of
+        their colour, so it is asked once per distinct case and the answer shared by its pools
+    """
+    values = np.array([card["value"] for card in DECK])
+    colours = np.array([card["colour"] for card in DECK])
+    # A key per pool and case: the count of each value in base 5, or the values held in one colour
+    cases = [(VALUE_SET_IDS, 5 ** values)]
+    cases.extend((action_ids, np.where(colours == colour, 1 << values, 0))
+                 for colour, action_ids in COLOUR_SET_IDS.items())
+    outcomes = np.zeros((len(pools), rules.CHECK_ACTION_ID), dtype=bool)
+    for action_ids, weights in cases:
+        _, first_rows, inverse = np.unique(weights[pools].sum(axis=1), return_index=True, return_inverse=True)
+        answers = np.array([[legacy_rules.determine_set_existence([DECK[position] for position in pools[row]], action_id)
+                             for action_id in action_ids] for row in first_rows], dtype=bool)
+        outcomes[:, action_ids] = answers[inverse.reshape(-1)]
+    return outcomes
+
+
+def test_compiled_sets_cover_all_bets():
+    """ Test there is one compiled set per bet action """
+    assert len(rules.COMPILED_SETS) == rules.CHECK_ACTION_ID
+
+
+def test_every_small_and_large_pool_matches_legacy_implementation(monkeypatch):
+    """ Test the compiled evaluator against the legacy if/elif chain on every pool of up to 6 or at least 18 cards """
+    np = pytest.importorskip("numpy")
+    # The legacy implementation parses its CSV on every call
+    monkeypatch.setattr(legacy_rules, "load_indexation", lambda: INDEXATION)
+    columns = np.array([rules.card_index(card["value"], card["colour"]) for card in DECK])
+    for size in ENUMERATED_SIZES:
+        pools = np.array(list(combinations(range(len(DECK)), size)), dtype=np.intp).reshape(comb(len(DECK), size), size)
+        presence = np.zeros((len(pools), rules.DECK_SIZE), dtype=np.uint8)
+        presence[np.arange(len(pools))[:, None], columns[pools]] = 1
+        mismatches = np.argwhere(rules.evaluate_all_sets(presence) != legacy_outcomes(pools, np))
+        assert not mismatches.size, [([DECK[position] for position in pools[row]], int(action_id))
+                                     for row, action_id in mismatches[:5]]
+
+
+def test_set_exists_matches_legacy_implementation(monkeypatch):
+    """ Test set_exists against the legacy implementation on a seeded sample of 7 to 17 card pools """
+    monkeypatch.setattr(legacy_rules, "load_indexation", lambda: INDEXATION)
+    rng = random.Random(1234)
+    for size in range(7, 18):
+        for _ in range(100):
+            cards = rng.sample(DECK, size)
+            for action_id in range(88):
+                expected = legacy_rules.determine_set_existence(cards, action_id)
+                assert rules.set_exists(cards, action_id) is expected, (cards, action_id)
+
+
+def test_set_exists_accepts_dynamodb_decimals():
+    """ Test cards and action IDs read back from DynamoDB as Decimals """
+    cards = [{"value": decimal.Decimal(5), "colour": decimal.Decimal(c)} for c in range(3)]
+    for action_id in range(88):
+        expected = legacy_rules.determine_set_existence(cards, decimal.Decimal(action_id))
+        assert rules.set_exists(cards, decimal.Decimal(action_id)) is expected
+
+
+def test_set_exists_rejects_check_action():
+    """ Test action 88 is not a set, as before """
+    with pytest.raises(IndexError):
+        legacy_rules.determine_set_existence(DECK, 88)
+    with pytest.raises(IndexError):
+        rules.set_exists(DECK, 88)
+
+
+def test_set_exists_with_repeated_cards():
+    """ Test pools with repeated cards still agree with the legacy implementation """
+    rng = random.Random(99)
+    for _ in range(200):
+        cards = [rng.choice(DECK) for _ in range(rng.randint(2, 24))]
+        for action_id in range(88):
+            expected = legacy_rules.determine_set_existence(cards, action_id)
+            assert rules.set_exists(cards, action_id) is expected, (cards, action_id)
+
+
+def test_evaluate_all_sets_matches_set_exists():
+    """ Test the 88-bit outcome mask against one-at-a-time checks """
+    rng = random.Random(7)
+    for _ in range(500):
+        cards = rng.sample(DECK, rng.randint(0, 24))
+        outcomes = rules.evaluate_all_sets(cards)
+        assert outcomes >> 88 == 0
+        for action_id in range(88):
+            assert rules.set_in_outcomes(outcomes, action_id) is rules.set_exists(cards, action_id)
+
+
+def test_evaluate_all_sets_batch_matches_single_pools():
+    """ Test the vectorised batch path against the integer path """
+    np = pytest.importorskip("numpy")
+    rng = random.Random(8)
+    pools = [rng.sample(DECK, rng.randint(0, 24)) for _ in range(2000)]
+    outcomes = rules.evaluate_all_sets(rules.cards_to_presence(pools))
+    assert outcomes.shape == (len(pools), 88) and outcomes.dtype == np.bool_
+    for row, cards in enumerate(pools):
+        assert rules.outcomes_to_action_ids(rules.evaluate_all_sets(cards)) == list(np.flatnonzero(outcomes[row]))
@@ -0,0 +1,26 @@
+import json
+import decimal
+
+from blef_core import serialization
+
+
+def test_response_payload_encodes_decimals():
+    """ Test DynamoDB numbers come out as plain JSON numbers """
+    payload = serialization.response_payload(200, {"n_cards": decimal.Decimal("3"), "last_modified": decimal.Decimal("1.5")})
+    assert payload["statusCode"] == 200
+    assert json.loads(payload["body"]) == {"n_cards": 3, "last_modified": 1.5}
+    assert payload["headers"]["Access-Control-Allow-Origin"] == "*"
+
+
+def test_parse_event_merges_parameters():
+    """ Test body, path and query parameters are merged, and null parameters are tolerated """
+    event = {"body": '{"nickname": "a"}', "pathParameters": {"game_uuid": "g"}, "queryStringParameters": None}
+    assert serialization.parse_event(event) == {"nickname": "a", "game_uuid": "g"}
+    assert serialization.parse_event('{"Records": []}') == {"Records": []}
+    assert serialization.parse_event({"body": "not json"}) is None
+    assert serialization.parse_event(None) is False
+
+
+def test_is_valid_uuid():
+    assert serialization.is_valid_uuid("8e3f2b0c-4a1d-4f7e-9a55-2c1f6a9b0d11")
+    assert not serialization.is_valid_uuid("None")
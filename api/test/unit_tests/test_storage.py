@@ -0,0 +1,330 @@
+import json
+import decimal
+
+import pytest
+
+from blef_core import storage
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return storage.SQLiteGameStore(str(tmp_path / "games.sqlite3"))
+    return storage.InMemoryGameStore()
+
+
+def test_missing_game(store):
+    """ Test unknown games read back as None """
+    assert store.get_game("f2fdd601-bc82-438b-a4ee-a871dc35561a") is None
+
+
+def test_save_and_update(store):
+    """ Test whole-item writes and attribute updates """
+    game = {"game_uuid": "g", "public": "false", "players": [], "history": []}
+    assert store.save_game(game)
+    assert isinstance(game["last_modified"], decimal.Decimal)
+
+    store.update_game("g", {"public": "true", "players": [{"nickname": "a", "n_cards": 1}]})
+    saved = store.get_game("g")
+    assert saved["public"] == "true"
+    assert saved["players"] == [{"nickname": "a", "n_cards": 1}]
+    assert saved["history"] == []
+    assert saved["last_modified"] >= game["last_modified"]
+
+
+def test_reads_are_copies(store):
+    """ Test callers mutating a read game don't change the stored item """
+    store.save_game({"game_uuid": "g", "history": []})
+    store.get_game("g")["history"].append({"player": "a", "action_id": 0})
+    assert store.get_game("g")["history"] == []
+
+
+def test_last_modified_matches_the_game(store):
+    """ Test the cheap last_modified read gives exactly the game's timestamp """
+    assert store.get_last_modified("g") is None
+    for _ in range(20):
+        store.save_game({"game_uuid": "g", "history": []})
+        assert store.get_last_modified("g") == store.get_game("g")["last_modified"]
+
+
+def test_sqlite_numbers_read_back_as_decimals(tmp_path):
+    """ Test the SQLite backend returns numbers the way DynamoDB does """
+    store = storage.SQLiteGameStore(str(tmp_path / "games.sqlite3"))
+    store.save_game({"game_uuid": "g", "round_number": 3})
+    assert store.get_game("g")["round_number"] == decimal.Decimal(3)
+
+
+def test_projected_read(store):
+    """ Test a read limited to some attributes returns those the game has, and its key """
+    store.save_game({"game_uuid": "g", "status": "Running", "public": "false", "players": [{"nickname": "a", "n_cards": 2}],
+                     "history": [{"player": "a", "action_id": 3}]})
+    game = store.get_game("g", ["status", "players", "hands"])
+    assert game == {"game_uuid": "g", "status": "Running", "players": [{"nickname": "a", "n_cards": 2}]}
+    assert store.get_game("h", ["status"]) is None
+
+
+def test_projected_read_keeps_stored_nulls(store):
+    """ Test an attribute stored as null is projected like any other, as DynamoDB does """
+    store.save_game({"game_uuid": "g", "status": "Not started", "admin_nickname": None, "cp_nickname": None})
+    assert store.get_game("g", ["admin_nickname", "cp_nickname", "hands"]) == {
+        "game_uuid": "g", "admin_nickname": None, "cp_nickname": None
+    }
+
+
+def test_dynamodb_projected_read_uses_placeholders():
+    """ Test a projected read asks DynamoDB for the attributes alone, through placeholders """
+    class Table:
+        def get_item(self, **kwargs):
+            self.kwargs = kwargs
+            return {"Item": {"game_uuid": "g", "status": "Running"}}
+
+    store = storage.DynamoDBGameStore.__new__(storage.DynamoDBGameStore)
+    store.table = Table()
+    assert store.get_game("g", ["status"]) == {"game_uuid": "g", "status": "Running"}
+    kwargs = store.table.kwargs
+    assert kwargs["Key"] == {"game_uuid": "g"}
+    assert kwargs["ProjectionExpression"] == "#game_uuid, #status"
+    assert kwargs["ExpressionAttributeNames"] == {"#game_uuid": "game_uuid", "#status": "status"}
+
+
+def test_dynamodb_update_uses_placeholders():
+    """ Test reserved words such as "public" and "status" are never used directly """
+    class Table:
+        def update_item(self, **kwargs):
+            self.kwargs = kwargs
+
+    store = storage.DynamoDBGameStore.__new__(storage.DynamoDBGameStore)
+    store.table = Table()
+    store.update_game("g", {"public": "true", "status": "Running"})
+    kwargs = store.table.kwargs
+    assert kwargs["Key"] == {"game_uuid": "g"}
+    assert sorted(kwargs["ExpressionAttributeNames"].values()) == ["last_modified", "public", "status", "version"]
+    assert "public" not in kwargs["UpdateExpression"]
+
+
+def test_backend_selection(monkeypatch):
+    """ Test the backend comes from the environment and is shared within a process """
+    monkeypatch.setenv("game_store", "memory")
+    assert storage.get_game_store() is storage.get_game_store()
+    assert isinstance(storage.get_game_store(), storage.InMemoryGameStore)
+    with pytest.raises(ValueError):
+        storage.get_game_store("redis")
+
+
+def test_round_log_is_append_only(store):
+    """ Test a finished round can only be logged once """
+    round_entry = {"game_uuid": "g", "round_number": 1, "hands": [], "history": []}
+    store.append_round(dict(round_entry))
+    with pytest.raises(storage.ConflictError):
+        store.append_round(dict(round_entry))
+    assert store.get_round("g", 1)["round_number"] == 1
+    assert store.get_round("g", 2) is None
+
+
+def test_round_snapshot_rebuilt_from_log(store):
+    """ Test end-of-round views are rebuilt with each player's n_cards from their hand """
+    card = {"value": 5, "colour": 3}
+    live_game = {
+        "game_uuid": "g", "admin_nickname": "a", "public": "false", "room": 12, "status": "Finished",
+        "round_number": 3, "max_cards": 2, "cp_nickname": None, "hands": [], "history": [],
+        "players": [{"uuid": "u1", "nickname": "a", "n_cards": 0}, {"uuid": "u2", "nickname": "b", "n_cards": 2}]
+    }
+    store.save_game(live_game)
+    history = [{"player": "a", "action_id": 5}, {"player": "b", "action_id": 88}, {"player": "a", "action_id": 89}]
+    store.append_round({"game_uuid": "g", "round_number": 2, "history": history,
+                        "hands": [{"nickname": "a", "hand": [card, card]}, {"nickname": "b", "hand": [card]}]})
+
+    snapshot = store.get_round_snapshot(store.get_game("g"), 2)
+    assert snapshot["game_uuid"] == "g_2"
+    assert snapshot["status"] == "Running" and snapshot["cp_nickname"] is None
+    assert snapshot["round_number"] == 2 and snapshot["history"] == history
+    assert [p["n_cards"] for p in snapshot["players"]] == [2, 1]
+    assert snapshot["admin_nickname"] == "a" and snapshot["max_cards"] == 2
+
+
+def test_round_snapshot_falls_back_to_legacy_items(store):
+    """ Test rounds saved as "<game_uuid>_<round>" items before the round log are still found """
+    store.save_game({"game_uuid": "g", "round_number": 2})
+    store.save_game({"game_uuid": "g_1", "round_number": 1})
+    assert store.get_round_snapshot(store.get_game("g"), 1)["game_uuid"] == "g_1"
+    assert store.get_round_snapshot(store.get_game("g"), 2) is None
+
+
+def test_rounds_are_fetched_by_range(store):
+    """ Test a contiguous range of logged rounds comes back in order, open-ended ranges running to the last one """
+    for round_number in (3, 1, 2, 4):
+        store.append_round({"game_uuid": "g", "round_number": round_number, "hands": [], "history": []})
+    store.append_round({"game_uuid": "h", "round_number": 2, "hands": [], "history": []})
+    assert [entry["round_number"] for entry in store.get_rounds("g", 2, 3)] == [2, 3]
+    assert [entry["round_number"] for entry in store.get_rounds("g", 2)] == [2, 3, 4]
+    assert [entry["round_number"] for entry in store.get_rounds("g")] == [1, 2, 3, 4]
+    assert store.get_rounds("g", 5) == []
+
+
+def test_game_and_round_read_together(store):
+    """ Test the live game and a round come back as get_game and get_round return them, missing ones as None """
+    store.save_game({"game_uuid": "g", "round_number": 2})
+    store.append_round({"game_uuid": "g", "round_number": 1, "hands": [], "history": []})
+    assert store.get_game_and_round("g", 1) == (store.get_game("g"), store.get_round("g", 1))
+    assert store.get_game_and_round("g", 2) == (store.get_game("g"), None)
+    assert store.get_game_and_round("h", 1) == (None, None)
+
+
+def test_dynamodb_game_and_round_is_one_batch_read(monkeypatch):
+    """ Test both items are asked for in one BatchGetItem, keys left unprocessed being asked for again """
+    games, rounds = {"game_uuid": "g", "round_number": 2}, {"game_uuid": "g", "round_number": 1}
+    responses = [
+        {"Responses": {"games": [games], "game_rounds": []}, "UnprocessedKeys": {"game_rounds": {"Keys": [{"game_uuid": "g", "round_number": 1}]}}},
+        {"Responses": {"game_rounds": [rounds]}, "UnprocessedKeys": {}}
+    ]
+    requests = []
+
+    class Client:
+        def batch_get_item(self, RequestItems):
+            requests.append(RequestItems)
+            return responses.pop(0)
+
+    class Table:
+        def __init__(self, name):
+            self.name = name
+            self.meta = type("Meta", (), {"client": Client()})
+
+    monkeypatch.setattr(storage, "BATCH_GET_RETRY_DELAY", 0)
+    store = storage.DynamoDBGameStore.__new__(storage.DynamoDBGameStore)
+    store.table, store.rounds_table = Table("games"), Table("game_rounds")
+    assert store.get_game_and_round("g", 1) == (games, rounds)
+    assert requests == [{"games": {"Keys": [{"game_uuid": "g"}]}, "game_rounds": {"Keys": [{"game_uuid": "g", "round_number": 1}]}},
+                        {"game_rounds": {"Keys": [{"game_uuid": "g", "round_number": 1}]}}]
+
+
+def test_round_entries_are_self_contained(store):
+    """ Test new entries rebuild the end-of-round view without the live game """
+    players = [{"uuid": "u1", "nickname": "a", "n_cards": 1}, {"uuid": "u2", "nickname": "b", "n_cards": 1}]
+    game = {"game_uuid": "g", "admin_nickname": "a", "public": "true", "room": 2, "max_cards": 5, "status": "Running",
+            "round_number": 1, "players": players, "cp_nickname": None, "history": [{"player": "a", "action_id": 89}],
+            "hands": [{"nickname": "a", "hand": [{"value": 0, "colour": 0}]}, {"nickname": "b", "hand": []}]}
+    store.append_round(storage.make_round_entry(game))
+    players[0]["n_cards"] = 2
+    round_entry = store.get_round("g", 1)
+    assert storage.is_self_contained(round_entry)
+    assert not storage.is_self_contained({"game_uuid": "g", "round_number": 1, "hands": [], "history": []})
+
+    snapshot = storage.rebuild_round_snapshot(None, round_entry)
+    assert snapshot["game_uuid"] == "g_1" and snapshot["room"] == 2 and snapshot["public"] == "true"
+    assert [(p["uuid"], p["n_cards"]) for p in snapshot["players"]] == [("u1", 1), ("u2", 0)]
+
+
+def test_stale_version_is_rejected(store):
+    """ Test a write based on an outdated read raises ConflictError and changes nothing """
+    store.save_game({"game_uuid": "g", "players": []})
+    game = store.get_game("g")
+    version = storage.game_version(game)
+    store.update_game("g", {"players": ["a"]}, expected_version=version)
+    with pytest.raises(storage.ConflictError):
+        store.update_game("g", {"players": ["b"]}, expected_version=version)
+    assert store.get_game("g")["players"] == ["a"]
+    assert storage.game_version(store.get_game("g")) == version + 1
+
+
+def test_finish_round_is_atomic(store):
+    """ Test a failed finish_round neither logs the round nor updates the game """
+    store.save_game({"game_uuid": "g", "round_number": 1})
+    round_entry = {"game_uuid": "g", "round_number": 1, "hands": [], "history": []}
+    store.finish_round(dict(round_entry), {"round_number": 2}, expected_version=0)
+    with pytest.raises(storage.ConflictError):
+        store.finish_round(dict(round_entry, round_number=2), {"round_number": 3}, expected_version=0)
+    assert store.get_round("g", 2) is None
+    assert store.get_game("g")["round_number"] == 2
+
+
+def test_append_bet_checks_the_turn(store):
+    """ Test a bet is appended only onto the history length and current player it was made against """
+    store.save_game({"game_uuid": "g", "history": [], "cp_nickname": "a"})
+    store.append_bet("g", {"player": "a", "action_id": 3}, "b", expected_history_length=0, expected_cp_nickname="a")
+    for history_length, cp_nickname in ((0, "b"), (1, "a")):
+        with pytest.raises(storage.ConflictError):
+            store.append_bet("g", {"player": "b", "action_id": 4}, "a", history_length, cp_nickname)
+    store.append_bet("g", {"player": "b", "action_id": 4}, "a", expected_history_length=1, expected_cp_nickname="b")
+    game = store.get_game("g")
+    assert [bet["action_id"] for bet in game["history"]] == [3, 4]
+    assert game["cp_nickname"] == "a"
+    assert storage.game_version(game) == 2
+
+
+def test_admin_update_checks_status_and_admin(store):
+    """ Test an admin change is written only to a game yet to start, by its admin, when it changes something """
+    players = [{"uuid": "u0", "nickname": "a"}, {"uuid": "u1", "nickname": "b"}]
+    store.save_game({"game_uuid": "g", "status": "Not started", "public": "false", "admin_nickname": "a", "players": players})
+    store.update_as_admin("g", {"public": "true"}, "u0")
+    assert store.get_game("g")["public"] == "true"
+    for attributes, admin_uuid in (({"public": "true"}, "u0"), ({"public": "false"}, "u1")):
+        with pytest.raises(storage.ConflictError):
+            store.update_as_admin("g", attributes, admin_uuid)
+    with pytest.raises(storage.ConflictError):
+        store.update_as_admin("h", {"public": "false"}, "u0")
+
+    store.update_game("g", {"status": "Running"})
+    with pytest.raises(storage.ConflictError):
+        store.update_as_admin("g", {"public": "false"}, "u0")
+    assert store.get_game("g")["public"] == "true"
+    assert storage.game_version(store.get_game("g")) == 2
+
+
+def test_dynamodb_admin_update_is_one_conditional_write():
+    """ Test status, admin and change are all checked in the update's condition """
+    class Table:
+        def update_item(self, **kwargs):
+            self.kwargs = kwargs
+
+    store = storage.DynamoDBGameStore.__new__(storage.DynamoDBGameStore)
+    store.table = Table()
+    store.update_as_admin("g", {"public": "true"}, "u0")
+    kwargs = store.table.kwargs
+    assert kwargs["ConditionExpression"] == ("#status = :not_started AND #players[0].#uuid = :admin_uuid AND "
+                                             "#players[0].#nickname = #admin_nickname AND "
+                                             "(attribute_not_exists(#attr0) OR #attr0 <> :attr0)")
+    assert kwargs["ExpressionAttributeNames"]["#attr0"] == "public"
+    assert kwargs["ExpressionAttributeValues"][":admin_uuid"] == "u0"
+
+
+def test_dynamodb_append_bet_writes_one_entry():
+    """ Test a bet is sent as a conditional list_append of the new entry alone """
+    class Table:
+        def update_item(self, **kwargs):
+            self.kwargs = kwargs
+
+    store = storage.DynamoDBGameStore.__new__(storage.DynamoDBGameStore)
+    store.table = Table()
+    store.append_bet("g", {"player": "a", "action_id": 3}, "b", expected_history_length=5, expected_cp_nickname="a")
+    kwargs = store.table.kwargs
+    assert "list_append(#history, :bet)" in kwargs["UpdateExpression"]
+    assert kwargs["ExpressionAttributeValues"][":bet"] == [{"player": "a", "action_id": 3}]
+    assert kwargs["ExpressionAttributeValues"][":history_length"] == 5
+    assert "size(#history) = :history_length" in kwargs["ConditionExpression"]
+
+
+def test_dynamodb_finish_round_request(monkeypatch):
+    """ Test the round-finishing transaction reaches DynamoDB with each value typed once """
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "eu-west-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    store = storage.DynamoDBGameStore()
+    requests = []
+
+    class Sent(Exception):
+        pass
+
+    def capture(request, **kwargs):
+        requests.append(json.loads(request.body))
+        raise Sent()
+
+    store.table.meta.client.meta.events.register("before-send.dynamodb.TransactWriteItems", capture)
+    round_entry = {"game_uuid": "g", "round_number": 1, "hands": [], "history": [{"player": "a", "action_id": 88}]}
+    with pytest.raises(Sent):
+        store.finish_round(round_entry, {"round_number": 2}, expected_version=3)
+
+    put, update = (item.popitem()[1] for item in requests[0]["TransactItems"])
+    assert put["Item"]["round_number"] == {"N": "1"}
+    assert put["Item"]["history"]["L"][0]["M"]["action_id"] == {"N": "88"}
+    assert update["Key"] == {"game_uuid": {"S": "g"}}
+    assert update["ExpressionAttributeValues"][":expected_version"] == {"N": "3"}
@@ -0,0 +1,350 @@
+import json
+import threading
+import time
+
+import pytest
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+
+from fake_aws import FakeAWS
+
+GAME_UUID = "8e3f2b0c-4a1d-4f7e-9a55-2c1f6a9b0d11"
+GAMES_ARN = "arn:aws:dynamodb:eu-west-1:123456789012:table/games/stream/2021-12-01T00:00:00.000"
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    return FakeAWS(monkeypatch)
+
+
+@pytest.fixture
+def stream(aws):
+    return aws.import_handler("watch-game-stream")
+
+
+def make_game(**attributes):
+    game = {
+        "game_uuid": GAME_UUID, "admin_nickname": "a", "public": "false", "room": 3, "status": "Running",
+        "round_number": 1, "max_cards": 5, "cp_nickname": "a", "history": [], "last_modified": 1,
+        "players": [{"uuid": "u1", "nickname": "a", "n_cards": 1}, {"uuid": "u2", "nickname": "b", "n_cards": 1}],
+        "hands": [{"nickname": "a", "hand": [{"value": 0, "colour": 0}]}, {"nickname": "b", "hand": [{"value": 5, "colour": 3}]}]
+    }
+    game.update(attributes)
+    return game
+
+
+def stream_record(new, old=None, arn=GAMES_ARN):
+    serializer = TypeSerializer()
+    image = lambda item: {key: serializer.serialize(value) for key, value in (item or {}).items()}
+    return {"eventSourceARN": arn, "dynamodb": {"NewImage": image(new), "OldImage": image(old)}}
+
+
+def add_watchers(aws, n_spectators, players=("u1", "u2")):
+    table = aws.table("watch_game_websocket_manager")
+    for i in range(n_spectators):
+        table.items.append({"connection_id": f"spectator{i}", "game_uuid": GAME_UUID, "player_uuid": ""})
+    for player_uuid in players:
+        table.items.append({"connection_id": f"player-{player_uuid}", "game_uuid": GAME_UUID, "player_uuid": player_uuid})
+
+
+def posted_games(aws):
+    return {connection_id: json.loads(json.loads(data)["body"]) for connection_id, data in aws.apigatewaymanagementapi.posts}
+
+
+def test_every_watcher_gets_their_view(aws, stream):
+    """ Test spectators see no hands and each player sees only their own """
+    add_watchers(aws, 3)
+    response = stream.lambda_handler({"Records": [stream_record(make_game())]}, None)
+    assert response["statusCode"] == 200
+
+    games = posted_games(aws)
+    assert len(games) == 5
+    assert [hand["nickname"] for hand in games["player-u1"]["hands"]] == ["a"]
+    assert [hand["nickname"] for hand in games["player-u2"]["hands"]] == ["b"]
+    assert all(games[f"spectator{i}"]["hands"] == [] for i in range(3))
+
+
+def test_fan_out_is_concurrent(aws, stream):
+    """ Test slow posts overlap instead of adding up """
+    add_watchers(aws, 48)
+    aws.apigatewaymanagementapi.delay = 0.05
+    start = time.perf_counter()
+    stream.update_game_watchers(make_game())
+    elapsed = time.perf_counter() - start
+    assert len(aws.apigatewaymanagementapi.posts) == 50
+    assert elapsed < 50 * 0.05 / 4
+
+
+def test_failed_post_does_not_stop_delivery(aws, stream):
+    """ Test a failing connection is reported and the others are still posted to """
+    add_watchers(aws, 4)
+    aws.apigatewaymanagementapi.gone.add("spectator1")
+    results = dict(stream.update_game_watchers(make_game()))
+    assert results["spectator1"] is not None
+    assert sum(error is None for error in results.values()) == 5
+    assert "spectator1" not in posted_games(aws)
+
+
+def test_each_view_is_encoded_once(aws, stream, monkeypatch):
+    """ Test spectators share one encoded message and each player gets one of their own """
+    add_watchers(aws, 100)
+    censored = []
+    censor_game = stream.censor_game
+    monkeypatch.setattr(stream, "censor_game", lambda game, *args: censored.append(args) or censor_game(game, *args))
+    stream.update_game_watchers(make_game())
+
+    assert len(censored) == 3
+    messages = dict(aws.apigatewaymanagementapi.posts)
+    assert len({id(messages[f"spectator{i}"]) for i in range(100)}) == 1
+    assert len({messages["spectator0"], messages["player-u1"], messages["player-u2"]}) == 3
+
+
+def test_gone_connections_are_pruned(aws, stream):
+    """ Test gone connections are batch-deleted while everybody else, and the AI queue, is still served """
+    add_watchers(aws, 6)
+    aws.apigatewaymanagementapi.gone.update({"spectator0", "spectator3", "player-u2"})
+    game = make_game(players=[
+        {"uuid": "u1", "nickname": "a", "n_cards": 1, "ai_agent": "random"},
+        {"uuid": "u2", "nickname": "b", "n_cards": 1}
+    ])
+    records = [stream_record(make_game(players=game["players"], cp_nickname="b")), stream_record(game)]
+    response = stream.lambda_handler({"Records": records}, None)
+
+    assert json.loads(response["body"])["pruned_connections"] == 3
+    table = aws.table("watch_game_websocket_manager")
+    assert sorted(item["connection_id"] for item in table.items) == ["player-u1", "spectator1", "spectator2", "spectator4", "spectator5"]
+    assert [call for call in table.calls if call[0] == "batch_write_item"] == [("batch_write_item", {"deletes": 3})]
+    assert len(aws.apigatewaymanagementapi.posts) == 5
+    assert len(aws.sqs.messages) == 1
+
+
+def test_public_games_watchers_are_queried_page_by_page(aws, stream):
+    """ Test every lobby watcher is found through the index, past the first page, without a scan """
+    table = aws.table("watch_game_websocket_manager")
+    table.page_size = 100
+    table.items += [{"connection_id": f"lobby{i}", "game_uuid": "public_games"} for i in range(250)]
+    add_watchers(aws, 120)
+    stream.lambda_handler({"Records": [stream_record(make_game(public="true"))]}, None)
+
+    posted = {connection_id for connection_id, _ in aws.apigatewaymanagementapi.posts}
+    assert {f"lobby{i}" for i in range(250)} <= posted
+    assert len(posted) == 250 + 122
+    assert not [call for call in table.calls if call[0] == "scan"]
+
+
+def test_connect_registers_public_games_watchers_in_their_partition(aws):
+    """ Test lobby watchers are saved under the partition the stream handler queries """
+    connect = aws.import_handler("watch-game-connect")
+    response = connect.lambda_handler({"requestContext": {"connectionId": "lobby0"}, "headers": {}}, None)
+    assert response["statusCode"] == 200
+    assert aws.table("watch_game_websocket_manager").items[0]["game_uuid"] == "public_games"
+
+
+def ai_turn_record():
+    players = [{"uuid": "u1", "nickname": "a", "n_cards": 1, "ai_agent": "random"}, {"uuid": "u2", "nickname": "b", "n_cards": 1}]
+    return stream_record(make_game(players=players))
+
+
+def test_control_plane_lookups_happen_once_per_container(aws, stream):
+    """ Test the websocket endpoint and the queue URL are resolved on first use and then reused """
+    assert aws.apigatewayv2.calls == 0
+    add_watchers(aws, 1)
+    for _ in range(3):
+        stream.lambda_handler({"Records": [ai_turn_record()]}, None)
+
+    assert aws.apigatewayv2.calls == 1
+    assert aws.sqs.url_lookups == 1
+    assert len(aws.sqs.messages) == 3
+    assert len(aws.apigatewaymanagementapi.posts) == 3 * 3
+
+
+def test_queue_url_is_refreshed_when_sending_fails(aws, stream, monkeypatch):
+    """ Test a stale queue URL is looked up again and the message is still sent """
+    stream.lambda_handler({"Records": [ai_turn_record()]}, None)
+    send_message_batch = aws.sqs.send_message_batch
+    failures = []
+
+    def send_once_to_missing_queue(**kwargs):
+        if not failures:
+            failures.append(kwargs["QueueUrl"])
+            raise ClientError({"Error": {"Code": "AWS.SimpleQueueService.NonExistentQueue"}}, "SendMessageBatch")
+        return send_message_batch(**kwargs)
+
+    monkeypatch.setattr(aws.sqs, "send_message_batch", send_once_to_missing_queue)
+    stream.lambda_handler({"Records": [ai_turn_record()]}, None)
+    assert failures and aws.sqs.url_lookups == 2
+    assert len(aws.sqs.messages) == 2
+
+
+
+def test_missing_queue_skips_aiagent_turns_only(aws, stream, monkeypatch):
+    """ Test a queue URL that cannot be looked up leaves the AI turns out, and still serves and prunes watchers """
+    def missing_queue(QueueName):
+        raise ClientError({"Error": {"Code": "AWS.SimpleQueueService.NonExistentQueue"}}, "GetQueueUrl")
+
+    monkeypatch.setattr(aws.sqs, "get_queue_url", missing_queue)
+    add_watchers(aws, 2)
+    aws.apigatewaymanagementapi.gone.add("spectator0")
+    response = stream.lambda_handler({"Records": [ai_turn_record()]}, None)
+
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["pruned_connections"] == 1
+    assert aws.sqs.calls == []
+    assert {connection_id for connection_id, data in aws.apigatewaymanagementapi.posts} == {"spectator1", "player-u1", "player-u2"}
+
+ROUNDS_ARN = "arn:aws:dynamodb:eu-west-1:123456789012:table/game_rounds/stream/2021-12-01T00:00:00.000"
+
+
+def test_records_of_one_game_are_coalesced(aws, stream):
+    """ Test a burst of moves reaches each watcher once, with the newest state, after one connection lookup """
+    add_watchers(aws, 2)
+    history = [{"player": "a", "action_id": 1}, {"player": "b", "action_id": 2}, {"player": "a", "action_id": 3}]
+    records = [stream_record(make_game(history=history[:i + 1], cp_nickname="ab"[(i + 1) % 2])) for i in range(3)]
+    response = stream.lambda_handler({"Records": records}, None)
+    assert response["statusCode"] == 200
+
+    games = posted_games(aws)
+    assert len(aws.apigatewaymanagementapi.posts) == len(games) == 4
+    assert all(game["history"] == history for game in games.values())
+    table = aws.table("watch_game_websocket_manager")
+    assert len([call for call in table.calls if call[0] == "query"]) == 1
+
+
+def test_round_snapshots_are_kept_in_order(aws, stream):
+    """ Test every finished round is shown, the live game is read once for them, and lobby watchers get one update """
+    add_watchers(aws, 1)
+    aws.table("watch_game_websocket_manager").items.append({"connection_id": "lobby0", "game_uuid": "public_games"})
+    live_game = make_game(public="true", round_number=3, history=[])
+    aws.table("games").items.append(live_game)
+    rounds = [{"game_uuid": GAME_UUID, "round_number": n, "last_modified": n, "hands": make_game()["hands"],
+               "history": [{"player": "a", "action_id": 0}, {"player": "b", "action_id": 88}, {"player": "a", "action_id": 89}]}
+              for n in (1, 2)]
+    records = [stream_record(round_entry, arn=ROUNDS_ARN) for round_entry in rounds]
+    stream.lambda_handler({"Records": records}, None)
+    stream.lambda_handler({"Records": [stream_record(live_game)]}, None)
+
+    posts = [(connection_id, json.loads(json.loads(data)["body"])) for connection_id, data in aws.apigatewaymanagementapi.posts]
+    assert [game["round_number"] for connection_id, game in posts if connection_id == "spectator0"] == [1, 2, 3]
+    assert [call[0] for call in aws.table("games").calls] == ["query"]
+    assert [game["game_uuid"] for connection_id, game in posts if connection_id == "lobby0"] == [GAME_UUID]
+
+
+def test_connect_negotiates_the_delta_protocol(aws):
+    """ Test game watchers can opt into deltas, and unknown protocols are refused """
+    aws.table("games").items.append(make_game())
+    connect = aws.import_handler("watch-game-connect")
+    response = connect.lambda_handler({"requestContext": {"connectionId": "c0"}, "headers": {"game_uuid": GAME_UUID, "protocol": "delta"}}, None)
+    assert response["statusCode"] == 200
+    assert aws.table("watch_game_websocket_manager").items[0]["protocol"] == "delta"
+    # Watchers are only checked against the players, so nothing else of the game is read
+    assert aws.table("games").calls == [("get_item", {"ProjectionExpression": "#game_uuid, #players"})]
+
+    response = connect.lambda_handler({"requestContext": {"connectionId": "c1"}, "headers": {"game_uuid": GAME_UUID, "protocol": "diff"}}, None)
+    assert response["statusCode"] == 400
+    assert len(aws.table("watch_game_websocket_manager").items) == 1
+
+
+def delta_messages(aws, connection_id):
+    return [json.loads(data) for posted_id, data in aws.apigatewaymanagementapi.posts if posted_id == connection_id]
+
+
+def bet(n_bets):
+    history = [{"player": "ab"[i % 2], "action_id": i} for i in range(n_bets)]
+    return make_game(history=history, cp_nickname="ab"[n_bets % 2], version=n_bets + 1, last_modified=n_bets + 1)
+
+
+def test_delta_watchers_get_a_snapshot_then_changes(aws, stream):
+    """ Test a delta connection is sent the full game once, then only new moves, numbered by version """
+    add_watchers(aws, 1)
+    table = aws.table("watch_game_websocket_manager")
+    table.items.append({"connection_id": "delta0", "game_uuid": GAME_UUID, "player_uuid": "u1", "protocol": "delta"})
+    for n_bets in range(1, 4):
+        stream.lambda_handler({"Records": [stream_record(bet(n_bets), old=bet(n_bets - 1))]}, None)
+
+    snapshot, *deltas = delta_messages(aws, "delta0")
+    assert snapshot["type"] == "snapshot" and snapshot["seq"] == 2
+    assert [hand["nickname"] for hand in snapshot["game"]["hands"]] == ["a"]
+    assert [(delta["type"], delta["base"], delta["seq"]) for delta in deltas] == [("delta", 2, 3), ("delta", 3, 4)]
+    assert deltas[-1]["new_history"] == [{"player": "a", "action_id": 2}]
+    assert deltas[-1]["changes"] == {"cp_nickname": "b", "last_modified": 4}
+    assert next(item for item in table.items if item["connection_id"] == "delta0")["synced"] is True
+    assert len([connection_id for connection_id, _ in aws.apigatewaymanagementapi.posts if connection_id != "delta0"]) == 3 * 3
+
+
+def test_sync_writes_run_concurrently_and_never_abort(aws, stream, monkeypatch):
+    """ Test sync writes go through the fan-out pool, and a throttled one leaves the rest of the batch served """
+    table = aws.table("watch_game_websocket_manager")
+    for i in range(3):
+        table.items.append({"connection_id": f"delta{i}", "game_uuid": GAME_UUID, "player_uuid": "", "protocol": "delta"})
+    update_item = table.update_item
+    threads = []
+
+    def throttled_update_item(Key, **kwargs):
+        threads.append(threading.current_thread())
+        if Key["connection_id"] == "delta1":
+            raise ClientError({"Error": {"Code": "ProvisionedThroughputExceededException"}}, "UpdateItem")
+        return update_item(Key=Key, **kwargs)
+
+    monkeypatch.setattr(table, "update_item", throttled_update_item)
+    response = stream.lambda_handler({"Records": [stream_record(ai_game(GAME_UUID, n_bets=2))]}, None)
+
+    assert response["statusCode"] == 200
+    assert len(threads) == 3 and threading.main_thread() not in threads
+    assert [item.get("synced") for item in table.items] == [True, None, True]
+    assert len(aws.sqs.messages) == 1
+
+def test_delta_size_does_not_grow_with_the_round(aws, stream):
+    """ Test a bet costs delta watchers the same number of bytes early and late in a round """
+    aws.table("watch_game_websocket_manager").items.append(
+        {"connection_id": "delta0", "game_uuid": GAME_UUID, "player_uuid": "", "protocol": "delta", "synced": True})
+    sizes = {}
+    for n_bets in (12, 40):
+        stream.lambda_handler({"Records": [stream_record(bet(n_bets), old=bet(n_bets - 1))]}, None)
+        sizes[n_bets] = len(aws.apigatewaymanagementapi.posts[-1][1])
+    assert sizes[12] == sizes[40]
+
+
+def ai_game(game_uuid, n_bets=0):
+    players = [{"uuid": "u1", "nickname": "a", "n_cards": 1, "ai_agent": "random"}, {"uuid": "u2", "nickname": "b", "n_cards": 1}]
+    history = [{"player": "ab"[i % 2], "action_id": i} for i in range(n_bets)]
+    return make_game(game_uuid=game_uuid, players=players, history=history, cp_nickname="a")
+
+
+def test_aiagent_turns_are_queued_in_batches(aws, stream):
+    """ Test AI turns of 23 games take 3 batch calls, keep a group per game and are deduplicated by turn """
+    game_uuids = [f"8e3f2b0c-4a1d-4f7e-9a55-2c1f6a9b{i:04d}" for i in range(23)]
+    stream.lambda_handler({"Records": [stream_record(ai_game(game_uuid, n_bets=2)) for game_uuid in game_uuids]}, None)
+
+    assert aws.sqs.calls == ["send_message_batch"] * 3
+    assert [message["MessageGroupId"] for message in aws.sqs.messages] == game_uuids
+    assert aws.sqs.messages[0]["MessageDeduplicationId"] == f"{game_uuids[0]}_1_2"
+    assert len({message["MessageDeduplicationId"] for message in aws.sqs.messages}) == 23
+
+
+def test_aiagent_turn_is_queued_when_a_round_is_logged_after_it(aws, stream):
+    """ Test a round log record coming after the live game in a batch does not hide the AI turn """
+    live_game = ai_game(GAME_UUID, n_bets=2)
+    aws.table("games").items.append(live_game)
+    round_entry = {"game_uuid": GAME_UUID, "round_number": 0, "last_modified": 1, "hands": live_game["hands"],
+                   "history": [{"player": "a", "action_id": 0}, {"player": "b", "action_id": 88}, {"player": "a", "action_id": 89}]}
+    stream.lambda_handler({"Records": [stream_record(live_game), stream_record(round_entry, arn=ROUNDS_ARN)]}, None)
+
+    assert [message["MessageGroupId"] for message in aws.sqs.messages] == [GAME_UUID]
+
+
+def test_failed_batch_entries_are_retried_one_by_one(aws, stream):
+    """ Test only the messages a batch failed to send are sent again, individually """
+    game_uuids = [f"8e3f2b0c-4a1d-4f7e-9a55-2c1f6a9b{i:04d}" for i in range(4)]
+    aws.sqs.batch_failures.update(game_uuids[1:3])
+    stream.lambda_handler({"Records": [stream_record(ai_game(game_uuid)) for game_uuid in game_uuids]}, None)
+
+    assert aws.sqs.calls == ["send_message_batch", "send_message", "send_message"]
+    assert sorted(message["MessageGroupId"] for message in aws.sqs.messages) == game_uuids
+
+
+def test_aiagent_is_queued_a_decision_request(aws, stream):
+    """ Test the queued message holds the agent's own hand and not the other players' hands or UUIDs """
+    stream.lambda_handler({"Records": [stream_record(ai_game(GAME_UUID, n_bets=2))]}, None)
+    body = aws.sqs.messages[0]["MessageBody"]
+    assert json.loads(body)["hand"] == [[0, 0]]
+    assert "u2" not in body and '"hands"' not in body and " " not in body
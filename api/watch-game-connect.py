@@ -1,95 +1,27 @@
-import uuid
 import boto3
-from boto3.dynamodb.conditions import Key
 import time
-import json
 import decimal
+from blef_core import storage
+from blef_core.serialization import (
+    response_payload,
+    internal_error_payload,
+    parameter_error_payload,
+    parse_event,
+    is_valid_uuid
+)
+from blef_core.rules import get_nickname_by_uuid
+
+store = storage.get_game_store()
 
 dynamodb = boto3.resource('dynamodb')
-games_table = dynamodb.Table("games")
 websocket_table = dynamodb.Table("watch_game_websocket_manager")
 
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, decimal.Decimal):
-            if obj.as_tuple().exponent == 0:
-                return int(obj)
-            return float(obj)
-        return super(DecimalEncoder, self).default(obj)
+# Protocols a game watcher can ask for: full game states (the default), or a
+# snapshot followed by changes only, see watch-game-stream.update_game_watchers
+PROTOCOLS = ("full", "delta")
 
-
-def response_payload(status_code, body):
-    return {
-            'statusCode': status_code,
-            'body': json.dumps(body, cls=DecimalEncoder),
-            'headers': {
-                'Access-Control-Allow-Headers':'Content-Type,X-Amz-Date,Authorization,X-Api-Key,x-api-key,X-Amz-Security-Token',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'OPTIONS,POST,GET',
-                'Access-Control-Allow-Credentials': True,
-                'Content-Type': 'application/json'
-            },
-        }
-
-
-def error_payload(status_code, body):
-    return response_payload(status_code, {"error": body})
-
-
-def internal_error_payload(err, message=None):
-    body = "Internal Lambda function error: {}".format(err)
-    if message:
-        body = "{}\n{}".format(body, message)
-    return error_payload(500, body)
-
-
-def request_error_payload(request, message=None):
-    body = "Bad request payload: '{}'".format(request)
-    if message:
-        body = "{}\n{}".format(body, message)
-    return error_payload(400, body)
-
-
-def parameter_error_payload(param_key, param_value, message=None):
-    body = "Bad input value in '{}': {}".format(param_key, param_value)
-    if message:
-        body = "{}\n{}".format(body, message)
-    return error_payload(400, body)
-
-
-def is_valid_uuid(value):
-    try:
-        uuid.UUID(str(value))
-        return True
-    except ValueError:
-        return False
-
-
-def parse_event(event):
-    # Basic input validation
-    if not isinstance(event, dict):
-        return False
-
-    # Handle both direct triggers and API Gateway
-    body = event.get("body", event)
-    if isinstance(body, str):
-        try:
-            body = json.loads(body)
-        except ValueError:
-            return None
-    path_params = event.get("pathParameters", {})
-    query_params = event.get("queryStringParameters", {})
-    body.update(path_params)
-    body.update(query_params)
-    return body
-
-
-def get_game(game_uuid):
-    response = games_table.query(KeyConditionExpression=Key('game_uuid').eq(game_uuid))
-    items = response.get("Items")
-    if len(items) == 1:
-        return items[0]
-    return None
+# Public games watchers share one partition of the game_uuid index, so they can be queried without a scan
+PUBLIC_GAMES_WATCHERS = "public_games"
 
 
 def save_connection_object(obj):
@@ -110,18 +42,15 @@ def get_connection_id(event, context, body):
     raise ValueError("Request context is invalid!")
 
 
-
-def get_nickname_by_uuid(players, player_uuid):
-    filtered_players = [p for p in players if p["uuid"] == player_uuid]
-    if filtered_players:
-        return filtered_players[0]["nickname"]
-
-
-def register_game_watcher(game_uuid, player_uuid, connection_id):
+def register_game_watcher(game_uuid, player_uuid, connection_id, protocol=None):
     if game_uuid and not is_valid_uuid(game_uuid):
         return parameter_error_payload("game_uuid", game_uuid, message="Invalid game UUID")
 
-    game = get_game(game_uuid)
+    if protocol and protocol not in PROTOCOLS:
+        return parameter_error_payload("protocol", protocol, message=f"Protocol should be one of {', '.join(PROTOCOLS)}")
+
+    # Watchers are only checked against the players - the rest of the game is never read
+    game = store.get_game(game_uuid, ("players",))
     if not game:
         return parameter_error_payload("game_uuid", game_uuid, message="Game does not exist")
 
@@ -138,6 +67,8 @@ def register_game_watcher(game_uuid, player_uuid, connection_id):
         "game_uuid": game_uuid,
         "player_uuid": player_uuid
     }
+    if protocol and protocol != "full":
+        connection_object["protocol"] = protocol
 
     if save_connection_object(connection_object):
         return response_payload(200, {"message": "Connected"})
@@ -145,18 +76,19 @@ def register_game_watcher(game_uuid, player_uuid, connection_id):
 
 def register_public_games_watcher(connection_id):
     connection_object = {
-        "connection_id": connection_id
+        "connection_id": connection_id,
+        "game_uuid": PUBLIC_GAMES_WATCHERS
     }
 
     if save_connection_object(connection_object):
         return response_payload(200, {"message": "Connected"})
 
 
-def register_watcher(game_uuid, player_uuid, connection_id):
+def register_watcher(game_uuid, player_uuid, connection_id, protocol=None):
     if not game_uuid and not player_uuid:
         payload = register_public_games_watcher(connection_id)
     else:
-        payload = register_game_watcher(game_uuid, player_uuid, connection_id)
+        payload = register_game_watcher(game_uuid, player_uuid, connection_id, protocol)
 
     if payload:
         return payload
@@ -170,8 +102,9 @@ def lambda_handler(event, context):
 
         game_uuid = event.get("headers", {}).get("game_uuid") if "game_uuid" not in body else body["game_uuid"]
         player_uuid = event.get("headers", {}).get("player_uuid") if "player_uuid" not in body else body["player_uuid"]
+        protocol = event.get("headers", {}).get("protocol") if "protocol" not in body else body["protocol"]
 
-        payload = register_watcher(game_uuid, player_uuid, connection_id)
+        payload = register_watcher(game_uuid, player_uuid, connection_id, protocol)
 
         if payload:
             return payload
@@ -1,147 +1,193 @@
 import os
-import uuid
 import boto3
-from boto3.dynamodb.conditions import Key, Attr
-from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.config import Config
+from botocore.exceptions import ClientError, EndpointConnectionError
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import time
 import json
 import decimal
 import logging
+from blef_core import storage
+from blef_core.serialization import DecimalEncoder, response_payload, internal_error_payload, parse_event
+from blef_core.rules import get_player_by_nickname
+from blef_core.censoring import censor_game, get_decision_request
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
 sqs_client = boto3.client("sqs")
 AIAGENT_QUEUE_NAME = os.environ.get("aiagent_queue_name")
+# Most messages SendMessageBatch takes in one call
+SQS_BATCH_SIZE = 10
 
 watch_game_websocket_api_id = os.environ.get("watch_game_websocket_api_id")
 watch_game_websocket_api_stage = os.environ.get("watch_game_websocket_api_stage")
 
-endpoint_url = f"{boto3.client('apigatewayv2').get_api(ApiId=watch_game_websocket_api_id).get('ApiEndpoint')}/{watch_game_websocket_api_stage}".replace("wss://", "https://")
-apigateway = boto3.client('apigatewaymanagementapi', endpoint_url=endpoint_url)
+# Watchers are posted to concurrently, each post bounded by its own timeout and not retried
+FANOUT_MAX_WORKERS = int(os.environ.get("fanout_max_workers", "32"))
+POST_TIMEOUT = float(os.environ.get("post_timeout", "3"))
+
+fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS)
+
+store = storage.get_game_store()
+# Stream records name the table they come from - round log entries come from the store's rounds table
+ROUNDS_TABLE_NAME = store.rounds_table.name
 
 dynamodb = boto3.resource('dynamodb')
-games_table = dynamodb.Table("games")
 websocket_table = dynamodb.Table("watch_game_websocket_manager")
 
-deserializer = boto3.dynamodb.types.TypeDeserializer()
+# Connections registered with this protocol get a snapshot of the game first and only changes after that
+DELTA_PROTOCOL = "delta"
+
+# Partition of the game_uuid index under which watch-game-connect registers public games watchers
+PUBLIC_GAMES_WATCHERS = "public_games"
+
+deserializer = TypeDeserializer()
+
+# AWS resources which take an API call to set up are resolved on first use
+# and kept for the lifetime of the container, until a failure calls for a refresh
+resources = {}
+resources_lock = threading.Lock()
+
+
+def get_resource(name, resolve):
+    if name not in resources:
+        with resources_lock:
+            if name not in resources:
+                resources[name] = resolve()
+    return resources[name]
+
+
+def refresh_resource(name):
+    with resources_lock:
+        resources.pop(name, None)
+
+
+def create_apigateway_client():
+    api = boto3.client('apigatewayv2').get_api(ApiId=watch_game_websocket_api_id)
+    endpoint_url = f"{api.get('ApiEndpoint')}/{watch_game_websocket_api_stage}".replace("wss://", "https://")
+    return boto3.client('apigatewaymanagementapi', endpoint_url=endpoint_url, config=Config(
+        connect_timeout=POST_TIMEOUT,
+        read_timeout=POST_TIMEOUT,
+        retries={"max_attempts": 1},
+        max_pool_connections=FANOUT_MAX_WORKERS
+    ))
+
+
+def get_apigateway():
+    return get_resource("apigateway", create_apigateway_client)
 
 
 def get_aiagent_queue_url():
     """
-    Returns the URL of an existing Amazon SQS queue.
+    Returns the URL of an existing Amazon SQS queue, or None if it cannot be looked up.
     """
     try:
-        return sqs_client.get_queue_url(QueueName=AIAGENT_QUEUE_NAME)['QueueUrl']
+        return get_resource("aiagent_queue_url", lambda: sqs_client.get_queue_url(QueueName=AIAGENT_QUEUE_NAME)['QueueUrl'])
     except ClientError:
         return
 
 
-def send_queue_message(game):
+def get_queue_message(game):
     """
-    Sends a message to the AI agent queue.
+        The AI agent queue message for a game: a decision request. Messages are grouped by game, so that a
+        game's turns are played in order, and deduplicated by turn, so that a redelivered
+        stream record does not make the AI agent move twice.
     """
-    try:
-        logger.info('## QUEUE URL')
-        logger.info(get_aiagent_queue_url())
-        logger.info('## GAME')
-        logger.info(game)
-        logger.info('## GAME UUID')
-        logger.info(game["game_uuid"])
-        sqs_client.send_message(QueueUrl=get_aiagent_queue_url(),
-                                MessageBody=json.dumps(game, cls=DecimalEncoder),
-                                MessageGroupId=game["game_uuid"])
-    except ClientError:
-        return
-
-
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, decimal.Decimal):
-            if obj.as_tuple().exponent == 0:
-                return int(obj)
-            return float(obj)
-        return super(DecimalEncoder, self).default(obj)
-
-
-def response_payload(status_code, body):
     return {
-            'statusCode': status_code,
-            'body': json.dumps(body, cls=DecimalEncoder),
-            'headers': {
-                'Access-Control-Allow-Headers':'Content-Type,X-Amz-Date,Authorization,X-Api-Key,x-api-key,X-Amz-Security-Token',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'OPTIONS,POST,GET',
-                'Access-Control-Allow-Credentials': True,
-                'Content-Type': 'application/json'
-            },
-        }
+        # Agents only get to see what their player would - separators without spaces keep the body small
+        "MessageBody": json.dumps(get_decision_request(game), separators=(",", ":")),
+        "MessageGroupId": game["game_uuid"],
+        "MessageDeduplicationId": f"{game['game_uuid']}_{int(game['round_number'])}_{len(game['history'])}"
+    }
 
 
-def error_payload(status_code, body):
-    return response_payload(status_code, {"error": body})
+def send_queue_message(message):
+    """
+    Sends a message to the AI agent queue.
+    """
+    for attempt in range(2):
+        queue_url = get_aiagent_queue_url()
+        if queue_url is None:
+            return False
+        try:
+            sqs_client.send_message(QueueUrl=queue_url, **message)
+            return True
+        except ClientError:
+            # The queue may have been recreated under a new URL - look it up again once
+            refresh_resource("aiagent_queue_url")
+    return False
 
 
-def internal_error_payload(err, message=None):
-    body = "Internal Lambda function error: {}".format(err)
-    if message:
-        body = "{}\n{}".format(body, message)
-    return error_payload(500, body)
+def send_queue_message_batch(messages):
+    """ Sends up to SQS_BATCH_SIZE messages in one call, returns the messages which failed """
+    entries = [dict(message, Id=str(i)) for i, message in enumerate(messages)]
+    for attempt in range(2):
+        queue_url = get_aiagent_queue_url()
+        if queue_url is None:
+            return messages
+        try:
+            response = sqs_client.send_message_batch(QueueUrl=queue_url, Entries=entries)
+            return [messages[int(failure["Id"])] for failure in response.get("Failed", [])]
+        except ClientError:
+            refresh_resource("aiagent_queue_url")
+    return messages
 
 
-def request_error_payload(request, message=None):
-    body = "Bad request payload: '{}'".format(request)
-    if message:
-        body = "{}\n{}".format(body, message)
-    return error_payload(400, body)
+def send_queue_messages(games):
+    """
+    Sends the AI agent turns of several games to the queue, in batches - messages the
+    batch failed to send are retried one by one. Returns how many messages were sent.
+    """
+    messages = [get_queue_message(game) for game in games]
+    if messages and get_aiagent_queue_url() is None:
+        # Without a queue the turns cannot be sent - say so, and still update the watchers and prune connections
+        logger.warning(f'AI agent queue {AIAGENT_QUEUE_NAME} not found - skipping {len(messages)} AI agent turns')
+        return 0
+    logger.info(f'## QUEUEING {len(messages)} AI AGENT TURNS')
+    failed = []
+    for start in range(0, len(messages), SQS_BATCH_SIZE):
+        failed += send_queue_message_batch(messages[start:start + SQS_BATCH_SIZE])
+    unsent = [message for message in failed if not send_queue_message(message)]
+    for message in unsent:
+        logger.warning(f'Queueing the AI agent turn of game {message["MessageGroupId"]} failed')
+    return len(messages) - len(unsent)
+
+
+def query_connections(game_uuid):
+    """
+        All connections registered under a partition of the game_uuid index, page by page. The index
+        has to project player_uuid, protocol and synced - without them every watcher gets full updates
+    """
+    query = {
+        "KeyConditionExpression": Key('game_uuid').eq(game_uuid),
+        "IndexName": "game_uuid-index"
+    }
+    while True:
+        response = websocket_table.query(**query)
+        yield from response.get("Items", [])
+        if "LastEvaluatedKey" not in response:
+            return
+        query["ExclusiveStartKey"] = response["LastEvaluatedKey"]
 
 
-def parameter_error_payload(param_key, param_value, message=None):
-    body = "Bad input value in '{}': {}".format(param_key, param_value)
-    if message:
-        body = "{}\n{}".format(body, message)
-    return error_payload(400, body)
+def get_watched_game_uuid(game):
+    """ The UUID watchers subscribed to - round snapshots are stored as "<game_uuid>_<round>" """
+    game_uuid = game["game_uuid"]
+    if isinstance(game_uuid, dict):
+        game_uuid = game_uuid.get("S")
+    return game_uuid.split("_")[0]
 
 
-def is_valid_uuid(value):
-    try:
-        uuid.UUID(str(value))
-        return True
-    except ValueError:
-        return False
-
-
-def parse_event(event):
-    # Basic input validation
-    if not isinstance(event, dict):
-        if isinstance(event, str):
-            return json.loads(event)
-        return False
-
-    # Handle both direct triggers and API Gateway
-    body = event.get("body", event)
-    if isinstance(body, str):
-        try:
-            body = json.loads(body)
-        except ValueError:
-            return None
-    path_params = event.get("pathParameters", {})
-    query_params = event.get("queryStringParameters", {})
-    body.update(path_params)
-    body.update(query_params)
-    return body
+def is_round_snapshot(game):
+    return get_watched_game_uuid(game) != game["game_uuid"]
 
 
 def find_connected_players(game):
-    game_uuid = game["game_uuid"]
-    if isinstance(game_uuid, dict):
-        game_uuid = game_uuid.get("S")
-    watched_game_uuid = game_uuid.split("_")[0]
-    response = websocket_table.query(
-        KeyConditionExpression=Key('game_uuid').eq(watched_game_uuid),
-        IndexName="game_uuid-index"
-    )
-    return [(connection["connection_id"], connection["player_uuid"]) for connection in response.get("Items", [])]
+    return list(query_connections(get_watched_game_uuid(game)))
 
 
 def save_connection_object(obj):
@@ -162,56 +208,6 @@ def get_connection_id(event, context, body):
     raise ValueError("Request context is invalid!")
 
 
-def get_player_by_nickname(players, nickname):
-    filtered_players = [p for p in players if p["nickname"] == nickname]
-    if filtered_players and filtered_players[0]:
-        return filtered_players[0]
-
-
-def get_nickname_by_uuid(players, player_uuid):
-    filtered_players = [p for p in players if p["uuid"] == player_uuid]
-    if filtered_players:
-        return filtered_players[0]["nickname"]
-
-
-def is_active_player(players, nickname):
-    player = get_player_by_nickname(players, nickname)
-    if player:
-        return player["n_cards"] != 0
-    return False
-
-
-def get_revealed_hands(game, current_round, current_status, player_authenticated, player_nickname):
-    revealed_hands = []
-    if game["round_number"] < current_round or current_status == "Finished":
-        revealed_hands = [hand for hand in game["hands"] if is_active_player(game["players"], hand["nickname"])]
-    elif player_authenticated and game["round_number"] == current_round:
-        revealed_hands = [hand for hand in game["hands"] if is_active_player(game["players"], hand["nickname"]) and hand["nickname"] == player_nickname]
-    return revealed_hands
-
-
-def censor_game(game, current_round, player_authenticated, player_nickname):
-    revealed_hands = get_revealed_hands(game, current_round, game["status"], player_authenticated, player_nickname)
-
-    private_players = []
-    for player in game["players"]:
-        private_players.append({key: player[key] for key in player if key != "uuid"})
-
-    return {
-        "admin_nickname": game["admin_nickname"],
-        "public": game["public"],
-        "room": game["room"],
-        "status": game["status"],
-        "round_number": game["round_number"],
-        "max_cards": game["max_cards"],
-        "players": private_players,
-        "hands": revealed_hands,
-        "cp_nickname": game["cp_nickname"],
-        "history": game["history"],
-        "last_modified": game["last_modified"]
-    }
-
-
 def get_public_game_info(game):
     public_game_info = {
         "game_uuid": game["game_uuid"],
@@ -229,48 +225,243 @@ def can_get_public_info(game, game_old):
 
 
 def find_connected_public_games_watchers():
-    response = websocket_table.scan(
-        FilterExpression=Attr('game_uuid').not_exists()
-    )
-    return [(connection["connection_id"]) for connection in response.get("Items")]
+    return [connection["connection_id"] for connection in query_connections(PUBLIC_GAMES_WATCHERS)]
+
+
+def encode_message(payload):
+    return bytes(json.dumps(response_payload(200, payload), cls=DecimalEncoder), encoding="utf-8")
+
+
+def encode_delta_message(message):
+    """ Delta protocol messages are sent as they are, without the HTTP-style envelope """
+    return bytes(json.dumps(message, cls=DecimalEncoder), encoding="utf-8")
+
+
+def get_changes(old_view, new_view):
+    """
+        What changed between two views of a game: the fields which differ and, as long
+        as the history only grew, just the entries appended to it
+    """
+    changes = {key: value for key, value in new_view.items() if key != "history" and old_view.get(key) != value}
+    old_history = old_view.get("history", [])
+    if new_view["history"][:len(old_history)] == old_history:
+        return {"changes": changes, "new_history": new_view["history"][len(old_history):]}
+    changes["history"] = new_view["history"]
+    return {"changes": changes, "new_history": []}
+
+
+def set_synced(connection_id, synced):
+    """ Remember whether a delta connection holds a snapshot to apply changes to """
+    try:
+        websocket_table.update_item(
+            Key={"connection_id": connection_id},
+            UpdateExpression="SET synced = :synced",
+            ConditionExpression="attribute_exists(connection_id)",
+            ExpressionAttributeValues={":synced": synced}
+        )
+    except ClientError as err:
+        # The client disconnected in the meantime
+        if err.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+
+def set_synced_connections(updates):
+    """
+        Run set_synced for each (connection_id, synced) pair concurrently, like the posts
+        before them - a failed write is logged and never stops the others or the handler
+    """
+    futures = [(connection_id, fanout_executor.submit(set_synced, connection_id, synced))
+               for connection_id, synced in updates]
+    for connection_id, future in futures:
+        error = future.exception()
+        if error:
+            logger.warning(f"Marking connection {connection_id} synced failed: {error}")
 
 
-def post_to_connection(payload, connection_id):
+def post_to_connection(data, connection_id):
     logger.info('## POSTING TO CONNECTION')
     logger.info(connection_id)
-    response = apigateway.post_to_connection(
-        Data=bytes(json.dumps(response_payload(200, payload), cls=DecimalEncoder), encoding="utf-8"),
-        ConnectionId=connection_id
-    )
+    try:
+        get_apigateway().post_to_connection(Data=data, ConnectionId=connection_id)
+    except EndpointConnectionError:
+        # The websocket API endpoint moved - resolve it again and retry once
+        refresh_resource("apigateway")
+        get_apigateway().post_to_connection(Data=data, ConnectionId=connection_id)
     return True
 
 
+def post_to_connections(posts):
+    """
+        Post each (connection_id, encoded message) pair concurrently. Returns a list of
+        (connection_id, error) pairs, error being None for delivered posts - a failed
+        post never stops delivery to the other connections.
+    """
+    futures = [(connection_id, fanout_executor.submit(post_to_connection, data, connection_id))
+               for connection_id, data in posts]
+    results = [(connection_id, future.exception()) for connection_id, future in futures]
+    for connection_id, error in results:
+        if error:
+            logger.warning(f"Posting to connection {connection_id} failed: {error}")
+    return results
+
+
+def is_gone(error):
+    """ Whether a failed post means the client is gone without having sent $disconnect """
+    return isinstance(error, ClientError) and error.response["Error"]["Code"] == "GoneException"
+
+
+def prune_connections(connection_ids):
+    """ Batch-delete stale connections from the websocket table, returns how many were deleted """
+    # batch_writer sends BatchWriteItem requests of up to 25 deletes and resends unprocessed ones
+    with websocket_table.batch_writer(overwrite_by_pkeys=["connection_id"]) as batch:
+        for connection_id in connection_ids:
+            batch.delete_item(Key={"connection_id": connection_id})
+    return len(connection_ids)
+
+
 def deserialise_dynamodb_stream_event(obj):
     return {k: deserializer.deserialize(v) for k,v in obj.items()}
 
 
-def update_game_watchers(game):
-    connected_players = find_connected_players(game)
-    for connection_id, player_uuid in connected_players:
-        player_nickname = get_nickname_by_uuid(game["players"], player_uuid)
-        player_authenticated = bool(player_nickname)
-        current_round = game["round_number"] + 1 if any(str(val["action_id"])=="89" for val in game.get("history")) else game["round_number"]
-        visible_game = censor_game(game, current_round, player_authenticated, player_nickname)
-        post_to_connection(visible_game, connection_id)
+def is_round_log_record(record):
+    return f":table/{ROUNDS_TABLE_NAME}/" in record.get("eventSourceARN", "")
 
 
-def update_public_games_watchers(game, game_old):
-    if not can_get_public_info(game, game_old):
+def deserialise_stream_record(record, live_games):
+    """ The new and old images of a record, with round log entries rebuilt into round snapshots """
+    game = {
+        "new": deserialise_dynamodb_stream_event(record["dynamodb"].get("NewImage", {})),
+        "old": deserialise_dynamodb_stream_event(record["dynamodb"].get("OldImage", {}))
+    }
+    if not is_round_log_record(record):
+        return game
+    # Watchers get the full end-of-round view of round log entries
+    if not game["new"]:
         return
-    connected_watchers = find_connected_public_games_watchers()
-    for connection_id in connected_watchers:
-        public_game_info = get_public_game_info(game)
-        post_to_connection(public_game_info, connection_id)
-
-
-def update_watchers(game):
-    update_game_watchers(game["new"])
-    update_public_games_watchers(game["new"], game["old"])
+    if storage.is_self_contained(game["new"]):
+        return {"new": storage.rebuild_round_snapshot(None, game["new"]), "old": {}}
+    # Older entries only hold hands and history, and several rounds of a game
+    # can end in the same batch - read the live game once
+    game_uuid = game["new"]["game_uuid"]
+    if game_uuid not in live_games:
+        live_games[game_uuid] = store.get_game(game_uuid)
+    live_game = live_games[game_uuid]
+    if live_game:
+        return {"new": storage.rebuild_round_snapshot(live_game, game["new"]), "old": {}}
+
+
+def coalesce_games(games):
+    """
+        Group the changes of a batch by watched game, in order of first appearance.
+        Every round snapshot is kept, but of the live game only its newest state is,
+        as its history already holds the moves of the states before it. Returns
+        {game_uuid: {"updates": [...], "public": bool, "base": {...}}}, "public" telling
+        whether any of the changes concerned public games watchers and "base" being the
+        live game as it was before the batch, which delta updates are computed against.
+    """
+    coalesced = {}
+    for game in games:
+        if not game["new"]:
+            continue
+        group = coalesced.setdefault(get_watched_game_uuid(game["new"]), {"updates": [], "public": False, "base": None})
+        group["public"] = group["public"] or can_get_public_info(game["new"], game["old"])
+        if not is_round_snapshot(game["new"]):
+            group["updates"] = [update for update in group["updates"] if is_round_snapshot(update)]
+            if group["base"] is None:
+                group["base"] = game["old"]
+        group["updates"].append(game["new"])
+    return coalesced
+
+
+def get_live_game(group):
+    """ The newest live game state of a coalesced group, or None if the batch only logged rounds """
+    return next((game for game in reversed(group["updates"]) if not is_round_snapshot(game)), None)
+
+
+def get_visible_game(game, player_nickname):
+    current_round = game["round_number"] + 1 if any(str(val["action_id"])=="89" for val in game.get("history")) else game["round_number"]
+    return censor_game(game, current_round, bool(player_nickname), player_nickname)
+
+
+def get_message_type(game, connection, base):
+    if connection.get("protocol") != DELTA_PROTOCOL:
+        return "full"
+    if is_round_snapshot(game):
+        return "round"
+    if not base or not connection.get("synced"):
+        return "snapshot"
+    return "delta"
+
+
+def get_message(message_type, game, base, player_nickname):
+    visible_game = get_visible_game(game, player_nickname)
+    if message_type == "full":
+        return encode_message(visible_game)
+    if message_type == "round":
+        return encode_delta_message({"type": "round", "game": visible_game})
+    if message_type == "snapshot":
+        return encode_delta_message({"type": "snapshot", "seq": storage.game_version(game), "game": visible_game})
+    return encode_delta_message({
+        "type": "delta",
+        "base": storage.game_version(base),
+        "seq": storage.game_version(game),
+        **get_changes(get_visible_game(base, player_nickname), visible_game)
+    })
+
+
+def update_game_watchers(game, connections=None, base=None):
+    """
+        Post a game's new state to its watchers. Connections on the delta protocol get a
+        snapshot first and after that only what changed since `base`, the game as their
+        previous update left it, numbered with the game's versions so that clients can
+        detect gaps. Round snapshots are sent in full to everybody.
+    """
+    if connections is None:
+        connections = find_connected_players(game)
+    # Spectators all get the same view and each player gets their own -
+    # every distinct message is censored and encoded once, then shared by its connections
+    nicknames = {player["uuid"]: player["nickname"] for player in game["players"]}
+    messages = {}
+    posts = []
+    message_types = {}
+    for connection in connections:
+        player_nickname = nicknames.get(connection.get("player_uuid"))
+        message_type = get_message_type(game, connection, base)
+        if (message_type, player_nickname) not in messages:
+            messages[message_type, player_nickname] = get_message(message_type, game, base, player_nickname)
+        posts.append((connection["connection_id"], messages[message_type, player_nickname]))
+        message_types[connection["connection_id"]] = message_type
+    results = post_to_connections(posts)
+    # Delta connections which got a snapshot can take changes from now on, and those which
+    # missed a delta need a new snapshot - gone connections are pruned instead
+    synced_updates = []
+    for connection_id, error in results:
+        if message_types[connection_id] == "snapshot" and not error:
+            synced_updates.append((connection_id, True))
+        elif message_types[connection_id] == "delta" and error and not is_gone(error):
+            synced_updates.append((connection_id, False))
+    set_synced_connections(synced_updates)
+    return results
+
+
+def update_public_games_watchers(games, connected_watchers):
+    posts = [(connection_id, encode_message(get_public_game_info(game))) for game in games for connection_id in connected_watchers]
+    return post_to_connections(posts)
+
+
+def update_watchers(coalesced):
+    """ Post the coalesced updates of every game to its watchers, looking up each game's connections once """
+    results = []
+    for group in coalesced.values():
+        connections = find_connected_players(group["updates"][0])
+        for game in group["updates"]:
+            results += update_game_watchers(game, connections, group["base"])
+    # Public games watchers see the live game only, once per game
+    public_games = [get_live_game(group) for group in coalesced.values() if group["public"]]
+    public_games = [game for game in public_games if game]
+    if public_games:
+        results += update_public_games_watchers(public_games, find_connected_public_games_watchers())
+    return results
 
 
 def get_aiagent_player_uuid(game):
@@ -283,30 +474,28 @@ def get_aiagent_player_uuid(game):
     return player_obj.get("uuid")
 
 
-def queue_aiagent(game):
-    if get_aiagent_player_uuid(game["new"]):
-        send_queue_message(game["new"])
+def is_aiagent_turn(game):
+    return not is_round_snapshot(game) and bool(get_aiagent_player_uuid(game))
 
 
 def lambda_handler(event, context):
     try:
         logger.info('## EVENT')
         logger.info(event)
-        games_objects = [obj["dynamodb"] for obj in parse_event(event).get("Records") if "dynamodb" in obj]
-        games = [
-            {
-                "new": deserialise_dynamodb_stream_event(obj.get("NewImage", {})),
-                "old": deserialise_dynamodb_stream_event(obj.get("OldImage", {}))
-            }
-            for obj in games_objects
-        ]
-        for game in games:
-            logger.info('## GAME')
-            logger.info(game)
-            update_watchers(game)
-            queue_aiagent(game)
-
-        return response_payload(200, {"message": "All watchers updated"})
+        records = [record for record in parse_event(event).get("Records") if "dynamodb" in record]
+        live_games = {}
+        games = [game for game in (deserialise_stream_record(record, live_games) for record in records) if game]
+        coalesced = coalesce_games(games)
+        logger.info(f'## {len(games)} CHANGES OF {len(coalesced)} GAMES')
+        results = update_watchers(coalesced)
+        gone_connections = {connection_id for connection_id, error in results if is_gone(error)}
+        aiagent_turns = [game for game in map(get_live_game, coalesced.values()) if game and is_aiagent_turn(game)]
+        if aiagent_turns:
+            send_queue_messages(aiagent_turns)
+
+        pruned_connections = prune_connections(gone_connections)
+        logger.info(f'## PRUNED CONNECTIONS: {pruned_connections}')
+        return response_payload(200, {"message": "All watchers updated", "pruned_connections": pruned_connections})
 
     except Exception as err:
         return internal_error_payload(err)
@@ -0,0 +1,14 @@
+#!/bin/sh
+# Package api/blef_core as a Lambda layer: deployment/build/blef_core_layer.zip
+# Lambda puts the layer's python/ directory on sys.path, so handlers import blef_core as usual.
+set -e
+
+DEPLOYMENT_DIR=$(cd "$(dirname "$0")" && pwd)
+BUILD_DIR="$DEPLOYMENT_DIR/build"
+
+rm -rf "$BUILD_DIR/python" "$BUILD_DIR/blef_core_layer.zip"
+mkdir -p "$BUILD_DIR/python"
+cp -r "$DEPLOYMENT_DIR/../api/blef_core" "$BUILD_DIR/python/"
+find "$BUILD_DIR/python" -name "__pycache__" -prune -exec rm -rf {} \;
+(cd "$BUILD_DIR" && zip -qr blef_core_layer.zip python)
+echo "Built $BUILD_DIR/blef_core_layer.zip"